@@ -0,0 +1,347 @@
+"""
+Load test and benchmark of every api endpoint.
+
+Seeds a reproducible data set, then drives every endpoint with concurrent clients and reports
+requests/sec, latency percentiles and SQL queries per request. By default everything runs in-process
+against a local SQLite file (no server, no network); with --url requests go to a running server instead.
+
+examples:
+    python -m benchmarks --users 1000 --posts 10000 --likes 50000 --activities 100000 --output bench.json
+    python -m benchmarks --compare bench.json --output bench_new.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import event
+
+from src.pagination import encode_cursor
+
+
+Scenario = namedtuple("Scenario", ["name", "call", "expected"])
+
+Credentials = namedtuple("Credentials", ["username", "password", "token"])
+
+
+class InProcessClient:
+    """
+    Sends requests straight to the wsgi app through flask test client
+    """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"X-Api-Key": token} if token else {}
+        data = json.dumps(body) if body is not None else None
+
+        response = self.client.open(path, method=method, data=data, content_type="application/json", headers=headers)
+        response.close()
+
+        return response.status_code, response
+
+
+class HttpClient:
+    """
+    Sends requests to a running server
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def request(self, method, path, body=None, token=None):
+        headers = {"Content-Type": "application/json"}
+
+        if token:
+            headers["X-Api-Key"] = token
+
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers=headers)
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+def scenarios(data):
+    """
+    :param data: dict with users count and post uuids of the seeded data set
+    :return: list of scenarios, one or more for every resource. A scenario is called with a client,
+    Credentials of the user the client acts as and a random generator
+    """
+
+    created = itertools.count()
+    run = int(time.time())
+
+    def user(rng):
+        return rng.randint(1, data["users"])
+
+    def post(rng):
+        return rng.choice(data["post_uuids"])
+
+    def deep_page(rng):
+        return encode_cursor(rng.randint(0, len(data["post_uuids"])))
+
+    return [
+        Scenario("users_list", lambda c, t, rng: c.request("GET", "/api/users?limit=100"), {200}),
+        Scenario("users_create", lambda c, t, rng: c.request("POST", "/api/users", {
+            "name": "bench", "surname": "bench", "password": "bench", "username": f"bench_{run}_{next(created)}"
+        }), {200}),
+        Scenario("login", lambda c, t, rng: c.request("GET", "/api/login", {
+            "username": t.username, "password": t.password
+        }), {200}),
+        Scenario("posts_list", lambda c, t, rng: c.request("GET", "/api/posts?limit=100"), {200}),
+        Scenario("posts_list_deep", lambda c, t, rng: c.request("GET", f"/api/posts?limit=100&cursor={deep_page(rng)}"),
+                 {200}),
+        Scenario("posts_create", lambda c, t, rng: c.request("POST", "/api/posts", {"text": "benchmark post"}, t.token),
+                 {201}),
+        Scenario("posts_batch", lambda c, t, rng: c.request(
+            "POST", "/api/posts/batch", [{"text": f"benchmark post {i}"} for i in range(10)], t.token
+        ), {201}),
+        Scenario("like_toggle", lambda c, t, rng: c.request("POST", "/api/like", {"uuid": post(rng)}, t.token), {201}),
+        Scenario("like_batch", lambda c, t, rng: c.request(
+            "POST", "/api/like/batch", [{"uuid": post(rng)} for _ in range(10)], t.token
+        ), {200, 409}),
+        Scenario("user_statistics", lambda c, t, rng: c.request(
+            "GET", "/api/analytics/user?limit=100", {"username": f"user{user(rng)}"}
+        ), {200}),
+        Scenario("like_statistics", lambda c, t, rng: c.request("GET", "/api/analytics/likes", {
+            "uuid": post(rng),
+            "start_date": str(datetime.date.today() - datetime.timedelta(days=30)),
+            "end_date": str(datetime.date.today())
+        }), {200}),
+    ]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+
+    values = sorted(values)
+
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def run_scenario(scenario, make_client, users, clients, requests, warmup, query_counter, random_seed):
+    """
+    Runs one scenario with `clients` concurrent clients, each sending `warmup` + `requests` requests
+
+    :return: dict of statistics
+    """
+
+    latencies, queries, errors = [], [], []
+    lock = threading.Lock()
+
+    def client_loop(index):
+        client = make_client()
+        credentials = users[index % len(users)]
+        rng = random.Random(random_seed + index)
+
+        for i in range(warmup + requests):
+            query_counter.reset()
+
+            start = time.perf_counter()
+            status, _ = scenario.call(client, credentials, rng)
+            elapsed = time.perf_counter() - start
+
+            if i < warmup:
+                continue
+
+            with lock:
+                latencies.append(elapsed)
+
+                if query_counter.enabled:
+                    queries.append(query_counter.value)
+
+                if status not in scenario.expected:
+                    errors.append(status)
+
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(client_loop, range(clients)))
+
+    wall = time.perf_counter() - start
+    measured = wall * requests / (warmup + requests)
+
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "requests_per_second": round(len(latencies) / measured, 2) if measured else None,
+        "latency_ms": {
+            "mean": round(1000 * sum(latencies) / len(latencies), 3) if latencies else None,
+            "p50": round(1000 * percentile(latencies, 0.50), 3) if latencies else None,
+            "p95": round(1000 * percentile(latencies, 0.95), 3) if latencies else None,
+            "p99": round(1000 * percentile(latencies, 0.99), 3) if latencies else None
+        },
+        "queries_per_request": round(sum(queries) / len(queries), 2) if queries else None
+    }
+
+
+class QueryCounter:
+    """
+    Counts SQL statements executed by the current thread, so queries of one in-process request can be counted
+    """
+
+    def __init__(self, engine=None):
+        self._local = threading.local()
+        self.enabled = engine is not None
+
+        if engine is not None:
+            event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self._local.value = self.value + 1
+
+    @property
+    def value(self):
+        return getattr(self._local, "value", 0)
+
+    def reset(self):
+        self._local.value = 0
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    header = f"{'scenario':<18}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'errors':>8}"
+
+    if baseline:
+        header += f"{'req/s diff':>12}{'p95 diff':>10}"
+
+    print(header)
+
+    for name, stats in results.items():
+        latency = stats["latency_ms"]
+        line = (f"{name:<18}{stats['requests_per_second']:>10}{latency['p50']:>10}{latency['p95']:>10}"
+                f"{latency['p99']:>10}{str(stats['queries_per_request']):>9}{stats['errors']:>8}")
+
+        old = (baseline or {}).get(name)
+
+        if old:
+            line += f"{change(old['requests_per_second'], stats['requests_per_second']):>12}"
+            line += f"{change(old['latency_ms']['p95'], latency['p95']):>10}"
+
+        print(line)
+
+
+def change(old, new):
+    if not old or new is None:
+        return "-"
+
+    return f"{100 * (new - old) / old:+.1f}%"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200, help="number of seeded users")
+    parser.add_argument("--posts", type=int, default=2000, help="number of seeded posts")
+    parser.add_argument("--likes", type=int, default=10000, help="number of seeded likes")
+    parser.add_argument("--activities", type=int, default=20000, help="number of seeded activity log records")
+    parser.add_argument("--clients", type=int, default=8, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=50, help="measured requests per client and scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="not measured requests per client and scenario")
+    parser.add_argument("--only", nargs="*", help="names of scenarios to run")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of data set and requests")
+    parser.add_argument("--database", help="database uri (default: SQLite file in temp directory), "
+                                           "ALL ITS TABLES ARE DROPPED")
+    parser.add_argument("--url", help="url of a running server to benchmark instead of the in-process app, "
+                                      "it must use the same database")
+    parser.add_argument("--no-cache", action="store_true", help="disable response cache")
+    parser.add_argument("--output", help="file to write results json to")
+    parser.add_argument("--compare", help="results json of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    if args.database:
+        os.environ["BENCHMARK_DATABASE_URI"] = args.database
+
+    os.environ.setdefault("APP_CONFIG", "benchmarks.config.BenchmarkConfig")
+
+    from src.app import app, db
+    from src.cache import response_cache
+    from src.models import activity_writer
+    import src.api  # noqa: F401 - registers the api resources on the app
+
+    from benchmarks.seed import seed
+
+    if args.no_cache:
+        app.config["RESPONSE_CACHE"] = None
+        response_cache.reset()
+
+    with app.app_context():
+        started = time.perf_counter()
+        post_uuids = seed(args.users, args.posts, args.likes, args.activities, random_seed=args.seed)
+        print(f"seeded in {time.perf_counter() - started:.1f}s: {args.users} users, {args.posts} posts, "
+              f"{args.likes} likes, {args.activities} activities", file=sys.stderr)
+
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+        query_counter = QueryCounter()
+    else:
+        make_client = lambda: InProcessClient(app)
+        query_counter = QueryCounter(db.engine)
+
+    client = make_client()
+    users = []
+
+    for index in range(1, min(args.clients, args.users) + 1):
+        username, password = f"user{index}", f"password{index}"
+
+        status, response = client.request("GET", "/api/login", {"username": username, "password": password})
+        body = response.get_json() if hasattr(response, "get_json") else json.loads(response)
+
+        users.append(Credentials(username, password, body["token"]))
+
+    data = {"users": args.users, "post_uuids": post_uuids}
+    results = {}
+
+    for scenario in scenarios(data):
+        if args.only and scenario.name not in args.only:
+            continue
+
+        results[scenario.name] = run_scenario(scenario, make_client, users, args.clients, args.requests,
+                                              args.warmup, query_counter, args.seed)
+
+    activity_writer.stop()
+
+    baseline = None
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({
+                "commit": git_commit(),
+                "created": datetime.datetime.now().isoformat(),
+                "database": app.config["SQLALCHEMY_DATABASE_URI"].split("@")[-1],
+                "parameters": {name: value for name, value in vars(args).items() if name not in ("output", "compare")},
+                "results": results
+            }, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
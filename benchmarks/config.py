@@ -0,0 +1,21 @@
+import os
+import tempfile
+
+from src.config import DevConfig
+
+
+class BenchmarkConfig(DevConfig):
+    """
+    Configuration the benchmark runs the app with: a local SQLite file by default,
+    or any database from BENCHMARK_DATABASE_URI. The database is recreated by every run
+    """
+
+    DEBUG = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        "BENCHMARK_DATABASE_URI",
+        "sqlite:///" + os.path.join(tempfile.gettempdir(), "test_task_benchmark.db")
+    )
+
+    if SQLALCHEMY_DATABASE_URI.startswith("sqlite"):
+        # concurrent clients wait for SQLite write lock instead of failing
+        SQLALCHEMY_ENGINE_OPTIONS = {"connect_args": {"timeout": 30}}
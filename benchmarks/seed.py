@@ -0,0 +1,87 @@
+import datetime
+import random
+import uuid
+
+from src.app import db
+from src.models import User, Post, Like, ActivityLog
+from src.likes import rebuild_like_rollup
+
+
+ACTIONS = ["users list requested", "posts requested", "new post added", "liked post", "unliked post",
+           "user logined successfully"]
+
+
+def insert_chunked(table, rows, chunk_size):
+    """
+    Inserts rows, produced by a generator, with one multi-row insert per chunk
+    """
+
+    chunk = []
+
+    for row in rows:
+        chunk.append(row)
+
+        if len(chunk) == chunk_size:
+            db.session.execute(table.insert(), chunk)
+            db.session.commit()
+            chunk = []
+
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+
+
+def seed(users, posts, likes, activities, days=30, random_seed=0, chunk_size=5000):
+    """
+    Recreates all tables and fills them with a reproducible data set: user i has username "user{i}"
+    and password "password{i}", posts, likes and activities are spread over the last `days` days
+
+    :param users: number of users
+    :param posts: number of posts, authors are chosen randomly
+    :param likes: number of likes, (user, post) pairs are unique
+    :param activities: number of activity log records
+    :return: list of uuids of created posts
+    """
+
+    rng = random.Random(random_seed)
+    now = datetime.datetime.now()
+
+    def moment():
+        return now - datetime.timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+    db.drop_all()
+    db.create_all()
+
+    insert_chunked(User.__table__, (
+        {"id": i, "name": f"name{i}", "surname": f"surname{i}", "username": f"user{i}", "password": f"password{i}"}
+        for i in range(1, users + 1)
+    ), chunk_size)
+
+    post_uuids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(posts)]
+
+    def post_rows():
+        for i, post_uuid in enumerate(post_uuids, start=1):
+            created = moment()
+            yield {"id": i, "author_id": rng.randint(1, users), "text": f"post number {i} " * rng.randint(1, 20),
+                   "uuid": post_uuid, "created_at": created}
+
+    insert_chunked(Post.__table__, post_rows(), chunk_size)
+
+    def like_rows():
+        for pair in rng.sample(range(users * posts), min(likes, users * posts)):
+            created = moment()
+            yield {"user_id": pair // posts + 1, "post_id": pair % posts + 1,
+                   "created_at": created}
+
+    insert_chunked(Like.__table__, like_rows(), chunk_size)
+    rebuild_like_rollup()
+
+    def activity_rows():
+        for _ in range(activities):
+            created = moment()
+            yield {"user_id": rng.randint(1, users), "post_id": rng.randint(1, posts) if posts else None,
+                   "action": rng.choice(ACTIONS), "created_at": created}
+
+    insert_chunked(ActivityLog.__table__, activity_rows(), chunk_size)
+
+    return post_uuids
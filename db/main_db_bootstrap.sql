@@ -24,11 +24,12 @@ CREATE TABLE `post` (
   `author_id` int(11) DEFAULT NULL,
   `text` mediumtext NOT NULL,
   `uuid` varchar(255) DEFAULT NULL,
-  `date` date DEFAULT NULL,
-  `time` time DEFAULT NULL,
+  `created_at` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
   PRIMARY KEY (`id`),
   UNIQUE KEY `uuid` (`uuid`),
-  KEY `author_id` (`author_id`),
+  KEY `post_created_at` (`created_at`),
+  KEY `post_author_created_at` (`author_id`, `created_at`),
+  FULLTEXT KEY `post_text_fulltext` (`text`),
   CONSTRAINT `post_ibfk_1` FOREIGN KEY (`author_id`) REFERENCES `user` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
@@ -40,11 +41,12 @@ CREATE TABLE `like` (
   `id` int(11) NOT NULL AUTO_INCREMENT,
   `user_id` int(11) DEFAULT NULL,
   `post_id` int(11) DEFAULT NULL,
-  `date` date DEFAULT NULL,
-  `time` time DEFAULT NULL,
+  `created_at` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
   PRIMARY KEY (`id`),
-  KEY `user_id` (`user_id`),
-  KEY `post_id` (`post_id`),
+  UNIQUE KEY `user_post` (`user_id`, `post_id`),
+  KEY `like_created_at` (`created_at`),
+  KEY `like_post_created_at` (`post_id`, `created_at`),
+  KEY `like_user_created_at` (`user_id`, `created_at`),
   CONSTRAINT `like_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`),
   CONSTRAINT `like_ibfk_2` FOREIGN KEY (`post_id`) REFERENCES `post` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
@@ -58,11 +60,23 @@ CREATE TABLE `activity_log` (
   `user_id` int(11) DEFAULT NULL,
   `post_id` int(11) DEFAULT NULL,
   `action` varchar(255) DEFAULT NULL,
-  `date` date DEFAULT NULL,
-  `time` time DEFAULT NULL,
+  `created_at` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
   PRIMARY KEY (`id`),
-  KEY `user_id` (`user_id`),
-  KEY `post_id` (`post_id`),
+  KEY `activity_user_created_at` (`user_id`, `created_at`),
+  KEY `activity_post_created_at` (`post_id`, `created_at`),
   CONSTRAINT `activity_log_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `user` (`id`),
   CONSTRAINT `activity_log_ibfk_2` FOREIGN KEY (`post_id`) REFERENCES `post` (`id`)
-) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+
+-- -----------------------------------------------
+-- Table `post_like_daily`
+-- -----------------------------------------------
+
+CREATE TABLE `post_like_daily` (
+  `post_id` int(11) NOT NULL,
+  `date` date NOT NULL,
+  `count` int(11) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`post_id`, `date`),
+  CONSTRAINT `post_like_daily_ibfk_1` FOREIGN KEY (`post_id`) REFERENCES `post` (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
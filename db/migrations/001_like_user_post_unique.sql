@@ -0,0 +1,17 @@
+-- -----------------------------------------------
+-- Unique (`user_id`, `post_id`) key on `like`
+--
+-- Removes duplicate likes (keeps the earliest one) and replaces `user_id` key
+-- with the unique key, which also serves lookups by `user_id`.
+-- Run `python -m src rebuild-like-rollup` afterwards to recount likes statistics.
+-- -----------------------------------------------
+
+DELETE `duplicate` FROM `like` AS `duplicate`
+  JOIN `like` AS `original`
+    ON `duplicate`.`user_id` = `original`.`user_id`
+   AND `duplicate`.`post_id` = `original`.`post_id`
+   AND `duplicate`.`id` > `original`.`id`;
+
+ALTER TABLE `like`
+  ADD UNIQUE KEY `user_post` (`user_id`, `post_id`),
+  DROP KEY `user_id`;
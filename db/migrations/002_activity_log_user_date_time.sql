@@ -0,0 +1,10 @@
+-- -----------------------------------------------
+-- Composite (`user_id`, `date`, `time`) key on `activity_log`
+--
+-- Replaces `user_id` key: filters and pages of /api/analytics/user
+-- are read as ranges of the composite key.
+-- -----------------------------------------------
+
+ALTER TABLE `activity_log`
+  ADD KEY `user_date_time` (`user_id`, `date`, `time`),
+  DROP KEY `user_id`;
@@ -0,0 +1,49 @@
+-- -----------------------------------------------
+-- Single `created_at` column on `post`, `like` and `activity_log`
+--
+-- Replaces separate `date` and `time` columns with one DATETIME(6),
+-- filled by the server for new rows, and adds composite
+-- (`post_id`, `created_at`) and (`user_id`, `created_at`) keys,
+-- so time range queries are read as index ranges.
+-- Existing rows keep their time: created_at = date + time.
+-- Run `python -m src rebuild-like-rollup` afterwards.
+-- -----------------------------------------------
+
+ALTER TABLE `post`
+  ADD COLUMN `created_at` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6);
+
+UPDATE `post` SET `created_at` = TIMESTAMP(`date`, COALESCE(`time`, '00:00:00')) WHERE `date` IS NOT NULL;
+
+ALTER TABLE `post`
+  ADD KEY `post_created_at` (`created_at`),
+  ADD KEY `post_author_created_at` (`author_id`, `created_at`),
+  DROP KEY `author_id`,
+  DROP COLUMN `date`,
+  DROP COLUMN `time`;
+
+
+ALTER TABLE `like`
+  ADD COLUMN `created_at` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6);
+
+UPDATE `like` SET `created_at` = TIMESTAMP(`date`, COALESCE(`time`, '00:00:00')) WHERE `date` IS NOT NULL;
+
+ALTER TABLE `like`
+  ADD KEY `like_post_created_at` (`post_id`, `created_at`),
+  ADD KEY `like_user_created_at` (`user_id`, `created_at`),
+  DROP KEY `post_id`,
+  DROP COLUMN `date`,
+  DROP COLUMN `time`;
+
+
+ALTER TABLE `activity_log`
+  ADD COLUMN `created_at` datetime(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6);
+
+UPDATE `activity_log` SET `created_at` = TIMESTAMP(`date`, COALESCE(`time`, '00:00:00')) WHERE `date` IS NOT NULL;
+
+ALTER TABLE `activity_log`
+  ADD KEY `activity_user_created_at` (`user_id`, `created_at`),
+  ADD KEY `activity_post_created_at` (`post_id`, `created_at`),
+  DROP KEY `user_date_time`,
+  DROP KEY `post_id`,
+  DROP COLUMN `date`,
+  DROP COLUMN `time`;
@@ -0,0 +1,9 @@
+-- -----------------------------------------------
+-- FULLTEXT key on `post`.`text`
+--
+-- Used by /api/posts/search (MATCH ... AGAINST), which would
+-- otherwise scan the whole table.
+-- -----------------------------------------------
+
+ALTER TABLE `post`
+  ADD FULLTEXT KEY `post_text_fulltext` (`text`);
@@ -0,0 +1,9 @@
+-- -----------------------------------------------
+-- `created_at` key on `like`
+--
+-- Trending posts are rebuilt from likes of the last
+-- TRENDING_WINDOW_SECONDS, read as a range of this key.
+-- -----------------------------------------------
+
+ALTER TABLE `like`
+  ADD KEY `like_created_at` (`created_at`);
@@ -1,6 +1,100 @@
+import argparse
+import logging
+import sys
+
 from src.app import app, db
 import src.api
 import src.models
+from src.bulk import TABLES, BulkError, export_table, import_table
+from src.like_buffer import like_buffer
+from src.likes import rebuild_like_rollup
+from src.retention import archive_activities
+from src.server import PreforkServer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m src")
+    commands = parser.add_subparsers(dest="command")
+
+    commands.add_parser("run", help="run development server (default)")
+
+    serve = commands.add_parser("serve", help="run production server with several worker processes")
+    serve.add_argument("--bind", default=app.config["SERVER_BIND"], help="host:port to listen on")
+    serve.add_argument("--workers", type=int, default=app.config["SERVER_WORKERS"], help="number of worker processes")
+    serve.add_argument("--max-requests", type=int, default=app.config["SERVER_MAX_REQUESTS"],
+                       help="replace a worker after this number of requests, 0 - never")
+
+    rebuild = commands.add_parser("rebuild-like-rollup", help="recompute post_like_daily table from like table")
+    rebuild.add_argument("--chunk-size", type=int, default=10000, help="number of posts per transaction")
+
+    import_parser = commands.add_parser("import", help="load a table from a jsonl or csv file (optionally .gz)")
+    import_parser.add_argument("table", choices=list(TABLES))
+    import_parser.add_argument("path", help="file to import, format is taken from extension: .jsonl, .csv, .jsonl.gz ...")
+    import_parser.add_argument("--format", choices=["jsonl", "csv"], help="format of the file, if it has another extension")
+    import_parser.add_argument("--batch-size", type=int, default=app.config["BULK_BATCH_SIZE"],
+                               help="rows per insert and transaction")
+    import_parser.add_argument("--checkpoint", help="file to save progress to, an interrupted import "
+                                                    "started again with it continues after the last saved batch")
+
+    export_parser = commands.add_parser("export", help="write a table to a jsonl or csv file (optionally .gz)")
+    export_parser.add_argument("table", choices=list(TABLES))
+    export_parser.add_argument("path", help="file to write, format is taken from extension: .jsonl, .csv, .csv.gz ...")
+    export_parser.add_argument("--format", choices=["jsonl", "csv"], help="format of the file, if it has another extension")
+    export_parser.add_argument("--batch-size", type=int, default=app.config["BULK_BATCH_SIZE"], help="rows per query")
+
+    archive = commands.add_parser("archive-activities", help="move old activities from activity_log table "
+                                                              "to compressed files")
+    archive.add_argument("--retention-days", type=int, default=app.config["ACTIVITY_RETENTION_DAYS"],
+                         help="activities of this number of last days stay in the table")
+    archive.add_argument("--dir", default=app.config["ACTIVITY_ARCHIVE_DIR"], help="directory of archive files")
+    archive.add_argument("--chunk-size", type=int, default=app.config["ACTIVITY_ARCHIVE_CHUNK_SIZE"],
+                         help="rows read and archived at a time")
+    archive.add_argument("--delete-batch-size", type=int, default=app.config["ACTIVITY_ARCHIVE_DELETE_BATCH_SIZE"],
+                         help="rows deleted per transaction")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        app.logger.setLevel(logging.INFO)
+
+        PreforkServer(
+            args.bind,
+            args.workers,
+            max_requests=args.max_requests,
+            max_requests_jitter=app.config["SERVER_MAX_REQUESTS_JITTER"],
+            graceful_timeout=app.config["SERVER_GRACEFUL_TIMEOUT"]
+        ).run()
+    elif args.command in ("import", "export"):
+        transfer = import_table if args.command == "import" else export_table
+        options = {"checkpoint": args.checkpoint} if args.command == "import" else {}
+
+        try:
+            with app.app_context():
+                count = transfer(args.table, args.path, args.batch_size, fmt=args.format, **options)
+        except (BulkError, OSError) as e:
+            sys.exit(f"{args.command} failed: {e}")
+
+        print(f"{args.table}: {count} rows {args.command}ed")
+    elif args.command == "archive-activities":
+        try:
+            with app.app_context():
+                count = archive_activities(args.retention_days, args.dir, args.chunk_size, args.delete_batch_size,
+                                           pause=app.config["ACTIVITY_ARCHIVE_DELETE_PAUSE"])
+        except OSError as e:
+            sys.exit(f"archive-activities failed: {e}")
+
+        print(f"activity_log: {count} rows archived to {args.dir}")
+    elif args.command == "rebuild-like-rollup":
+        with app.app_context():
+            written = rebuild_like_rollup(chunk_size=args.chunk_size)
+
+        print(f"post_like_daily rebuilt: {written} rows")
+    else:
+        if like_buffer.enabled:
+            like_buffer.recover()
+
+        app.run()
+
 
 if __name__ == "__main__":
-    app.run()
+    main()
@@ -0,0 +1,144 @@
+import os
+import queue
+import threading
+import time
+
+from src.app import app, db
+
+
+_FLUSH = object()
+_STOP = object()
+
+
+class ActivityWriter:
+    """
+    Buffers activity log records in a bounded queue and inserts them into the database
+    in batches (one multi-row INSERT per batch) from a background thread.
+
+    A batch is written when it reaches ACTIVITY_LOG_BATCH_SIZE records or when ACTIVITY_LOG_FLUSH_INTERVAL
+    seconds have passed since its first record. If the queue is full, put() blocks for up to
+    ACTIVITY_LOG_PUT_TIMEOUT seconds and then writes the record itself, so records are never dropped.
+    A batch, that can't be inserted (e.g. while the database restarts), is retried ACTIVITY_LOG_INSERT_ATTEMPTS times
+    with growing delays before it is logged and given up
+    """
+
+    def __init__(self, table):
+        """
+        :param table: sqlalchemy table records are inserted into
+        """
+
+        self.table = table
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def put(self, record):
+        """
+        Adds a record to the queue, starts the background thread if it is not running yet
+
+        :param record: dict of column values of a new row
+        """
+
+        self._ensure_started()
+
+        try:
+            self._queue.put(record, timeout=app.config["ACTIVITY_LOG_PUT_TIMEOUT"])
+        except queue.Full:
+            self._insert([record])
+
+    def flush(self):
+        """
+        Blocks until every record, added before this call, is written to the database
+        """
+
+        if not self._running():
+            return
+
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def stop(self):
+        """
+        Writes all pending records and stops the background thread
+        """
+
+        if not self._running():
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _running(self):
+        return self._thread is not None and self._pid == os.getpid()
+
+    def _ensure_started(self):
+        if self._running():
+            return
+
+        with self._lock:
+            # a forked worker process inherits the queue, but not the thread, so it needs its own pair
+            if self._running():
+                return
+
+            self._queue = queue.Queue(maxsize=app.config["ACTIVITY_LOG_QUEUE_SIZE"])
+            self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        stopped = False
+
+        while not stopped:
+            batch = []
+            taken = 0
+            deadline = None
+
+            while len(batch) < app.config["ACTIVITY_LOG_BATCH_SIZE"]:
+                try:
+                    if deadline is None:
+                        item = self._queue.get()
+                    else:
+                        item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+
+                taken += 1
+
+                if item is _STOP:
+                    stopped = True
+                    break
+                if item is _FLUSH:
+                    break
+
+                batch.append(item)
+
+                if deadline is None:
+                    deadline = time.monotonic() + app.config["ACTIVITY_LOG_FLUSH_INTERVAL"]
+
+            if batch:
+                self._insert(batch)
+
+            for _ in range(taken):
+                self._queue.task_done()
+
+    def _insert(self, records):
+        attempts = app.config["ACTIVITY_LOG_INSERT_ATTEMPTS"]
+        delay = app.config["ACTIVITY_LOG_RETRY_DELAY"]
+
+        for attempt in range(1, attempts + 1):
+            try:
+                with app.app_context():
+                    db.engine.execute(self.table.insert(), records)
+
+                return
+            except Exception:
+                if attempt == attempts:
+                    app.logger.exception(f"failed to write {len(records)} activity log records, giving up")
+                    return
+
+                app.logger.warning(f"failed to write {len(records)} activity log records, retrying", exc_info=True)
+
+            time.sleep(delay)
+            delay *= 2
@@ -1,29 +1,93 @@
-from src.models import User, Like, Post, ActivityLog, log_activity, from_date
+from src.models import User, Post, PostLikeDaily, ActivityLog, log_activity, from_date, from_timestamp, day_range
+from src.likes import (
+    ConcurrentLikeChange, liked_post_ids, post_like_counts, posts_with_likes, toggle_like, toggle_likes
+)
 from src.app import api, db, app
+from src.cache import cached, response_cache
+from src.routing import read_only
+from src.pagination import InvalidPage, decode_cursor, encode_cursor, keyset_page, page_args, page_headers
+from src.search import search_index, search_posts
+from src.singleflight import coalesced
+from src.trending import trending_posts
+from src.like_buffer import like_buffer
+from src.streaming import InvalidStream, stream_format, stream_query, stream_rows
+from src.retention import archived_activities, merge_archived
+from src.fields import POST_FIELDS, USER_FIELDS, InvalidFields, json_response, project, requested_fields, serializer
 import src.authentication as auth
+import src.metrics  # noqa: F401 - registers request hooks and /metrics endpoints
 
-import jwt
 import datetime
+import functools
+import itertools
+import time
+import uuid
 from flask import request
 from flask_restful import Resource
-from sqlalchemy import func
+from sqlalchemy import func, tuple_
+
+
+def validate_batch(items, field):
+    """
+    Checks that a batch is a non-empty list of at most MAX_BATCH_SIZE jsons, each with a non-empty string field
+
+    :param items: parsed request json
+    :param field: name of a required field of every item
+    :return: json with errors, or None if the batch is valid
+    """
+
+    if not isinstance(items, list) or not items:
+        return {"error": "a non-empty list of items expected"}
+
+    if len(items) > app.config["MAX_BATCH_SIZE"]:
+        return {"error": f"batch can contain at most {app.config['MAX_BATCH_SIZE']} items"}
+
+    errors = [
+        {"index": index, "error": f"no {field} provided"}
+        for index, item in enumerate(items)
+        if not isinstance(item, dict) or not isinstance(item.get(field), str) or not item[field]
+    ]
+
+    if errors:
+        return {"error": "invalid items", "items": errors}
+
+    return None
 
 
 class Users(Resource):
+    @cached("users", on_hit=lambda: log_activity("users list requested"))
+    @read_only
     def get(self):
         """
-        :return: List of jsons with all users' data
+        :return: List of jsons with users' data, one page at a time.
+        A cursor of the next page is returned in X-Next-Cursor header, if there is one.
+        With ?stream=1 (or ?stream=ndjson) all users are streamed in one chunked response instead.
+        ?fields=id,username returns only these fields, only their columns are read from the database
 
-        example: curl http://127.0.0.1:5000/api/users
+        example: curl "http://127.0.0.1:5000/api/users?limit=100&fields=id,username&cursor=<NEXT_CURSOR>"
         """
 
-        users = User.query.all()
+        try:
+            fields = requested_fields(USER_FIELDS)
+            query = project(User.query, fields, USER_FIELDS, User.id)
+            serialize = serializer(fields, USER_FIELDS)
+
+            fmt = stream_format()
+
+            if fmt:
+                log_activity("users list requested")
 
-        users_list = [user.json() for user in users]
+                return stream_query(query.order_by(User.id), serialize, fmt)
+
+            limit, cursor = page_args()
+            users, next_cursor = keyset_page(query, User.id, limit, cursor)
+        except (InvalidPage, InvalidStream, InvalidFields) as e:
+            return {"error": str(e)}, 400
+
+        users_list = [serialize(user) for user in users]
 
         log_activity("users list requested")
 
-        return users_list, 200
+        return json_response(users_list, headers=page_headers(next_cursor))
 
     def post(self):
 
@@ -64,31 +128,96 @@ class Users(Resource):
         db.session.add(new_user)
         db.session.commit()
 
-        log_activity(f"user created successfully: {args['username']}", user_id=new_user.id)
+        response_cache.bump("users")
 
-        token = jwt.encode({
-            "username": new_user.username,
-            "exp": datetime.datetime.now() + datetime.timedelta(minutes=30)
-        }, app.config['SECRET_KEY'])
+        log_activity(f"user created successfully: {args['username']}", user_id=new_user.id)
 
-        return {"token": token.decode("utf-8")}, 200
+        return {"token": auth.issue_token(new_user)}, 200
 
 
 class Posts(Resource):
-    def get(self):
+    @cached("posts", "likes", on_hit=lambda: log_activity("posts requested"))
+    @read_only
+    @auth.token_optional
+    def get(self, user):
         """
-        :return: list of jsons of all posts
+        :param user: authenticated user, if the request has X-Api-Key header, otherwise None
+        :return: list of jsons of posts with their like_count (and liked_by_me for an authenticated user),
+        one page at a time. A cursor of the next page is returned in X-Next-Cursor header, if there is one.
+        With ?stream=1 (or ?stream=ndjson) all posts are streamed in one chunked response instead.
+        ?fields=id,uuid,like_count returns only these fields, only their columns are read from the database
 
-        example: curl http://127.0.0.1:5000/api/posts
+        example: curl -H "X-Api-Key: <USER_TOKEN>" "http://127.0.0.1:5000/api/posts?limit=100&cursor=<NEXT_CURSOR>"
         """
 
-        posts = Post.query.all()
+        user_id = user.id if user else None
+
+        try:
+            fields = requested_fields(POST_FIELDS, ("like_count", "liked_by_me"))
+            query = project(Post.query, fields, POST_FIELDS, Post.id)
+            serialize = serializer(fields, POST_FIELDS)
+
+            with_like_count = "like_count" in fields
+            with_liked = "liked_by_me" in fields and user is not None
+
+            fmt = stream_format()
+
+            if fmt:
+                log_activity("posts requested")
+
+                if with_like_count or with_liked:
+                    query = posts_with_likes(query, user_id if with_liked else None)
 
-        posts_list = [post.json() for post in posts]
+                buffered = like_buffer.enabled
+
+                def serialize_row(row):
+                    post = serialize(row)
+                    like_count = int(row.like_count or 0) if with_like_count else 0
+                    liked = row.liked_by_me if with_liked else None
+
+                    if buffered:
+                        like_count, liked = like_buffer.adjust_post(user_id if with_liked else None, row.id,
+                                                                    like_count, liked)
+
+                    if with_like_count:
+                        post["like_count"] = like_count
+
+                    if with_liked:
+                        post["liked_by_me"] = liked
+
+                    return post
+
+                return stream_query(query.order_by(Post.id), serialize_row, fmt)
+
+            limit, cursor = page_args()
+            posts, next_cursor = keyset_page(query, Post.id, limit, cursor)
+        except (InvalidPage, InvalidStream, InvalidFields) as e:
+            return {"error": str(e)}, 400
+
+        post_ids = [post.id for post in posts]
+        like_counts = post_like_counts(post_ids) if with_like_count else None
+        liked = liked_post_ids(user_id, post_ids) if with_liked else None
+
+        if like_buffer.enabled:
+            like_counts = like_buffer.adjust_counts(like_counts) if with_like_count else None
+            liked = like_buffer.adjust_liked(user_id, post_ids, liked) if with_liked else None
+
+        posts_list = []
+
+        for row in posts:
+            post = serialize(row)
+
+            if with_like_count:
+                post["like_count"] = like_counts[row.id]
+
+            if with_liked:
+                post["liked_by_me"] = row.id in liked
+
+            posts_list.append(post)
 
         log_activity("posts requested")
 
-        return posts_list
+        return json_response(posts_list, headers=page_headers(next_cursor))
 
     @auth.token_required
     def post(self, user):
@@ -117,11 +246,139 @@ class Posts(Resource):
         db.session.add(new_post)
         db.session.commit()
 
+        response_cache.bump("posts")
+        search_index.add(new_post.id, new_post.text)
+
         log_activity("new post added", user_id=user.id, post_id=new_post.id)
 
         return new_post.json(), 201
 
 
+class PostsBatch(Resource):
+    @auth.token_required
+    def post(self, user):
+        """
+        API for creating many posts at once. All posts are inserted with one multi-row insert in one transaction,
+        if any of them is invalid, none is created
+
+        :param user: authenticated user, returned by auth.token_required function
+        :return: list of jsons of new created posts, in the same order as they were passed
+
+        example (should be a single line):
+        curl -H "Content-Type: application/json" -H "X-Api-Key: <USER_TOKEN>"
+        -d '[{"text": "first post"}, {"text": "second post"}]' http://127.0.0.1:5000/api/posts/batch
+        """
+
+        items = request.get_json()
+
+        error = validate_batch(items, "text")
+
+        if error:
+            log_activity("tried to add invalid batch of posts", user_id=user.id)
+
+            return error, 400
+
+        now = datetime.datetime.now()
+
+        rows = [
+            {"author_id": user.id, "text": item["text"], "uuid": str(uuid.uuid4()), "created_at": now}
+            for item in items
+        ]
+
+        db.session.execute(Post.__table__.insert(), rows)
+
+        posts = {post.uuid: post.json() for post in Post.query.filter(Post.uuid.in_([row["uuid"] for row in rows]))}
+
+        db.session.commit()
+
+        response_cache.bump("posts")
+
+        posts_list = [posts[row["uuid"]] for row in rows]
+
+        for post in posts_list:
+            search_index.add(post["id"], post["text"])
+
+        for post in posts_list:
+            log_activity("new post added", user_id=user.id, post_id=post["id"])
+
+        return posts_list, 201
+
+
+class PostSearch(Resource):
+    @cached("posts")
+    @read_only
+    def get(self):
+        """
+        API for full-text search of posts. Words of the query are looked up in a text index
+        (MySQL FULLTEXT, or an in-process index with other databases)
+
+        :return: list of jsons of posts, containing words of the query, with their relevance "score",
+        most relevant first, one page at a time (see /api/posts). Time spent on the search in milliseconds
+        is returned in X-Query-Time-Ms header, responses taken from the cache don't have it
+
+        example: curl "http://127.0.0.1:5000/api/posts/search?q=good%20morning&limit=20&cursor=<NEXT_CURSOR>"
+        """
+
+        text = request.args.get("q", "").strip()
+
+        if not text:
+            return {"error": "no search query provided, use ?q=<words>"}, 400
+
+        started = time.perf_counter()
+
+        try:
+            limit, cursor = page_args()
+            results, next_cursor = search_posts(text, limit, cursor)
+        except InvalidPage as e:
+            return {"error": str(e)}, 400
+
+        elapsed = 1000 * (time.perf_counter() - started)
+
+        posts_list = [{**post.json(), "score": score} for post, score in results]
+
+        return posts_list, 200, {**page_headers(next_cursor), "X-Query-Time-Ms": f"{elapsed:.3f}"}
+
+
+class Trending(Resource):
+    @cached("posts", "likes")
+    @read_only
+    def get(self):
+        """
+        API for posts with the most likes recently, a like loses half of its weight
+        every TRENDING_HALF_LIFE_SECONDS and is not counted after TRENDING_WINDOW_SECONDS
+
+        :return: list of at most ?limit= (up to TRENDING_SIZE) jsons of posts with their like_count
+        and trending_score, best first. With LIKE_BUFFER_ENABLED like_count includes not yet written likes,
+        trending_score counts them after they are written
+
+        example: curl "http://127.0.0.1:5000/api/posts/trending?limit=10"
+        """
+
+        limit = request.args.get("limit", app.config["TRENDING_SIZE"])
+
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            limit = 0
+
+        if not 0 < limit <= app.config["TRENDING_SIZE"]:
+            return {"error": f"limit must be between 1 and {app.config['TRENDING_SIZE']}"}, 400
+
+        top = trending_posts.top(limit)
+        post_ids = [post_id for post_id, _ in top]
+
+        posts = {post.id: post for post in Post.query.filter(Post.id.in_(post_ids))} if post_ids else {}
+        like_counts = post_like_counts(post_ids)
+
+        if like_buffer.enabled:
+            like_counts = like_buffer.adjust_counts(like_counts)
+
+        return [
+            {**posts[post_id].json(like_count=like_counts[post_id]), "trending_score": round(score, 3)}
+            for post_id, score in top if post_id in posts
+        ], 200
+
+
 class Likes(Resource):
     @auth.token_required
     def post(self, user):
@@ -130,7 +387,7 @@ class Likes(Resource):
         post will be unliked (same as in Instagram). If user didn't like this post previously, like will be added
 
         :param user: authenticated user, who wants to like some post
-        :return: data about new like or message that like was deleted
+        :return: data about new like or message that like was deleted, both with a new number of post's likes
 
         example (should be a single line):
         curl -H "Content-Type: application/json" -H "X-Api-Key: <USER_TOKEN>"
@@ -149,43 +406,216 @@ class Likes(Resource):
 
         post_uuid = args["uuid"]
 
-        post = Post.query.filter(Post.uuid == post_uuid).first()
+        result = (like_buffer.toggle if like_buffer.enabled else toggle_like)(user.id, post_uuid)
 
-        if not post:
+        if result is None:
             log_activity(f"tried to like not existing post: {post_uuid}", user_id=user.id)
 
             return {"error": f"post with uuid {post_uuid} does not exist"}, 400
 
-        like_query = Like.query.filter(Like.user_id == user.id, Like.post_id == post.id)
+        post_id, like, like_count = result
+
+        response_cache.bump("likes")
+
+        if like is None:
+            log_activity("unliked post", user_id=user.id, post_id=post_id)
+
+            return {"message": "post was successfully unliked", "like_count": like_count}, 201
+
+        log_activity("liked post", user_id=user.id, post_id=post_id)
+
+        return {**like, "like_count": like_count}, 201
+
+
+class LikesBatch(Resource):
+    @auth.token_required
+    def post(self, user):
+        """
+        API for a user to like/unlike many posts at once. Every uuid is toggled the same way as in /api/like,
+        but all likes are deleted and inserted in one transaction
+
+        :param user: authenticated user, who wants to like some posts
+        :return: list of results for every passed uuid, in the same order
+
+        example (should be a single line):
+        curl -H "Content-Type: application/json" -H "X-Api-Key: <USER_TOKEN>"
+        -d '[{"uuid": "<POST_UUID>"}, {"uuid": "<OTHER_POST_UUID>"}]' http://127.0.0.1:5000/api/like/batch
+        """
+
+        items = request.get_json()
+
+        error = validate_batch(items, "uuid")
+
+        if error:
+            log_activity("tried to like invalid batch of posts", user_id=user.id)
+
+            return error, 400
+
+        post_uuids = [item["uuid"] for item in items]
+
+        try:
+            if like_buffer.enabled:
+                results = [like_buffer.toggle(user.id, post_uuid) for post_uuid in post_uuids]
+                results = [result and (result[0], result[1] is not None, result[2]) for result in results]
+            else:
+                results = toggle_likes(user.id, post_uuids)
+        except ConcurrentLikeChange:
+            return {"error": "likes were changed by another request, try again"}, 409
+
+        response_cache.bump("likes")
+
+        response = []
+
+        for post_uuid, result in zip(post_uuids, results):
+            if result is None:
+                log_activity(f"tried to like not existing post: {post_uuid}", user_id=user.id)
+
+                response.append({
+                    "uuid": post_uuid,
+                    "status": 400,
+                    "error": f"post with uuid {post_uuid} does not exist"
+                })
+                continue
+
+            post_id, liked, like_count = result
+
+            log_activity("liked post" if liked else "unliked post", user_id=user.id, post_id=post_id)
+
+            response.append({
+                "uuid": post_uuid,
+                "status": 201,
+                "post_id": post_id,
+                "liked": liked,
+                "like_count": like_count
+            })
 
-        if like_query.first():
-            like_query.delete()
-            db.session.commit()
+        return response, 200
 
-            log_activity("unliked post", user_id=user.id, post_id=post.id)
 
-            return {"message": "post was successfully unliked"}, 201
-        else:
-            like = Like(user_id=user.id, post_id=post.id)
-            db.session.add(like)
-            db.session.commit()
+ACTIVITY_ORDER = (ActivityLog.created_at, ActivityLog.id)
 
-            log_activity("liked post", user_id=user.id, post_id=post.id)
 
-            return like.json(), 201
+def activity_filters(args):
+    """
+    Reads "start_date", "end_date" and "actions" filters from request json
+
+    :return: tuple (start, end, actions): half-open range of created_at (see day_range), list of actions or None
+    """
+
+    start, end = day_range(
+        from_date(args["start_date"]) if args.get("start_date") else None,
+        from_date(args["end_date"]) if args.get("end_date") else None
+    )
+
+    if args.get("actions") is not None and not isinstance(args["actions"], list):
+        raise TypeError("actions must be a list")
+
+    return start, end, args.get("actions")
+
+
+def filter_activities(query, filters):
+    """
+    Applies filters, returned by activity_filters, to a query of activities
+    """
+
+    start, end, actions = filters
+
+    if start:
+        query = query.filter(ActivityLog.created_at >= start)
+
+    if end:
+        query = query.filter(ActivityLog.created_at < end)
+
+    if actions is not None:
+        query = query.filter(ActivityLog.action.in_(actions))
+
+    return query
+
+
+def activities_page(query, limit, cursor=None, archived=None):
+    """
+    Returns one page of activities, ordered by (created_at, id), so the page is read
+    as a range of (user_id, created_at) index
+
+    :param archived: function (after) -> iterator over archived activities after (created_at, id) of the cursor
+    (see retention.archived_activities), they are merged into the page, None - the archive is not read
+    :return: tuple (activities, next_cursor), next_cursor is None on the last page
+    """
+
+    after = None
+
+    if cursor:
+        created_at, last_id = decode_cursor(cursor, size=2)
+
+        try:
+            after = (from_timestamp(created_at), int(last_id))
+        except (TypeError, ValueError, AttributeError):
+            raise InvalidPage(f"invalid cursor {cursor}")
+
+        query = query.filter(tuple_(*ACTIVITY_ORDER) > tuple_(*after))
+
+    actions = query.order_by(*ACTIVITY_ORDER).limit(limit + 1).all()
+
+    if archived is not None:
+        # the archive is read only till the first limit + 1 activities after the cursor
+        actions = list(itertools.islice(merge_archived(archived(after), actions), limit + 1))
+
+    if len(actions) <= limit:
+        return actions, None
+
+    actions = actions[:limit]
+    last = actions[-1]
+
+    return actions, encode_cursor(str(last.created_at), last.id)
+
+
+def aggregate_activities(query, archived=()):
+    """
+    :param archived: activities read from the archive, counted together with the ones in the table
+    :return: json {date: {action: count}} computed by the database
+    """
+
+    date = func.date(ActivityLog.created_at)
+
+    counts = query.with_entities(
+        date, ActivityLog.action, func.count(ActivityLog.id)
+    ).group_by(date, ActivityLog.action).order_by(date, ActivityLog.action)
+
+    statistics = {}
+
+    for date, action, count in counts:
+        statistics.setdefault(str(date), {})[action] = count
+
+    if not archived:
+        return statistics
+
+    for activity in archived:
+        day = statistics.setdefault(str(activity.created_at.date()), {})
+        day[activity.action] = day.get(activity.action, 0) + 1
+
+    return {date: dict(sorted(statistics[date].items())) for date in sorted(statistics)}
 
 
 class UserStatistics(Resource):
+    @coalesced
+    @read_only
     def get(self):
         """
         API for tracking user's activities: likes/unlikes, posts creation, logins and so on
 
-        :return: json of all activities of a user
+        Optional filters: "start_date", "end_date" (inclusive, "YYYY-MM-DD") and "actions" (list of actions).
+        With "aggregate": true numbers of activities per action per day are returned instead of activities
+
+        :return: json of activities of a user ordered by time, one page at a time (see /api/posts),
+        or with ?stream=1 (?stream=ndjson) all matching activities in a chunked response;
+        in aggregate mode json {date: {action: count}}
 
         example:
         curl -H "Content-Type: application/json" -d '{"username": "ooleksyshyn"}' -X GET http://127.0.0.1:5000/api/analytics/user
 
-
+        curl -H "Content-Type: application/json"
+        -d '{"username": "ooleksyshyn", "start_date": "2020-05-08", "actions": ["liked post"], "aggregate": true}'
+        -X GET http://127.0.0.1:5000/api/analytics/user
         """
 
         args = request.get_json()
@@ -200,12 +630,36 @@ class UserStatistics(Resource):
         if not user:
             return {"Invalid user statistic requested": f"{username}"}, 400
 
-        actions = ActivityLog.query.filter(ActivityLog.user_id == user.id).all()
+        try:
+            filters = activity_filters(args)
+            actions = filter_activities(ActivityLog.query.filter(ActivityLog.user_id == user.id), filters)
+            archived = functools.partial(archived_activities, user.id, *filters)
+
+            if args.get("aggregate"):
+                return aggregate_activities(actions, archived()), 200
 
-        return [action.json() for action in actions], 200
+            fmt = stream_format()
+
+            if fmt:
+                return stream_rows(
+                    merge_archived(archived(), actions.order_by(*ACTIVITY_ORDER).yield_per(app.config["STREAM_BATCH_SIZE"])),
+                    lambda activity: activity.json(), fmt
+                )
+
+            limit, cursor = page_args()
+            actions, next_cursor = activities_page(actions, limit, cursor, archived)
+        except (InvalidPage, InvalidStream) as e:
+            return {"error": str(e)}, 400
+        except (TypeError, ValueError):
+            return {"error": "invalid filters, dates must be in YYYY-MM-DD format, actions must be a list"}, 400
+
+        return [action.json() for action in actions], 200, page_headers(next_cursor)
 
 
 class LikeStatistics(Resource):
+    @cached("likes")
+    @coalesced
+    @read_only
     def get(self):
         """
         API for statistics about likes on some post during some period of time, accumulated by date
@@ -232,17 +686,27 @@ class LikeStatistics(Resource):
         if not post:
             return {"error": f"no such post {post_uuid}"}, 404
 
-        likes = db.session.query(Like.date, func.count(Like.date)).filter(
-            Like.post_id == post.id,
-            Like.date >= start_date,
-            Like.date <= end_date
-        ).group_by(Like.date).all()
+        likes = db.session.query(PostLikeDaily.date, PostLikeDaily.count).filter(
+            PostLikeDaily.post_id == post.id,
+            PostLikeDaily.date >= start_date,
+            PostLikeDaily.date <= end_date,
+            PostLikeDaily.count > 0
+        ).order_by(PostLikeDaily.date).all()
+
+        if like_buffer.enabled:
+            counts = like_buffer.adjust_daily(post.id, dict(likes))
+            likes = sorted((date, count) for date, count in counts.items()
+                           if start_date <= date <= end_date and count > 0)
 
         return {str(date): count for (date, count) in likes}, 200
 
 
 api.add_resource(Users, "/api/users")
 api.add_resource(Posts, "/api/posts")
+api.add_resource(PostsBatch, "/api/posts/batch")
+api.add_resource(PostSearch, "/api/posts/search")
+api.add_resource(Trending, "/api/posts/trending")
 api.add_resource(Likes, "/api/like")
+api.add_resource(LikesBatch, "/api/like/batch")
 api.add_resource(UserStatistics, "/api/analytics/user")
 api.add_resource(LikeStatistics, "/api/analytics/likes")
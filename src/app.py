@@ -1,11 +1,26 @@
+import os
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from src.config import DevConfig
 from flask_restful import Api
+from src.compression import compress_response
+from src.config import profiles
+from src.routing import RoutingSQLAlchemy, stick_to_primary
 
 app = Flask(__name__)
-app.config.from_object(DevConfig)
 
-db = SQLAlchemy(app)
+# name of a configuration profile (dev, production, test) or import path of a configuration class
+config_name = os.environ.get("APP_CONFIG", "dev")
+app.config.from_object(profiles.get(config_name, config_name))
+
+for setting in ("SQLALCHEMY_DATABASE_URI", "SECRET_KEY"):
+    if not app.config.get(setting):
+        raise RuntimeError(f"{setting} is not configured for {config_name} configuration")
+
+db = RoutingSQLAlchemy(app)
+
+# gzip/deflate compression of responses, negotiated by Accept-Encoding
+app.after_request(compress_response)
+
+# clients read their own writes from the primary database
+app.after_request(stick_to_primary)
 
 api = Api(app)
@@ -1,12 +1,202 @@
 import jwt
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
 from functools import wraps
 from flask import request
 from src.models import User, Post, log_activity
 from src.app import app, api
 from flask_restful import Resource
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import datetime
 
 
+AuthenticatedUser = namedtuple("AuthenticatedUser", ["id", "username"])
+
+
+class TokenCache:
+    """
+    Bounded LRU cache of already verified tokens, keyed by a digest of a token.
+    An entry lives at most TOKEN_CACHE_TTL seconds and never longer than the token's exp claim
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._user_tokens = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token):
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token):
+        """
+        :return: AuthenticatedUser the token belongs to, or None if token is not cached or entry has expired
+        """
+
+        key = self._digest(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            user, expires_at = entry
+
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+
+            return user
+
+    def set(self, token, user, exp=None):
+        """
+        :param token: verified token
+        :param user: AuthenticatedUser the token belongs to
+        :param exp: exp claim of the token (unix timestamp), if any
+        """
+
+        expires_at = time.time() + app.config["TOKEN_CACHE_TTL"]
+
+        if exp is not None:
+            expires_at = min(expires_at, exp)
+
+        key = self._digest(token)
+
+        with self._lock:
+            self._remove(key)
+
+            self._entries[key] = (user, expires_at)
+            self._user_tokens.setdefault(user.id, set()).add(key)
+
+            while len(self._entries) > app.config["TOKEN_CACHE_SIZE"]:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """
+        Removes all cached tokens of a user
+        """
+
+        with self._lock:
+            for key in self._user_tokens.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._user_tokens.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            keys = self._user_tokens.get(entry[0].id)
+            keys.discard(key)
+
+            if not keys:
+                del self._user_tokens[entry[0].id]
+
+
+token_cache = TokenCache()
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def invalidate_user_tokens(mapper, connection, target):
+    token_cache.invalidate_user(target.id)
+
+
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def invalidate_bulk_changed_users(context):
+    if context.mapper.class_ is User:
+        token_cache.clear()
+
+
+def issue_token(user):
+    """
+    Creates a jwt token for a user, valid for 30 minutes
+
+    :return: token string
+    """
+
+    token = jwt.encode({
+        "user_id": user.id,
+        "username": user.username,
+        "exp": datetime.datetime.now() + datetime.timedelta(minutes=30)
+    }, app.config['SECRET_KEY'])
+
+    return token.decode("utf-8")
+
+
+def find_token_user(payload):
+    """
+    Finds the user a decoded token was issued to. Tokens with user_id are looked up by primary key,
+    older tokens, that have only a username, by username
+
+    :return: AuthenticatedUser or None if there is no such user
+    """
+
+    username = payload["username"]
+
+    if "user_id" in payload:
+        user = User.query.get(payload["user_id"])
+
+        if user is not None and user.username != username:
+            user = None
+    else:
+        user = User.query.filter(User.username == username).first()
+
+    if user is None:
+        return None
+
+    return AuthenticatedUser(id=user.id, username=user.username)
+
+
+class InvalidToken(Exception):
+    """
+    Raised when a token can't be verified, message is the reason returned to the client
+    """
+
+
+def token_user(token):
+    """
+    Verifies a jwt token, tokens verified earlier are taken from token_cache
+
+    :return: AuthenticatedUser the token belongs to
+    """
+
+    user = token_cache.get(token)
+
+    if user is not None:
+        return user
+
+    try:
+        payload = jwt.decode(token, app.config['SECRET_KEY'])
+    except jwt.ExpiredSignatureError:
+        raise InvalidToken("token expired")
+    except jwt.InvalidTokenError:
+        raise InvalidToken("wrong token")
+
+    if "username" not in payload:
+        raise InvalidToken("token expired")
+
+    # database errors are not a client's fault and are not reported as an invalid token
+    user = find_token_user(payload)
+
+    if not user:
+        raise InvalidToken("invalid user")
+
+    token_cache.set(token, user, payload.get("exp"))
+
+    return user
+
+
 def token_required(func):
     @wraps(func)
     def authenticate(self, *args, **kwargs):
@@ -16,7 +206,8 @@ def token_required(func):
 
         :param self: decorates methods, so it should positional argument self
         :param args, kwargs: other arguments, passed to decorated function
-        :return: calls a decorated function with a 'user' passed as an argument, returns its result
+        :return: calls a decorated function with a 'user' (AuthenticatedUser) passed as an argument,
+        returns its result
         """
 
         token = request.headers.get("X-Api-Key", "")
@@ -25,16 +216,31 @@ def token_required(func):
             return {"token required": "invalid token"}, 401, {"WWW-Authenticate": 'Basic realm="Authentication required"'}
 
         try:
-            username = jwt.decode(token, app.config['SECRET_KEY'])['username']
-        except (KeyError, jwt.ExpiredSignatureError):
-            return {"token required": "token expired"}, 401, {"WWW-Authenticate": 'Basic realm="Authentication required"'}
-        except:
-            return {"token required": "wrong token"}, 401, {"WWW-Authenticate": 'Basic realm="Authentication required"'}
+            user = token_user(token)
+        except InvalidToken as e:
+            return {"token required": str(e)}, 401, {"WWW-Authenticate": 'Basic realm="Authentication required"'}
+
+        return func(self, user, *args, **kwargs)
+    return authenticate
 
-        user = User.query.filter(User.username == username).first()
 
-        if not user:
-            return {"token required": "invalid user"}, 401, {"WWW-Authenticate": 'Basic realm="Authentication required"'}
+def token_optional(func):
+    """
+    Same as token_required, but requests without X-Api-Key header are allowed too,
+    the decorated function gets None as a 'user' for them
+    """
+
+    @wraps(func)
+    def authenticate(self, *args, **kwargs):
+        token = request.headers.get("X-Api-Key", "")
+
+        if not token:
+            return func(self, None, *args, **kwargs)
+
+        try:
+            user = token_user(token)
+        except InvalidToken as e:
+            return {"token required": str(e)}, 401, {"WWW-Authenticate": 'Basic realm="Authentication required"'}
 
         return func(self, user, *args, **kwargs)
     return authenticate
@@ -59,14 +265,9 @@ class Login(Resource):
             log_activity(f"user logined unsuccessfully: {data.get('username', '')}")
             return {"WWW-Authenticate": 'Basic realm="Authentication required"'}, 401
 
-        token = jwt.encode({
-            "username": user.username,
-            "exp": datetime.datetime.now() + datetime.timedelta(minutes=30)
-        }, app.config['SECRET_KEY'])
-
         log_activity("user logined successfully", user_id=user.id)
 
-        return {"token": token.decode("utf-8")}, 200
+        return {"token": issue_token(user)}, 200
 
 
 api.add_resource(Login, "/api/login")
@@ -0,0 +1,323 @@
+import csv
+import datetime
+import gzip
+import itertools
+import json
+import os
+import uuid
+
+from sqlalchemy import DateTime, Integer
+from sqlalchemy.exc import DBAPIError
+
+from src.app import db
+from src.cache import response_cache
+from src.likes import rebuild_like_rollup
+from src.models import User, Post, Like, ActivityLog, from_timestamp
+
+
+TABLES = {
+    "users": User.__table__,
+    "posts": Post.__table__,
+    "likes": Like.__table__,
+    "activities": ActivityLog.__table__
+}
+
+# response cache namespaces, that depend on a table
+CACHE_NAMESPACES = {
+    "users": ("users",),
+    "posts": ("posts",),
+    "likes": ("likes",),
+    "activities": ()
+}
+
+
+class BulkError(ValueError):
+    """
+    Raised for unknown tables or formats and for rows, that can't be read or inserted
+    """
+
+
+def file_format(path, fmt=None):
+    """
+    :param path: path of a data file, format is guessed from its extension: .jsonl, .ndjson, .csv, optionally .gz
+    :param fmt: "jsonl" or "csv" to override the guessed format
+    :return: tuple (format, compressed)
+    """
+
+    compressed = path.endswith(".gz")
+    name = path[:-3] if compressed else path
+
+    if fmt is None:
+        extension = os.path.splitext(name)[1].lower()
+        fmt = {".jsonl": "jsonl", ".ndjson": "jsonl", ".json": "jsonl", ".csv": "csv"}.get(extension)
+
+    if fmt not in ("jsonl", "csv"):
+        raise BulkError(f"unknown format of {path}, use .jsonl or .csv (optionally .gz) or pass the format")
+
+    return fmt, compressed
+
+
+def open_text(path, mode, compressed):
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def parse_timestamp(value):
+    """
+    Turns "YYYY-MM-DD HH:MM:SS[.ffffff]" (or ISO format with "T") to datetime object. Cuts the string
+    at fixed positions instead of calling strptime, which is the slowest part of an import
+    """
+
+    try:
+        return datetime.datetime(
+            int(value[0:4]), int(value[5:7]), int(value[8:10]),
+            int(value[11:13]), int(value[14:16]), int(value[17:19]),
+            int(value[20:26].ljust(6, "0")) if len(value) > 20 else 0
+        )
+    except ValueError:
+        return from_timestamp(value.replace("T", " "))
+
+
+def column_converters(table):
+    """
+    :return: dict {column name: function}, which turns a value read from a file into a column value
+    """
+
+    def integer(value):
+        return None if value in ("", None) else int(value)
+
+    def timestamp(value):
+        if value in ("", None) or isinstance(value, datetime.datetime):
+            return value or None
+
+        return parse_timestamp(value)
+
+    def text(value):
+        return value
+
+    def nullable_text(value):
+        # csv has no NULL, an empty field of a nullable column is read as NULL
+        return None if value == "" else value
+
+    converters = {}
+
+    for column in table.columns:
+        # dialect variants (e.g. created_at) keep the generic type in impl
+        column_type = getattr(column.type, "impl", column.type)
+
+        if isinstance(column_type, Integer):
+            converters[column.name] = integer
+        elif isinstance(column_type, DateTime):
+            converters[column.name] = timestamp
+        elif column.nullable:
+            converters[column.name] = nullable_text
+        else:
+            converters[column.name] = text
+
+    return converters
+
+
+def column_defaults(table):
+    """
+    :return: dict {column name: function}, which returns the value of a column missing from a record:
+        its python default (e.g. the current time for created_at) or None
+    """
+
+    defaults = {}
+
+    for column in table.columns:
+        default = column.default
+
+        if default is not None and default.is_callable:
+            # callable defaults are wrapped by SQLAlchemy to take the execution context, which isn't used
+            defaults[column.name] = lambda function=default.arg: function(None)
+        elif default is not None and default.is_scalar:
+            defaults[column.name] = lambda value=default.arg: value
+        else:
+            defaults[column.name] = lambda: None
+
+    return defaults
+
+
+def prepare_row(record, converters, defaults, table_name):
+    """
+    Turns a record read from a file into a dict of values of all columns of the table. Unknown fields are ignored;
+    separate "date" and "time" fields, as returned by the api, are combined into created_at; missing and empty
+    values are replaced by column defaults. Every row has the same keys, executemany compiles one statement
+    for the keys of the first row of a batch and applies it to all of them
+
+    :param record: dict read from a file
+    :param converters: result of column_converters
+    :param defaults: result of column_defaults
+    :param table_name: one of TABLES
+    """
+
+    row = {name: convert(record[name]) for name, convert in converters.items() if name in record}
+
+    if "created_at" in converters and not row.get("created_at") and record.get("date"):
+        row["created_at"] = from_timestamp(f"{record['date']} {record.get('time') or '00:00:00'}")
+
+    if table_name == "posts" and not row.get("uuid"):
+        row["uuid"] = str(uuid.uuid4())
+
+    for name, default in defaults.items():
+        if row.get(name) is None:
+            row[name] = default()
+
+    return row
+
+
+def read_records(file, fmt):
+    """
+    :return: iterator over dicts of a file, one line (jsonl) or row (csv) at a time
+    """
+
+    if fmt == "csv":
+        return csv.DictReader(file)
+
+    return (json.loads(line) for line in file if line.strip())
+
+
+def read_checkpoint(path):
+    """
+    :return: number of records already imported, saved in a checkpoint file, 0 if there is no checkpoint
+    """
+
+    try:
+        with open(path) as file:
+            return json.load(file)["imported"]
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(path, imported):
+    temporary = f"{path}.tmp"
+
+    with open(temporary, "w") as file:
+        json.dump({"imported": imported}, file)
+
+    os.replace(temporary, path)
+
+
+def import_table(table_name, path, batch_size, fmt=None, checkpoint=None):
+    """
+    Imports a table from a jsonl or csv file (optionally gzip compressed), reading it record by record,
+    so memory usage doesn't depend on file size. Records are inserted with executemany, batch_size rows
+    per transaction. After every committed batch the number of imported records is saved
+    to the checkpoint file, an interrupted import started again with the same checkpoint skips them
+
+    :param table_name: one of TABLES
+    :param path: path of the data file
+    :param batch_size: number of rows per insert and transaction
+    :param fmt: "jsonl" or "csv", by default guessed from file extension
+    :param checkpoint: path of a checkpoint file, None - import is not resumable
+    :return: number of records imported by this call
+    """
+
+    if table_name not in TABLES:
+        raise BulkError(f"unknown table {table_name}, choose one of: {', '.join(TABLES)}")
+
+    table = TABLES[table_name]
+    fmt, compressed = file_format(path, fmt)
+    converters = column_converters(table)
+    defaults = column_defaults(table)
+
+    skipped = read_checkpoint(checkpoint) if checkpoint else 0
+    imported = 0
+
+    with open_text(path, "r", compressed) as file:
+        records = itertools.islice(read_records(file, fmt), skipped, None)
+
+        while True:
+            try:
+                batch = [
+                    prepare_row(record, converters, defaults, table_name)
+                    for record in itertools.islice(records, batch_size)
+                ]
+            except (ValueError, TypeError, KeyError) as e:
+                raise BulkError(f"invalid record after record {skipped + imported} of {path}: {e}")
+
+            if not batch:
+                break
+
+            first = skipped + imported + 1
+
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(table.insert(), batch)
+            except DBAPIError as e:
+                raise BulkError(f"records {first}-{first + len(batch) - 1} of {path} can't be inserted: {e.orig}")
+
+            imported += len(batch)
+
+            if checkpoint:
+                write_checkpoint(checkpoint, skipped + imported)
+
+    if table_name == "likes" and imported:
+        rebuild_like_rollup()
+
+    response_cache.bump(*CACHE_NAMESPACES[table_name])
+
+    return imported
+
+
+def export_value(value):
+    if isinstance(value, datetime.datetime):
+        return str(value)
+
+    return value
+
+
+def export_table(table_name, path, batch_size, fmt=None):
+    """
+    Writes all rows of a table to a jsonl or csv file (optionally gzip compressed) in primary key order.
+    Rows are read batch_size at a time with keyset pagination, so memory usage doesn't depend on table size.
+    The file is written under a temporary name and renamed when the export is complete
+
+    :return: number of exported rows
+    """
+
+    if table_name not in TABLES:
+        raise BulkError(f"unknown table {table_name}, choose one of: {', '.join(TABLES)}")
+
+    table = TABLES[table_name]
+    fmt, compressed = file_format(path, fmt)
+    columns = [column.name for column in table.columns]
+
+    temporary = f"{path}.part"
+    exported = 0
+    last_id = None
+
+    with open_text(temporary, "w", compressed) as file:
+        writer = None
+
+        if fmt == "csv":
+            writer = csv.writer(file)
+            writer.writerow(columns)
+
+        while True:
+            query = table.select().order_by(table.c.id).limit(batch_size)
+
+            if last_id is not None:
+                query = query.where(table.c.id > last_id)
+
+            rows = db.engine.execute(query).fetchall()
+
+            if not rows:
+                break
+
+            if writer is not None:
+                writer.writerows([export_value(row[column]) for column in columns] for row in rows)
+            else:
+                file.write("".join(
+                    json.dumps({column: export_value(row[column]) for column in columns}) + "\n" for row in rows
+                ))
+
+            exported += len(rows)
+            last_id = rows[-1]["id"]
+
+    os.replace(temporary, path)
+
+    return exported
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+from flask import Response, g, request
+from flask_restful.utils import unpack
+
+from src.app import app, api
+from src.compression import etag_matches
+from src.routing import PRIMARY_COOKIE
+
+
+CachedResponse = namedtuple("CachedResponse", ["status", "headers", "body", "etag"])
+
+
+class LRUBackend:
+    """
+    In-process cache backend. Keeps at most RESPONSE_CACHE_MAX_ENTRIES responses with bodies of at most
+    RESPONSE_CACHE_MAX_BYTES bytes in total, least recently used responses are evicted first.
+    Every worker process has its own copy, so versions bumped in one process are not seen by others
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+
+            if item is None:
+                return None
+
+            entry, expires_at = item
+
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+
+            return entry
+
+    def set(self, key, entry, ttl):
+        if len(entry.body) > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+
+            self._entries[key] = (entry, time.time() + ttl)
+            self._size += len(entry.body)
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def versions(self, namespaces):
+        with self._lock:
+            return [self._versions.get(namespace, 0) for namespace in namespaces]
+
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+
+        if item is not None:
+            self._size -= len(item[0].body)
+
+
+class LocalStore:
+    """
+    In-process stand-in for a shared key-value server. Implements the part of redis client interface,
+    used by SharedBackend, so the shared backend can run in development and tests without a server
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self._get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._get(key) or 0) + 1
+            self._data[key] = (str(value).encode("utf-8"), None)
+
+            return value
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+    def _get(self, key):
+        item = self._data.get(key)
+
+        if item is None:
+            return None
+
+        value, expires_at = item
+
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            return None
+
+        return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+class SharedBackend:
+    """
+    Cache backend for deployments with many worker processes: responses and versions are kept
+    in a shared key-value server (redis), so a write in one worker invalidates responses cached by all of them
+    """
+
+    def __init__(self, client):
+        """
+        :param client: redis client, or LocalStore
+        """
+
+        self.client = client
+
+    def get(self, key):
+        raw = self.client.get(f"response:{key}")
+
+        if raw is None:
+            return None
+
+        data = json.loads(raw)
+
+        return CachedResponse(data["status"], data["headers"], data["body"].encode("utf-8"), data["etag"])
+
+    def set(self, key, entry, ttl):
+        raw = json.dumps({
+            "status": entry.status,
+            "headers": entry.headers,
+            "body": entry.body.decode("utf-8"),
+            "etag": entry.etag
+        })
+
+        self.client.set(f"response:{key}", raw, ex=ttl)
+
+    def versions(self, namespaces):
+        return [int(version or 0) for version in self.client.mget([f"version:{name}" for name in namespaces])]
+
+    def bump(self, namespace):
+        self.client.incr(f"version:{namespace}")
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def create_backend(config):
+    """
+    Creates a cache backend, configured by RESPONSE_CACHE:
+    "local" - in-process LRU, "shared" - redis at RESPONSE_CACHE_URL (or LocalStore if url is not set),
+    None - caching is disabled
+    """
+
+    kind = config["RESPONSE_CACHE"]
+
+    if not kind:
+        return None
+
+    if kind == "local":
+        return LRUBackend(config["RESPONSE_CACHE_MAX_ENTRIES"], config["RESPONSE_CACHE_MAX_BYTES"])
+
+    if kind == "shared":
+        if not config["RESPONSE_CACHE_URL"]:
+            return SharedBackend(LocalStore())
+
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_URL is set, but redis package is not installed: pip3 install redis")
+
+        return SharedBackend(redis.Redis.from_url(config["RESPONSE_CACHE_URL"]))
+
+    raise ValueError(f"unknown RESPONSE_CACHE backend {kind}")
+
+
+class ResponseCache:
+    """
+    Caches responses of read endpoints. A cached response belongs to versions of namespaces (e.g. "posts")
+    it was computed with; a write bumps the version of its namespace, so older responses are never served again
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._configured = False
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    self._backend = create_backend(app.config)
+                    self._configured = True
+
+        return self._backend
+
+    def bump(self, *namespaces):
+        """
+        Invalidates all cached responses, computed with data from given namespaces
+        """
+
+        if self.backend is None:
+            return
+
+        for namespace in namespaces:
+            self.backend.bump(namespace)
+
+    def reset(self):
+        """
+        Drops all cached responses and recreates backend from current configuration
+        """
+
+        with self._lock:
+            if self._backend is not None:
+                self._backend.clear()
+
+            self._backend = None
+            self._configured = False
+
+
+response_cache = ResponseCache()
+
+
+# headers, that are set again when a cached response is sent
+RESET_HEADERS = ("Content-Length", "ETag")
+
+# headers, that describe only the call of the method (e.g. its timing): they are sent with the response
+# of the call, but not stored in the cache
+CALL_HEADERS = ("X-Query-Time-Ms",)
+
+
+def request_key(namespaces, versions):
+    """
+    :return: cache key of the current request: endpoint, versions of its namespaces, query string and body
+    """
+
+    digest = hashlib.sha1(request.query_string)
+    digest.update(b"\0")
+    digest.update(request.get_data())
+
+    version = ".".join(f"{name}{number}" for name, number in zip(namespaces, versions))
+
+    return f"{request.endpoint}:{version}:{digest.hexdigest()}"
+
+
+def cached(*namespaces, on_hit=None):
+    """
+    Decorator for GET methods of resources, which caches successful responses and adds strong ETag to them.
+    If a client sends a matching If-None-Match header (ETag of the response or of its compressed variant),
+    304 Not Modified is returned without a body.
+    Streamed responses (?stream=...) and responses to authenticated requests (X-Api-Key), which can differ
+    from user to user, are not cached. Clients, that have just written something (PRIMARY_COOKIE), bypass
+    the cache, which can hold a response read from a lagging replica. CALL_HEADERS are sent only with the response
+    of the method's call, not with the cached copies
+
+    :param namespaces: names of data the response depends on, e.g. "posts", "likes"
+    :param on_hit: function called when a response is taken from cache instead of calling the method
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            backend = response_cache.backend
+
+            if (backend is None or request.args.get("stream") or request.headers.get("X-Api-Key")
+                    or request.cookies.get(PRIMARY_COOKIE)):
+                return func(self, *args, **kwargs)
+
+            key = request_key(namespaces, backend.versions(namespaces))
+            entry = backend.get(key)
+            call_headers = None
+
+            if entry is None:
+                response = func(self, *args, **kwargs)
+
+                if not isinstance(response, Response):
+                    data, status, headers = unpack(response)
+                    response = api.make_response(data, status, headers=headers)
+
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+
+                body = response.get_data()
+                call_headers = {
+                    name: value for name, value in response.headers.items()
+                    if name not in RESET_HEADERS
+                }
+                headers = {name: value for name, value in call_headers.items() if name not in CALL_HEADERS}
+
+                entry = CachedResponse(200, headers, body, hashlib.sha1(body).hexdigest())
+                ttl = app.config["RESPONSE_CACHE_TTL"]
+
+                if g.get("used_replica"):
+                    # a lagging replica can miss writes, which have already bumped the versions of the key
+                    ttl = min(ttl, app.config["REPLICA_STICKY_SECONDS"])
+
+                if ttl > 0:
+                    backend.set(key, entry, ttl)
+            elif on_hit is not None:
+                on_hit()
+
+            if etag_matches(entry.etag):
+                response = Response(status=304)
+            else:
+                response = Response(entry.body, status=entry.status, headers=call_headers or entry.headers)
+
+            response.set_etag(entry.etag)
+
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,113 @@
+import zlib
+
+from flask import current_app, request
+
+
+# Content-Encoding -> zlib wbits of its format, in order of preference
+ENCODINGS = {
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS
+}
+
+
+def accepted_encoding():
+    """
+    :return: the best encoding of ENCODINGS, accepted by the client (Accept-Encoding header), None if there is none
+    """
+
+    return request.accept_encodings.best_match(list(ENCODINGS))
+
+
+def etag_matches(etag):
+    """
+    Checks If-None-Match of the request against an ETag of a response, which could be sent compressed:
+    compressed responses have the encoding appended to their ETag, e.g. "<etag>-gzip"
+    """
+
+    return any(request.if_none_match.contains(tag) for tag in [etag] + [f"{etag}-{name}" for name in ENCODINGS])
+
+
+def compressible(response):
+    config = current_app.config
+
+    return (
+        config["COMPRESSION_ENABLED"]
+        and 200 <= response.status_code < 300 and response.status_code != 204
+        and "Content-Encoding" not in response.headers
+        and not response.direct_passthrough
+        and response.mimetype in config["COMPRESSION_MIMETYPES"]
+    )
+
+
+def compress_stream(chunks, encoding, level, charset):
+    """
+    Compresses a streamed body chunk by chunk. Every chunk is flushed (Z_SYNC_FLUSH), so the client
+    receives it right away instead of when the compressor's buffer fills up
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode(charset)
+
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        if data:
+            yield data
+
+    yield compressor.flush()
+
+
+def compress_response(response):
+    """
+    after_request handler, which compresses responses with gzip or deflate, chosen by Accept-Encoding.
+    Only responses of COMPRESSION_MIMETYPES are compressed, and only if their body is at least
+    COMPRESSION_MIN_SIZE bytes long (streamed responses are always compressed, their size is unknown).
+    ETag of a compressed response gets "-<encoding>" suffix, so the variants have different ETags
+    """
+
+    if response.status_code == 304 and response.get_etag()[0]:
+        # tell the client which variant it has is still fresh
+        etag, weak = response.get_etag()
+        encoding = accepted_encoding()
+
+        if encoding and request.if_none_match.contains(f"{etag}-{encoding}"):
+            response.set_etag(f"{etag}-{encoding}", weak)
+
+        response.vary.add("Accept-Encoding")
+
+        return response
+
+    if not compressible(response):
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = accepted_encoding()
+
+    if encoding is None:
+        return response
+
+    level = current_app.config["COMPRESSION_LEVEL"]
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding, level, response.charset)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+
+        if len(body) < current_app.config["COMPRESSION_MIN_SIZE"]:
+            return response
+
+        compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODINGS[encoding])
+        response.set_data(compressor.compress(body) + compressor.flush())
+
+    response.headers["Content-Encoding"] = encoding
+
+    etag, weak = response.get_etag()
+
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+
+    return response
@@ -1,5 +1,194 @@
+import json
+import os
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.util import LRUCache
+
+
+def env_value(name, default=None):
+    """
+    Reads a setting from an environment variable. Settings with a bool, int or float default are parsed as json
+    (true/false, numbers), lists and tuples from a json array; any other setting (secret key, urls, directories,
+    names) is the raw string, so e.g. SECRET_KEY=12345 stays a string
+
+    :param name: name of the environment variable
+    :param default: value used if the variable is not set, its type is the type of the setting
+    :raise ValueError: if the value doesn't have the type of the default
+    """
+
+    value = os.environ.get(name)
+
+    if value is None:
+        return default
+
+    if isinstance(default, bool):
+        expected = (bool,)
+    elif isinstance(default, (int, float)):
+        expected = (int, float) if isinstance(default, float) else (int,)
+    elif isinstance(default, (list, tuple)):
+        expected = (list,)
+    else:
+        return value
+
+    try:
+        parsed = json.loads(value)
+    except ValueError:
+        parsed = None
+
+    if not isinstance(parsed, expected) or (isinstance(parsed, bool) and bool not in expected):
+        raise ValueError(f"{name} must be {type(default).__name__}, got {value!r}")
+
+    return type(default)(parsed)
+
+
+# name of the connect timeout argument of a DBAPI driver, by driver name of the database url
+CONNECT_TIMEOUT_ARGUMENTS = {
+    "mysql": "connect_timeout",
+    "mysql+mysqldb": "connect_timeout",
+    "mysql+pymysql": "connect_timeout",
+    "mysql+mysqlconnector": "connection_timeout",
+    "postgresql": "connect_timeout",
+    "postgresql+psycopg2": "connect_timeout"
+}
+
+
+def connect_args(uri, timeout):
+    """
+    :param uri: database url, its driver decides the name of the timeout argument
+    :param timeout: seconds to wait for a connection to the database
+    :return: connect_args of create_engine, empty if the driver is unknown (its own default timeout is used)
+    """
+
+    if not uri or not timeout:
+        return {}
+
+    argument = CONNECT_TIMEOUT_ARGUMENTS.get(make_url(uri).drivername)
+
+    return {argument: timeout} if argument else {}
+
+
+def override_from_env(config, defaults):
+    """
+    Sets every setting (upper case attribute) of defaults on config, the value is taken from the environment
+    variable with the same name (see env_value), if it is set
+    """
+
+    for name in dir(defaults):
+        if name.isupper():
+            setattr(config, name, env_value(name, getattr(defaults, name)))
+
+
 class BaseConfig:
-    pass
+    # default and maximal number of rows on a page of list endpoints
+    PAGE_SIZE = 100
+    MAX_PAGE_SIZE = 1000
+
+    # number of rows fetched from the database at a time in streamed responses (?stream=1)
+    STREAM_BATCH_SIZE = 1000
+
+    # responses of read endpoints are cached in RESPONSE_CACHE backend: "local" (in-process LRU), "shared"
+    # (redis at RESPONSE_CACHE_URL, or an in-process stand-in if url is not set) or None to disable caching.
+    # With several worker processes use "shared", local caches of other workers become fresh only after TTL
+    RESPONSE_CACHE = "local"
+    RESPONSE_CACHE_URL = None
+    RESPONSE_CACHE_TTL = 30
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+    # responses of COMPRESSION_MIMETYPES are compressed with gzip or deflate, if the client accepts it (Accept-Encoding),
+    # with zlib COMPRESSION_LEVEL (1 - fastest, 9 - smallest). Bodies shorter than COMPRESSION_MIN_SIZE bytes are sent
+    # as they are, streamed responses are compressed chunk by chunk
+    COMPRESSION_ENABLED = True
+    COMPRESSION_LEVEL = 6
+    COMPRESSION_MIN_SIZE = 1024
+    COMPRESSION_MIMETYPES = ("application/json", "application/x-ndjson", "text/plain")
+
+    # identical concurrent requests to analytics endpoints share one computation (per process), its result is also
+    # returned to identical requests during SINGLE_FLIGHT_REUSE_SECONDS after it has finished (0 - not reused)
+    SINGLE_FLIGHT_ENABLED = True
+    SINGLE_FLIGHT_REUSE_SECONDS = 0
+
+    # request latency, SQL and commit metrics at /metrics; requests slower than METRICS_SLOW_REQUEST_SECONDS
+    # are logged with their first METRICS_SLOW_STATEMENTS statements, the slowest are kept at /metrics/slow
+    METRICS_ENABLED = True
+    METRICS_SLOW_REQUEST_SECONDS = 1.0
+    METRICS_SLOW_REQUESTS_KEPT = 20
+    METRICS_SLOW_STATEMENTS = 50
+
+    # read-only endpoints query "replica" database from SQLALCHEMY_BINDS, if it is configured;
+    # after a replica failure they read from primary database for REPLICA_RETRY_SECONDS.
+    # A client, that has written something, reads from primary for REPLICA_STICKY_SECONDS (a cookie), so it sees
+    # its writes despite replication lag; responses read from the replica are cached for at most as long,
+    # because they can be older than the cache version they are stored under. Other clients can still
+    # read data up to replication lag old, REPLICA_STICKY_SECONDS should be longer than the lag
+    REPLICA_RETRY_SECONDS = 30
+    REPLICA_STICKY_SECONDS = 5
+
+    # production server (python -m src serve): address, number of worker processes, number of requests
+    # after which a worker is replaced (plus random jitter), seconds given to workers to finish on shutdown
+    SERVER_BIND = "127.0.0.1:5000"
+    SERVER_WORKERS = os.cpu_count() or 2
+    SERVER_MAX_REQUESTS = 10000
+    SERVER_MAX_REQUESTS_JITTER = 1000
+    SERVER_GRACEFUL_TIMEOUT = 30
+
+    # rows per insert and transaction of python -m src import, rows per query of python -m src export
+    BULK_BATCH_SIZE = 5000
+
+    # full-text search of posts: "auto" - MySQL FULLTEXT index if the database is MySQL, otherwise in-process index,
+    # "fulltext" or "index" to force one of them. The in-process index reads posts created by other processes
+    # at most every SEARCH_INDEX_REFRESH_SECONDS, looking SEARCH_INDEX_LAG_SECONDS back for late commits
+    SEARCH_BACKEND = "auto"
+    SEARCH_INDEX_REFRESH_SECONDS = 1.0
+    SEARCH_INDEX_LAG_SECONDS = 60
+
+    # trending posts: likes of the last TRENDING_WINDOW_SECONDS are counted in TRENDING_BUCKET_SECONDS buckets,
+    # a like loses half of its weight every TRENDING_HALF_LIFE_SECONDS, TRENDING_SIZE best posts are kept, counters
+    # are rebuilt from the like table by a background thread every TRENDING_REBUILD_SECONDS (0 - only on first use)
+    TRENDING_WINDOW_SECONDS = 24 * 3600
+    TRENDING_BUCKET_SECONDS = 300
+    TRENDING_HALF_LIFE_SECONDS = 6 * 3600
+    TRENDING_SIZE = 100
+    TRENDING_REBUILD_SECONDS = 300
+
+    # write-behind likes: toggles are kept in memory and written every LIKE_BUFFER_FLUSH_INTERVAL seconds,
+    # LIKE_BUFFER_BATCH_SIZE likes per transaction. LIKE_BUFFER_DURABILITY: "none" - toggles not written yet are lost
+    # if a process crashes, "write" - they are journaled to LIKE_BUFFER_JOURNAL_DIR (lost only if the machine crashes),
+    # "fsync" - every journal write is forced to disk
+    LIKE_BUFFER_ENABLED = False
+    LIKE_BUFFER_FLUSH_INTERVAL = 1.0
+    LIKE_BUFFER_BATCH_SIZE = 1000
+    LIKE_BUFFER_DURABILITY = "write"
+    LIKE_BUFFER_JOURNAL_DIR = "like_journal"
+
+    # maximal number of items in a request to batch endpoints
+    MAX_BATCH_SIZE = 1000
+
+    # activity log records are written in batches by a background thread, unless ACTIVITY_LOG_ASYNC is False.
+    # A failed batch is written again up to ACTIVITY_LOG_INSERT_ATTEMPTS times in total, waiting
+    # ACTIVITY_LOG_RETRY_DELAY seconds before the first retry and twice as long before every next one
+    ACTIVITY_LOG_ASYNC = True
+    ACTIVITY_LOG_QUEUE_SIZE = 10000
+    ACTIVITY_LOG_BATCH_SIZE = 500
+    ACTIVITY_LOG_FLUSH_INTERVAL = 1.0
+    ACTIVITY_LOG_PUT_TIMEOUT = 1.0
+    ACTIVITY_LOG_INSERT_ATTEMPTS = 3
+    ACTIVITY_LOG_RETRY_DELAY = 0.5
+
+    # activity log retention (python -m src archive-activities): activities older than ACTIVITY_RETENTION_DAYS days
+    # are moved to gzip compressed jsonl files in ACTIVITY_ARCHIVE_DIR/YYYY-MM-DD/, ACTIVITY_ARCHIVE_CHUNK_SIZE rows
+    # at a time, and deleted ACTIVITY_ARCHIVE_DELETE_BATCH_SIZE rows per transaction with ACTIVITY_ARCHIVE_DELETE_PAUSE
+    # seconds between transactions. With ACTIVITY_ARCHIVE_QUERY /api/analytics/user also returns archived activities
+    ACTIVITY_RETENTION_DAYS = 90
+    ACTIVITY_ARCHIVE_DIR = "activity_archive"
+    ACTIVITY_ARCHIVE_CHUNK_SIZE = 10000
+    ACTIVITY_ARCHIVE_DELETE_BATCH_SIZE = 1000
+    ACTIVITY_ARCHIVE_DELETE_PAUSE = 0.0
+    ACTIVITY_ARCHIVE_QUERY = False
+
+    # verified tokens are cached for TOKEN_CACHE_TTL seconds, so authentication doesn't query user table
+    TOKEN_CACHE_SIZE = 10000
+    TOKEN_CACHE_TTL = 60
 
 
 class DevConfig(BaseConfig):
@@ -11,3 +200,70 @@ class DevConfig(BaseConfig):
     DB_HOST = "localhost"
     SQLALCHEMY_DATABASE_URI = f"mysql+mysqlconnector://{DB_USERNAME}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
     SECRET_KEY = "1"
+
+
+class ProductionConfig(BaseConfig):
+    """
+    Every setting, including the ones inherited from BaseConfig, is read from an environment variable
+    with the same name, e.g. SQLALCHEMY_DATABASE_URI, SECRET_KEY, DB_POOL_SIZE, RESPONSE_CACHE
+    """
+
+    DEBUG = False
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_DATABASE_URI = env_value("SQLALCHEMY_DATABASE_URI")
+    SECRET_KEY = env_value("SECRET_KEY")
+
+    # connections kept in the pool of every process, and extra connections opened under load
+    DB_POOL_SIZE = env_value("DB_POOL_SIZE", 10)
+    DB_MAX_OVERFLOW = env_value("DB_MAX_OVERFLOW", 20)
+    # seconds to wait for a free connection from the pool
+    DB_POOL_TIMEOUT = env_value("DB_POOL_TIMEOUT", 10)
+    # connections are reopened after DB_POOL_RECYCLE seconds, before MySQL wait_timeout closes them
+    DB_POOL_RECYCLE = env_value("DB_POOL_RECYCLE", 1800)
+    # connections are checked with a lightweight ping when taken from the pool
+    DB_POOL_PRE_PING = env_value("DB_POOL_PRE_PING", True)
+    # seconds to wait for a new connection, passed to the drivers of CONNECT_TIMEOUT_ARGUMENTS
+    # (the replica gets the same arguments, it must use the driver of SQLALCHEMY_DATABASE_URI)
+    DB_CONNECT_TIMEOUT = env_value("DB_CONNECT_TIMEOUT", 10)
+    # number of compiled SQL statements cached by every engine, 0 disables the cache
+    DB_STATEMENT_CACHE_SIZE = env_value("DB_STATEMENT_CACHE_SIZE", 500)
+
+    # optional read replica, used by read-only endpoints
+    REPLICA_DATABASE_URI = env_value("REPLICA_DATABASE_URI")
+    SQLALCHEMY_BINDS = {"replica": REPLICA_DATABASE_URI} if REPLICA_DATABASE_URI else None
+
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args(SQLALCHEMY_DATABASE_URI, DB_CONNECT_TIMEOUT)
+    }
+
+    if DB_STATEMENT_CACHE_SIZE:
+        SQLALCHEMY_ENGINE_OPTIONS["execution_options"] = {"compiled_cache": LRUCache(DB_STATEMENT_CACHE_SIZE)}
+
+
+override_from_env(ProductionConfig, BaseConfig)
+
+
+class TestConfig(BaseConfig):
+    """
+    Configuration for tests: in-memory SQLite database (or TEST_DATABASE_URI),
+    activity log is written synchronously
+    """
+
+    TESTING = True
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get("TEST_DATABASE_URI", "sqlite://")
+    SECRET_KEY = "test"
+    ACTIVITY_LOG_ASYNC = False
+
+
+# configuration profiles, selected by APP_CONFIG environment variable
+profiles = {
+    "dev": DevConfig,
+    "production": ProductionConfig,
+    "test": TestConfig
+}
@@ -0,0 +1,106 @@
+import json
+from collections import namedtuple
+
+from flask import Response, request
+
+from src.models import User, Post
+
+
+Field = namedtuple("Field", ["columns", "value"])
+
+
+class InvalidFields(ValueError):
+    """
+    Raised when a client requests fields, that a resource doesn't have
+    """
+
+
+def column_field(column):
+    return Field((column,), lambda row: getattr(row, column.key))
+
+
+def date_field(column):
+    return Field((column,), lambda row: str(getattr(row, column.key).date()))
+
+
+def time_field(column):
+    return Field((column,), lambda row: getattr(row, column.key).strftime("%H:%M:%S"))
+
+
+# fields of list endpoints in the order of User.json() and Post.json(): name -> columns it is read from,
+# function which computes it from a row with these columns
+USER_FIELDS = {
+    "id": column_field(User.id),
+    "name": column_field(User.name),
+    "surname": column_field(User.surname),
+    "username": column_field(User.username),
+    "password": column_field(User.password)
+}
+
+POST_FIELDS = {
+    "id": column_field(Post.id),
+    "author_id": column_field(Post.author_id),
+    "text": column_field(Post.text),
+    "uuid": column_field(Post.uuid),
+    "date": date_field(Post.created_at),
+    "time": time_field(Post.created_at)
+}
+
+
+def requested_fields(available, computed=()):
+    """
+    Reads ?fields=name,name,... from the query string
+
+    :param available: dict of fields, read from columns, e.g. POST_FIELDS
+    :param computed: names of other fields of the resource, e.g. "like_count"
+    :return: list of requested field names, all fields if the parameter is not passed
+    """
+
+    value = request.args.get("fields")
+
+    if not value:
+        return list(available) + list(computed)
+
+    fields = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in fields if name not in available and name not in computed]
+
+    if unknown or not fields:
+        raise InvalidFields(f"unknown fields {', '.join(unknown)}, "
+                            f"choose from: {', '.join(list(available) + list(computed))}")
+
+    return list(dict.fromkeys(fields))
+
+
+def project(query, fields, available, id_column):
+    """
+    Makes a query select only columns of the requested fields (and the primary key, needed for pagination),
+    so rows are returned as tuples instead of ORM objects
+    """
+
+    columns = [id_column]
+
+    for name in fields:
+        for column in available[name].columns if name in available else ():
+            if column not in columns:
+                columns.append(column)
+
+    return query.with_entities(*columns)
+
+
+def serializer(fields, available):
+    """
+    :return: function, that turns a row of a projected query into json with the requested fields
+    """
+
+    values = [(name, available[name].value) for name in fields if name in available]
+
+    return lambda row: {name: value(row) for name, value in values}
+
+
+def json_response(data, status=200, headers=None):
+    """
+    Encodes a response body with compact separators, without flask-restful's per-response formatting
+    """
+
+    return Response(json.dumps(data, separators=(",", ":")), status=status, headers=headers,
+                    mimetype="application/json")
@@ -0,0 +1,463 @@
+import atexit
+import datetime
+import glob
+import json
+import os
+import threading
+
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+
+from src.app import app, db
+from src.cache import response_cache
+from src.likes import bump_daily_likes, post_like_count
+from src.models import Like, Post, from_timestamp
+from src.trending import trending_posts
+
+
+class PendingLike:
+    """
+    Not yet written state of a (user, post) like: base - whether the like exists in the database,
+    liked - whether it should exist after the flush, moment - time of the last toggle
+    """
+
+    __slots__ = ("base", "liked", "moment")
+
+    def __init__(self, base, liked, moment):
+        self.base = base
+        self.liked = liked
+        self.moment = moment
+
+
+class LikeBuffer:
+    """
+    Write-behind mode of likes (LIKE_BUFFER_ENABLED). A toggle only changes the wanted state of a (user, post)
+    like in memory, so like/unlike pairs cancel out, and every LIKE_BUFFER_FLUSH_INTERVAL seconds a background
+    thread writes the changed likes with one DELETE and one multi-row INSERT per LIKE_BUFFER_BATCH_SIZE likes.
+    Like counts, liked_by_me and like statistics, returned by this process, include not yet written changes;
+    "likes" cache namespace is bumped on every toggle and again when the likes are written.
+
+    With LIKE_BUFFER_DURABILITY "write" or "fsync" every toggle is also appended to a journal file
+    in LIKE_BUFFER_JOURNAL_DIR ("fsync" - and forced to disk), journals of crashed processes are replayed by recover()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # journal writes (and fsyncs) don't hold _lock, so readers of pending likes don't wait for the disk.
+        # Lock order: _lock, then _journal_lock
+        self._journal_lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stopping = None
+        self._pending = {}
+        self._flushing = {}
+        self._deltas = {}
+        self._flushing_deltas = {}
+        self._journal = None
+        self._generation = 0
+
+    @property
+    def enabled(self):
+        return app.config["LIKE_BUFFER_ENABLED"]
+
+    def toggle(self, user_id, post_uuid):
+        """
+        Same as likes.toggle_like, but the change is written to the database later
+
+        :return: tuple (post_id, like, like_count), where like is json of the like, or None if the post was unliked;
+        None if there is no post with such uuid
+        """
+
+        post = db.session.query(Post.id).filter(Post.uuid == post_uuid).first()
+
+        if post is None:
+            db.session.rollback()
+            return None
+
+        post_id = post.id
+        key = (user_id, post_id)
+
+        with self._lock:
+            known = key in self._pending or key in self._flushing
+
+        base = None
+
+        if not known:
+            liked = db.session.query(Like.id).filter(Like.user_id == user_id, Like.post_id == post_id)
+            base = liked.first() is not None
+
+        self._ensure_started()
+
+        with self._lock:
+            entry = self._pending.get(key)
+
+            if entry is None:
+                flushing = self._flushing.get(key)
+                base = flushing.liked if flushing is not None else base
+
+                if base is None:
+                    # was being flushed during the lookup above, the database has it now
+                    base = db.session.query(Like.id).filter(
+                        Like.user_id == user_id, Like.post_id == post_id
+                    ).first() is not None
+
+                entry = self._pending[key] = PendingLike(base, base, None)
+
+            entry.liked = not entry.liked
+            entry.moment = datetime.datetime.now()
+            self._deltas[post_id] = self._deltas.get(post_id, 0) + (1 if entry.liked else -1)
+
+            liked, moment = entry.liked, entry.moment
+
+            # a reverted like is dropped, unless it is being flushed: if the flush fails, its state must not come back
+            if entry.liked == entry.base and key not in self._flushing:
+                del self._pending[key]
+
+        # a journal, rotated by a flush meanwhile, only makes the toggle be replayed again after a crash,
+        # which doesn't change the like: the latest toggle of the key is replayed in any case
+        self._append_journal(user_id, post_id, liked, moment)
+
+        like_count = post_like_count(post_id) + self.pending_delta(post_id)
+        db.session.rollback()
+
+        if not liked:
+            return post_id, None, like_count
+
+        like = {"user_id": user_id, "post_id": post_id, "date": str(moment.date()), "time": moment.strftime("%H:%M:%S")}
+
+        return post_id, like, like_count
+
+    def pending_delta(self, post_id):
+        """
+        :return: change of the number of likes of a post, that is not written to the database yet
+        """
+
+        with self._lock:
+            return self._deltas.get(post_id, 0) + self._flushing_deltas.get(post_id, 0)
+
+    def adjust_counts(self, like_counts):
+        """
+        Adds not yet written changes to a dict {post_id: number of likes}
+        """
+
+        with self._lock:
+            return {
+                post_id: count + self._deltas.get(post_id, 0) + self._flushing_deltas.get(post_id, 0)
+                for post_id, count in like_counts.items()
+            }
+
+    def adjust_liked(self, user_id, post_ids, liked):
+        """
+        Applies not yet written changes to a set of posts, liked by a user
+
+        :param post_ids: ids of posts the set was computed for
+        :param liked: set of ids of liked posts, read from the database
+        """
+
+        liked = set(liked)
+
+        with self._lock:
+            for post_id in post_ids:
+                entry = self._pending.get((user_id, post_id)) or self._flushing.get((user_id, post_id))
+
+                if entry is not None:
+                    (liked.add if entry.liked else liked.discard)(post_id)
+
+        return liked
+
+    def adjust_post(self, user_id, post_id, like_count, liked):
+        """
+        Same as adjust_counts and adjust_liked for a single post, e.g. a row of a streamed response
+
+        :param user_id: id of the user, liked was read for, None - liked is not adjusted
+        :return: tuple (like_count, liked)
+        """
+
+        with self._lock:
+            like_count += self._deltas.get(post_id, 0) + self._flushing_deltas.get(post_id, 0)
+
+            if user_id is not None:
+                entry = self._pending.get((user_id, post_id)) or self._flushing.get((user_id, post_id))
+                liked = entry.liked if entry is not None else liked
+
+        return like_count, liked
+
+    def adjust_daily(self, post_id, counts):
+        """
+        Applies not yet written changes of likes of a post to its numbers of likes by date. A new like is counted
+        on the date of the toggle, a removed like on the date it was given, which is read from the like table
+
+        :param counts: dict {date: number of likes}, read from post_like_daily table
+        :return: adjusted dict
+        """
+
+        with self._lock:
+            entries = {user_id: (entry.liked, entry.moment) for (user_id, entry_post_id), entry
+                       in self._flushing.items() if entry_post_id == post_id}
+            entries.update((user_id, (entry.liked, entry.moment)) for (user_id, entry_post_id), entry
+                           in self._pending.items() if entry_post_id == post_id)
+
+        if not entries:
+            return counts
+
+        existing = dict(db.session.query(Like.user_id, Like.created_at).filter(
+            Like.post_id == post_id, Like.user_id.in_(list(entries))
+        ))
+
+        counts = dict(counts)
+
+        for user_id, (liked, moment) in entries.items():
+            if liked and user_id not in existing:
+                date, delta = moment.date(), 1
+            elif not liked and user_id in existing:
+                date, delta = existing[user_id].date(), -1
+            else:
+                continue
+
+            counts[date] = counts.get(date, 0) + delta
+
+        return counts
+
+    def flush(self):
+        """
+        Writes all pending likes to the database. If writing fails, they stay pending and are written by the next flush
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending and self._journal is None:
+                    return
+
+                # the journal is rotated and removed even if its toggles cancelled out,
+                # otherwise recover() would replay them over newer likes
+                self._flushing, self._pending = self._pending, {}
+                self._flushing_deltas, self._deltas = self._deltas, {}
+                generation = self._rotate_journal()
+
+            try:
+                with app.app_context():
+                    self._write(self._flushing)
+                    db.session.remove()
+            except Exception:
+                app.logger.exception(f"failed to write {len(self._flushing)} buffered likes")
+
+                with self._lock:
+                    # toggles made during the flush are newer than the flushed ones. Batches written before
+                    # the failure are committed, so the database can have either state: every key is written again
+                    for key, entry in self._flushing.items():
+                        self._pending.setdefault(key, entry).base = None
+
+                    self._flushing = {}
+
+                    for post_id, delta in self._flushing_deltas.items():
+                        self._deltas[post_id] = self._deltas.get(post_id, 0) + delta
+
+                    self._flushing_deltas = {}
+
+                return
+
+            with self._lock:
+                self._flushing = {}
+                self._flushing_deltas = {}
+
+            self._remove_journals(os.getpid(), generation)
+
+    def _write(self, states):
+        """
+        Brings likes in the database to the wanted states, LIKE_BUFFER_BATCH_SIZE likes per transaction
+
+        :param states: dict {(user_id, post_id): PendingLike}
+        """
+
+        keys = list(states)
+        batch_size = app.config["LIKE_BUFFER_BATCH_SIZE"]
+
+        for start in range(0, len(keys), batch_size):
+            batch = {key: states[key] for key in keys[start:start + batch_size]}
+
+            try:
+                changes = self._write_batch(batch)
+            except IntegrityError:
+                # a like was inserted by another process meanwhile, the next attempt sees it
+                db.session.rollback()
+                changes = self._write_batch(batch)
+
+            for post_id, delta, moment in changes:
+                trending_posts.record(post_id, delta, moment)
+
+        if keys:
+            # cached responses of other processes don't include the written likes yet
+            response_cache.bump("likes")
+
+    def _write_batch(self, batch):
+        existing = db.session.query(Like.id, Like.user_id, Like.post_id, Like.created_at).filter(
+            tuple_(Like.user_id, Like.post_id).in_(list(batch))
+        ).all()
+
+        existing_keys = {(user_id, post_id) for _, user_id, post_id, _ in existing}
+
+        # a like given after the unlike (by another process) is newer than the wanted state and is kept
+        deleted = [(like_id, post_id, created_at) for like_id, user_id, post_id, created_at in existing
+                   if not batch[(user_id, post_id)].liked and created_at <= batch[(user_id, post_id)].moment]
+        inserted = [{"user_id": user_id, "post_id": post_id, "created_at": entry.moment}
+                    for (user_id, post_id), entry in batch.items()
+                    if entry.liked and (user_id, post_id) not in existing_keys]
+
+        if deleted:
+            db.session.query(Like).filter(
+                Like.id.in_([like_id for like_id, _, _ in deleted])
+            ).delete(synchronize_session=False)
+
+        if inserted:
+            db.session.execute(Like.__table__.insert(), inserted)
+
+        deltas = {}
+
+        for _, post_id, created_at in deleted:
+            deltas[(post_id, created_at.date())] = deltas.get((post_id, created_at.date()), 0) - 1
+
+        for like in inserted:
+            key = (like["post_id"], like["created_at"].date())
+            deltas[key] = deltas.get(key, 0) + 1
+
+        for (post_id, date), delta in deltas.items():
+            bump_daily_likes(post_id, date, delta)
+
+        db.session.commit()
+
+        return ([(post_id, -1, created_at) for _, post_id, created_at in deleted] +
+                [(like["post_id"], 1, like["created_at"]) for like in inserted])
+
+    def stop(self):
+        """
+        Stops the background thread and writes all pending likes
+        """
+
+        if self._running():
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+        with self._lock, self._journal_lock:
+            if self._journal is not None and self._pid == os.getpid():
+                self._journal.close()
+                self._journal = None
+
+    def _running(self):
+        return self._thread is not None and self._pid == os.getpid()
+
+    def _ensure_started(self):
+        if self._running():
+            return
+
+        with self._lock:
+            # a forked worker process inherits pending likes of the master (there are none) but not the thread
+            if self._running():
+                return
+
+            self._pid = os.getpid()
+            self._journal = None
+            self._stopping = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="like-buffer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.wait(app.config["LIKE_BUFFER_FLUSH_INTERVAL"]):
+            self.flush()
+
+    def _journal_path(self, pid):
+        return os.path.join(app.config["LIKE_BUFFER_JOURNAL_DIR"], f"likes-{pid}.journal")
+
+    def _append_journal(self, user_id, post_id, liked, moment):
+        durability = app.config["LIKE_BUFFER_DURABILITY"]
+
+        if durability == "none":
+            return
+
+        line = json.dumps([user_id, post_id, liked, str(moment)]) + "\n"
+
+        with self._journal_lock:
+            if self._journal is None:
+                os.makedirs(app.config["LIKE_BUFFER_JOURNAL_DIR"], exist_ok=True)
+                self._journal = open(self._journal_path(os.getpid()), "a")
+
+            self._journal.write(line)
+            self._journal.flush()
+
+            if durability == "fsync":
+                os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        """
+        Renames the journal of pending likes, that are about to be flushed, so it can be removed after the flush
+
+        :return: number of the renamed journal
+        """
+
+        self._generation += 1
+
+        with self._journal_lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+                path = self._journal_path(os.getpid())
+                os.replace(path, f"{path}.{self._generation}")
+
+        return self._generation
+
+    def _remove_journals(self, pid, generation):
+        for path in glob.glob(f"{self._journal_path(pid)}.*"):
+            if int(path.rsplit(".", 1)[1]) <= generation:
+                os.remove(path)
+
+    def recover(self, pid=None):
+        """
+        Writes likes from journals of processes, that exited without flushing them, to the database:
+        for every (user, post) the latest toggle of all journals, unless the like in the database is newer.
+        Must be called when the processes are not running: by the server before it starts workers,
+        or after a worker has died
+
+        :param pid: process id, whose journals are replayed, None - journals of all processes
+        :return: number of replayed likes
+        """
+
+        directory = app.config["LIKE_BUFFER_JOURNAL_DIR"]
+        pattern = f"likes-{pid if pid is not None else '*'}.journal*"
+        paths = glob.glob(os.path.join(directory, pattern))
+
+        states = {}
+
+        for path in paths:
+            with open(path) as file:
+                for line in file:
+                    try:
+                        user_id, post_id, liked, moment = json.loads(line)
+                        moment = from_timestamp(moment)
+                    except ValueError:
+                        # the last line can be cut by a crash
+                        continue
+
+                    # journals of different processes overlap in time, the latest toggle wins
+                    state = states.get((user_id, post_id))
+
+                    if state is None or moment >= state.moment:
+                        states[(user_id, post_id)] = PendingLike(None, liked, moment)
+
+        if states:
+            with app.app_context():
+                self._write(states)
+                db.session.remove()
+
+        for path in paths:
+            os.remove(path)
+
+        return len(states)
+
+
+like_buffer = LikeBuffer()
+
+atexit.register(like_buffer.stop)
@@ -0,0 +1,302 @@
+from src.app import db
+from src.models import Like, Post, PostLikeDaily
+from src.trending import trending_posts
+
+import datetime
+
+from sqlalchemy import func, null
+from sqlalchemy.dialects import mysql
+from sqlalchemy.exc import IntegrityError
+
+
+class ConcurrentLikeChange(Exception):
+    """
+    Raised when likes of a batch were changed by another transaction while the batch was applied
+    """
+
+
+def bump_daily_likes(post_id, date, delta):
+    """
+    Adds delta to the number of likes of a post on a date in post_like_daily table.
+    Runs in the current transaction, so it is committed together with the like itself
+
+    :param post_id: id of a liked/unliked post
+    :param date: date of the like
+    :param delta: 1 for a new like, -1 for a deleted one
+    """
+
+    table = PostLikeDaily.__table__
+
+    if db.engine.dialect.name == "mysql":
+        statement = mysql.insert(table).values(post_id=post_id, date=date, count=delta)
+        db.session.execute(statement.on_duplicate_key_update(count=table.c.count + delta))
+        return
+
+    updated = db.session.execute(
+        table.update().where(
+            (table.c.post_id == post_id) & (table.c.date == date)
+        ).values(count=table.c.count + delta)
+    ).rowcount
+
+    if not updated:
+        db.session.execute(table.insert().values(post_id=post_id, date=date, count=delta))
+
+
+def post_like_count(post_id):
+    """
+    :return: number of likes of a post, summed over its rows in post_like_daily
+    """
+
+    count = db.session.query(func.sum(PostLikeDaily.count)).filter(PostLikeDaily.post_id == post_id).scalar()
+
+    return int(count or 0)
+
+
+def post_like_counts(post_ids):
+    """
+    :return: dict {post_id: number of likes} for given posts, computed with one grouped query
+    """
+
+    like_counts = {post_id: 0 for post_id in post_ids}
+
+    if not post_ids:
+        return like_counts
+
+    counts = db.session.query(PostLikeDaily.post_id, func.sum(PostLikeDaily.count)).filter(
+        PostLikeDaily.post_id.in_(post_ids)
+    ).group_by(PostLikeDaily.post_id)
+
+    for post_id, count in counts:
+        like_counts[post_id] = int(count or 0)
+
+    return like_counts
+
+
+def liked_post_ids(user_id, post_ids):
+    """
+    :return: set of ids of given posts, liked by the user, found with one query of (user_id, post_id) key
+    """
+
+    if not post_ids:
+        return set()
+
+    return {post_id for post_id, in db.session.query(Like.post_id).filter(
+        Like.user_id == user_id,
+        Like.post_id.in_(post_ids)
+    )}
+
+
+def posts_with_likes(query, user_id=None):
+    """
+    Adds the number of likes (and whether the user likes the post, if user_id is passed) to a query of posts:
+    post_like_daily is summed per post in one grouped subquery, which is outer joined to posts
+
+    :return: query of tuples with like_count and liked_by_me columns added, liked_by_me is None without user_id
+    """
+
+    counts = db.session.query(
+        PostLikeDaily.post_id, func.sum(PostLikeDaily.count).label("like_count")
+    ).group_by(PostLikeDaily.post_id).subquery()
+
+    query = query.outerjoin(counts, counts.c.post_id == Post.id).add_columns(counts.c.like_count)
+
+    if user_id is None:
+        return query.add_columns(null().label("liked_by_me"))
+
+    return query.outerjoin(
+        Like, (Like.post_id == Post.id) & (Like.user_id == user_id)
+    ).add_columns(Like.id.isnot(None).label("liked_by_me"))
+
+
+def toggle_like(user_id, post_uuid):
+    """
+    Likes a post if the user doesn't like it yet, otherwise unlikes it. The like/unlike and post_like_daily update
+    are done in one transaction, which doesn't lock anything in advance: if a concurrent request of the same user
+    has already brought the like to the same state, the unique (user_id, post_id) key or the delete row count
+    shows it, and this toggle changes nothing instead of creating a duplicate like.
+    The post, the like and the number of likes are read by one query, the new number is computed from it
+
+    :param user_id: id of a user who likes/unlikes the post
+    :param post_uuid: uuid of the post
+    :return: tuple (post_id, like, like_count), where like is json of the new like, or None if the post was unliked;
+    None if there is no post with such uuid
+    """
+
+    like_count = db.session.query(func.sum(PostLikeDaily.count)).filter(
+        PostLikeDaily.post_id == Post.id
+    ).correlate(Post).as_scalar()
+
+    row = db.session.query(Post.id, Like.id, Like.created_at, like_count).outerjoin(
+        Like, (Like.post_id == Post.id) & (Like.user_id == user_id)
+    ).filter(Post.uuid == post_uuid).first()
+
+    if row is None:
+        return None
+
+    post_id, like_id, liked_at, like_count = row
+    like_count = int(like_count or 0)
+
+    if like_id is not None:
+        deleted = db.session.query(Like).filter(Like.id == like_id).delete(synchronize_session=False)
+
+        if deleted:
+            bump_daily_likes(post_id, liked_at.date(), -1)
+
+        # if nothing was deleted, a concurrent request has deleted the like, which the count included
+        like_count -= 1
+        db.session.commit()
+
+        if deleted:
+            trending_posts.record(post_id, -1, liked_at)
+
+        return post_id, None, like_count
+
+    like = Like(user_id=user_id, post_id=post_id, created_at=datetime.datetime.now())
+    created = True
+
+    try:
+        db.session.add(like)
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+
+        # only a duplicate (user_id, post_id) means, that a concurrent request has liked the post first
+        like = Like.query.filter(Like.user_id == user_id, Like.post_id == post_id).first()
+
+        if like is None:
+            raise
+
+        created = False
+    else:
+        bump_daily_likes(post_id, like.created_at.date(), 1)
+
+    like_json = like.json()
+    like_count += 1
+    liked_at = like.created_at
+    db.session.commit()
+
+    if created:
+        trending_posts.record(post_id, 1, liked_at)
+
+    return post_id, like_json, like_count
+
+
+def toggle_likes(user_id, post_uuids, attempts=3):
+    """
+    Likes/unlikes a list of posts by one user in a single transaction, as if toggle_like was called
+    for every uuid in order (so a uuid passed twice ends up unchanged). Likes are deleted with one
+    DELETE and inserted with one multi-row INSERT. If another transaction changes the same likes
+    meanwhile, the whole batch is rolled back and applied again
+
+    :param user_id: id of a user who likes/unlikes posts
+    :param post_uuids: list of post uuids
+    :param attempts: how many times the batch is applied before ConcurrentLikeChange is raised
+    :return: list of results for every uuid: tuple (post_id, liked, like_count), or None if there is no such post.
+    liked is the state right after this uuid was toggled, like_count is the number of post's likes after the whole batch
+    """
+
+    for attempt in range(attempts):
+        try:
+            return _toggle_likes(user_id, post_uuids)
+        except ConcurrentLikeChange:
+            db.session.rollback()
+
+    raise ConcurrentLikeChange(f"likes of user {user_id} were changed concurrently")
+
+
+def _toggle_likes(user_id, post_uuids):
+    rows = db.session.query(Post.uuid, Post.id, Like.id, Like.created_at).outerjoin(
+        Like, (Like.post_id == Post.id) & (Like.user_id == user_id)
+    ).filter(Post.uuid.in_(set(post_uuids))).all()
+
+    posts = {post_uuid: (post_id, like_id, liked_at) for post_uuid, post_id, like_id, liked_at in rows}
+    liked = {post_id: like_id is not None for post_id, like_id, liked_at in posts.values()}
+
+    states = []
+
+    for post_uuid in post_uuids:
+        if post_uuid not in posts:
+            states.append(None)
+            continue
+
+        post_id = posts[post_uuid][0]
+        liked[post_id] = not liked[post_id]
+        states.append((post_id, liked[post_id]))
+
+    unliked = [(post_id, like_id, liked_at) for post_id, like_id, liked_at in posts.values()
+               if like_id is not None and not liked[post_id]]
+    now = datetime.datetime.now()
+    today = now.date()
+    new_likes = [{"user_id": user_id, "post_id": post_id, "created_at": now}
+                 for post_id, like_id, liked_at in posts.values() if like_id is None and liked[post_id]]
+
+    if unliked:
+        deleted = db.session.query(Like).filter(
+            Like.id.in_([like_id for post_id, like_id, liked_at in unliked])
+        ).delete(synchronize_session=False)
+
+        if deleted != len(unliked):
+            raise ConcurrentLikeChange()
+
+    if new_likes:
+        try:
+            db.session.execute(Like.__table__.insert(), new_likes)
+        except IntegrityError:
+            raise ConcurrentLikeChange()
+
+    deltas = {}
+
+    for post_id, like_id, liked_at in unliked:
+        deltas[(post_id, liked_at.date())] = deltas.get((post_id, liked_at.date()), 0) - 1
+
+    for like in new_likes:
+        deltas[(like["post_id"], today)] = deltas.get((like["post_id"], today), 0) + 1
+
+    for (post_id, date), delta in deltas.items():
+        bump_daily_likes(post_id, date, delta)
+
+    like_counts = post_like_counts(list(liked))
+    db.session.commit()
+
+    for post_id, like_id, liked_at in unliked:
+        trending_posts.record(post_id, -1, liked_at)
+
+    for like in new_likes:
+        trending_posts.record(like["post_id"], 1, now)
+
+    return [state and (state[0], state[1], like_counts[state[0]]) for state in states]
+
+
+def rebuild_like_rollup(chunk_size=10000):
+    """
+    Recomputes post_like_daily table from the like table. Posts are processed in chunks of ids,
+    each chunk in its own short transaction
+
+    :param chunk_size: number of post ids processed in one transaction
+    :return: number of written (post, date) rows
+    """
+
+    table = PostLikeDaily.__table__
+    written = 0
+
+    max_post_id = db.session.query(func.max(Post.id)).scalar() or 0
+
+    for first_id in range(0, max_post_id + 1, chunk_size):
+        last_id = first_id + chunk_size
+
+        db.session.execute(table.delete().where((table.c.post_id >= first_id) & (table.c.post_id < last_id)))
+
+        date = func.date(Like.created_at)
+
+        counts = db.session.query(Like.post_id, date, func.count(Like.id)).filter(
+            Like.post_id >= first_id,
+            Like.post_id < last_id
+        ).group_by(Like.post_id, date)
+
+        written += db.session.execute(
+            table.insert().from_select(["post_id", "date", "count"], counts.statement)
+        ).rowcount
+
+        db.session.commit()
+
+    return written
@@ -0,0 +1,275 @@
+import bisect
+import heapq
+import itertools
+import json
+import threading
+import time
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.app import app
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    """
+    Numbers collected during one request. Filled by engine events of the thread that handles the request,
+    so it needs no locking
+    """
+
+    __slots__ = ("start", "queries", "query_time", "commits", "statements", "status", "query_start")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.query_time = 0.0
+        self.commits = 0
+        self.statements = []
+        self.status = 500
+        self.query_start = None
+
+
+class EndpointMetrics:
+    __slots__ = ("buckets", "latency_sum", "requests", "queries", "query_time", "commits")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.requests = {}
+        self.queries = 0
+        self.query_time = 0.0
+        self.commits = 0
+
+
+class Metrics:
+    """
+    Per-endpoint request latency histograms, SQL query counts, query time and commit counts,
+    rendered in Prometheus text format. Also keeps METRICS_SLOW_REQUESTS_KEPT slowest requests
+    (slower than METRICS_SLOW_REQUEST_SECONDS) with their SQL statements
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._counters = {}
+        self._slow = []
+        self._slow_ids = itertools.count()
+
+    @property
+    def current(self):
+        """
+        :return: RequestStats of a request, handled by the current thread, or None
+        """
+
+        return getattr(self._local, "stats", None)
+
+    def start_request(self):
+        self._local.stats = RequestStats()
+
+    def finish_request(self, endpoint, method):
+        stats = self.current
+
+        if stats is None:
+            return
+
+        self._local.stats = None
+        duration = time.perf_counter() - stats.start
+
+        with self._lock:
+            metrics = self._endpoints.get((endpoint, method))
+
+            if metrics is None:
+                metrics = self._endpoints[(endpoint, method)] = EndpointMetrics()
+
+            metrics.buckets[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+            metrics.latency_sum += duration
+            metrics.requests[stats.status] = metrics.requests.get(stats.status, 0) + 1
+            metrics.queries += stats.queries
+            metrics.query_time += stats.query_time
+            metrics.commits += stats.commits
+
+        if duration >= app.config["METRICS_SLOW_REQUEST_SECONDS"]:
+            self._record_slow(endpoint, method, duration, stats)
+
+    def increment(self, name, amount=1, **labels):
+        """
+        Increments a custom counter, e.g. increment("singleflight_coalesced_total", endpoint="likestatistics")
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def slow_requests(self):
+        """
+        :return: list of the slowest requests, slowest first
+        """
+
+        with self._lock:
+            return [entry for duration, _, entry in sorted(self._slow, reverse=True)]
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._counters.clear()
+            self._slow.clear()
+
+    def render(self):
+        """
+        :return: all metrics in Prometheus text exposition format
+        """
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items(), key=lambda item: (str(item[0][0]), item[0][1]))
+            counters = sorted(self._counters.items())
+
+            lines = [
+                "# HELP http_request_duration_seconds Request latency",
+                "# TYPE http_request_duration_seconds histogram"
+            ]
+
+            for (endpoint, method), metrics in endpoints:
+                labels = f'endpoint="{endpoint}",method="{method}"'
+                cumulative = 0
+
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), metrics.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {metrics.latency_sum:.6f}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative}")
+
+            lines += ["# HELP http_requests_total Finished requests", "# TYPE http_requests_total counter"]
+
+            for (endpoint, method), metrics in endpoints:
+                for status, count in sorted(metrics.requests.items()):
+                    lines.append(f'http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+
+            for name, kind, help_text, value in (
+                ("db_queries_total", "counter", "SQL statements executed by requests", lambda m: m.queries),
+                ("db_query_duration_seconds_total", "counter", "Time requests spent in SQL statements",
+                 lambda m: f"{m.query_time:.6f}"),
+                ("db_commits_total", "counter", "Transactions committed by requests", lambda m: m.commits)
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+
+                for (endpoint, method), metrics in endpoints:
+                    lines.append(f'{name}{{endpoint="{endpoint}",method="{method}"}} {value(metrics)}')
+
+            previous = None
+
+            for (name, labels), value in counters:
+                if name != previous:
+                    lines.append(f"# TYPE {name} counter")
+                    previous = name
+
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{name}{{{label_text}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def _record_slow(self, endpoint, method, duration, stats):
+        entry = {
+            "endpoint": endpoint,
+            "method": method,
+            "path": request.full_path,
+            "status": stats.status,
+            "duration": round(duration, 6),
+            "queries": stats.queries,
+            "query_time": round(stats.query_time, 6),
+            "statements": stats.statements
+        }
+
+        app.logger.warning(f"slow request {method} {request.full_path}: {duration:.3f}s, "
+                           f"{stats.queries} queries: {json.dumps(stats.statements)}")
+
+        with self._lock:
+            item = (duration, next(self._slow_ids), entry)
+
+            if len(self._slow) < app.config["METRICS_SLOW_REQUESTS_KEPT"]:
+                heapq.heappush(self._slow, item)
+            else:
+                heapq.heappushpop(self._slow, item)
+
+
+metrics = Metrics()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = metrics.current
+
+    if stats is not None:
+        stats.query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = metrics.current
+
+    if stats is None or stats.query_start is None:
+        return
+
+    stats.queries += 1
+    stats.query_time += time.perf_counter() - stats.query_start
+    stats.query_start = None
+
+    if len(stats.statements) < app.config["METRICS_SLOW_STATEMENTS"]:
+        stats.statements.append(statement)
+
+
+@event.listens_for(Engine, "commit")
+def commit(conn):
+    stats = metrics.current
+
+    if stats is not None:
+        stats.commits += 1
+
+
+@app.before_request
+def start_request_metrics():
+    if app.config["METRICS_ENABLED"]:
+        metrics.start_request()
+
+
+@app.after_request
+def record_response_status(response):
+    stats = metrics.current
+
+    if stats is not None:
+        stats.status = response.status_code
+
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    metrics.finish_request(request.endpoint or "unknown", request.method)
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """
+    Metrics of this process in Prometheus text format
+
+    example: curl http://127.0.0.1:5000/metrics
+    """
+
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/metrics/slow")
+def slow_requests_endpoint():
+    """
+    The slowest requests of this process with their SQL statements
+
+    example: curl http://127.0.0.1:5000/metrics/slow
+    """
+
+    return Response(json.dumps(metrics.slow_requests()), mimetype="application/json")
@@ -1,7 +1,27 @@
-from src.app import db
+from src.app import app, db
+from src.activity import ActivityWriter
+from src.cache import response_cache
+import atexit
 import uuid
 import datetime
 
+from sqlalchemy import func
+from sqlalchemy.dialects import mysql
+
+
+def created_at_column():
+    """
+    Creation time of a row with microseconds. Filled by the database (DEFAULT CURRENT_TIMESTAMP(6))
+    for rows inserted outside of the application, and with the current time of every insert by SQLAlchemy
+    """
+
+    return db.Column(
+        db.DateTime().with_variant(mysql.DATETIME(fsp=6), "mysql"),
+        nullable=False,
+        default=datetime.datetime.now,
+        server_default=func.now(6)
+    )
+
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -29,12 +49,16 @@ class User(db.Model):
 
 
 class Post(db.Model):
+    __table_args__ = (
+        db.Index("post_created_at", "created_at"),
+        db.Index("post_author_created_at", "author_id", "created_at")
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     author_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     text = db.Column(db.Text, nullable=False)
     uuid = db.Column(db.String(255), unique=True)
-    date = db.Column(db.Date, default=datetime.date.today())
-    time = db.Column(db.Time, default=datetime.datetime.now().time())
+    created_at = created_at_column()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -43,44 +67,78 @@ class Post(db.Model):
     def __repr__(self):
         return f"<Post: id={self.id}, author_id={self.author_id}>, text={self.text}, uuid={self.uuid}"
 
-    def json(self):
-        return {
+    def json(self, like_count=None, liked_by_me=None):
+        """
+        :param like_count: number of likes of the post, included if passed
+        :param liked_by_me: whether the requesting user likes the post, included if passed
+        """
+
+        post = {
             "id": self.id,
             "author_id": self.author_id,
             "text": self.text,
             "uuid": self.uuid,
-            "date": str(self.date),
-            "time": str(self.time)
+            "date": str(self.created_at.date()),
+            "time": self.created_at.strftime("%H:%M:%S")
         }
 
+        if like_count is not None:
+            post["like_count"] = like_count
+
+        if liked_by_me is not None:
+            post["liked_by_me"] = liked_by_me
+
+        return post
+
 
 class Like(db.Model):
     """
-    Describes a like given by some user to some post
+    Describes a like given by some user to some post. A user can like a post only once
     """
 
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "post_id", name="user_post"),
+        db.Index("like_created_at", "created_at"),
+        db.Index("like_post_created_at", "post_id", "created_at"),
+        db.Index("like_user_created_at", "user_id", "created_at")
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
     post_id = db.Column(db.Integer, db.ForeignKey("post.id"))
-    date = db.Column(db.Date, default=datetime.date.today())
-    time = db.Column(db.Time, default=datetime.datetime.now().time())
+    created_at = created_at_column()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def __repr__(self):
-        return f"<Like: id={self.id}, user_id={self.user_id}, post_id={self.post_id}, " \
-               f"date={str(self.date)}, time={str(self.time)}>"
+        return f"<Like: id={self.id}, user_id={self.user_id}, post_id={self.post_id}, created_at={self.created_at}>"
 
     def json(self):
         return {
             "user_id": self.user_id,
             "post_id": self.post_id,
-            "date": str(self.date),
-            "time": str(self.time)
+            "date": str(self.created_at.date()),
+            "time": self.created_at.strftime("%H:%M:%S")
         }
 
 
+class PostLikeDaily(db.Model):
+    """
+    Number of likes on some post, given on some date. Kept up to date by src.likes on every like/unlike,
+    so likes statistics are read from here instead of aggregating the like table
+    """
+
+    __tablename__ = "post_like_daily"
+
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<PostLikeDaily: post_id={self.post_id}, date={str(self.date)}, count={self.count}>"
+
+
 class ActivityLog(db.Model):
     """
     Describes an activity by (optional) user (and/or) on some (optional) post,
@@ -88,50 +146,76 @@ class ActivityLog(db.Model):
 
     """
 
+    __table_args__ = (
+        db.Index("activity_user_created_at", "user_id", "created_at"),
+        db.Index("activity_post_created_at", "post_id", "created_at")
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=True)
     post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=True)
     action = db.Column(db.String(255))
-    date = db.Column(db.Date, default=datetime.date.today())
-    time = db.Column(db.Time, default=datetime.datetime.now().time())
+    created_at = created_at_column()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def __repr__(self):
         return f"<Activity: id={self.id}, user={self.user_id}, post={self.post_id}, " \
-               f"action={self.action}, date={self.date}, time={self.time}>"
+               f"action={self.action}, created_at={self.created_at}>"
 
     def json(self):
         return {
             "user_id": self.user_id,
             "post_id": self.post_id,
             "action": self.action,
-            "date": str(self.date),
-            "time": str(self.time)
+            "date": str(self.created_at.date()),
+            "time": self.created_at.strftime("%H:%M:%S")
         }
 
 
+activity_writer = ActivityWriter(ActivityLog.__table__)
+
+atexit.register(activity_writer.stop)
+
+
 def clear_db():
+    activity_writer.flush()
+
     db.session.query(ActivityLog).delete()
     db.session.query(Like).delete()
+    db.session.query(PostLikeDaily).delete()
     db.session.query(Post).delete()
     db.session.query(User).delete()
 
     db.session.commit()
 
+    response_cache.reset()
+
 
 def log_activity(action, **kwargs):
     """
-    Function that adds actions to database table activity_log
+    Function that adds actions to database table activity_log.
+    If ACTIVITY_LOG_ASYNC is set, the action is queued and written later by activity_writer,
+    otherwise it is committed right away
 
     :param action: description of an activity
     :param kwargs: user_id, post_id if action is done by some user, and/or on some post
     """
 
-    new_activity = ActivityLog(action=action, date=datetime.date.today(), time=datetime.datetime.now().time(), **kwargs)
+    record = {
+        "user_id": None,
+        "post_id": None,
+        **kwargs,
+        "action": action,
+        "created_at": datetime.datetime.now()
+    }
+
+    if app.config["ACTIVITY_LOG_ASYNC"]:
+        activity_writer.put(record)
+        return
 
-    db.session.add(new_activity)
+    db.session.add(ActivityLog(**record))
     db.session.commit()
 
 
@@ -153,3 +237,37 @@ def from_date(date_string):
     date = datetime.datetime.strptime(date_string, "%Y-%m-%d").date()
 
     return date
+
+
+def from_time(time_string):
+    """
+    Turns a string of time (as returned by str(time)) to time object
+    """
+
+    time_format = "%H:%M:%S.%f" if "." in time_string else "%H:%M:%S"
+
+    return datetime.datetime.strptime(time_string, time_format).time()
+
+
+def from_timestamp(timestamp_string):
+    """
+    Turns a string of datetime (as returned by str(datetime)) to datetime object
+    """
+
+    date_string, time_string = timestamp_string.split(" ")
+
+    return datetime.datetime.combine(from_date(date_string), from_time(time_string))
+
+
+def day_range(start_date=None, end_date=None):
+    """
+    Turns an inclusive range of dates to a half-open range of datetimes [start, end),
+    so created_at columns can be filtered as an index range
+
+    :return: tuple (start, end), each is None if the corresponding date is None
+    """
+
+    start = datetime.datetime.combine(start_date, datetime.time.min) if start_date else None
+    end = datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min) if end_date else None
+
+    return start, end
@@ -0,0 +1,100 @@
+import base64
+import json
+
+from flask import current_app, request
+
+
+class InvalidPage(ValueError):
+    """
+    Raised when a client passes a malformed limit or cursor
+    """
+
+
+def encode_cursor(*values):
+    """
+    Turns values of the last row of a page into an opaque url-safe cursor
+    """
+
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, size=1):
+    """
+    Turns a cursor, created by encode_cursor, back into a list of values
+
+    :param cursor: cursor string passed by a client
+    :param size: number of values the cursor must contain
+    """
+
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidPage(f"invalid cursor {cursor}")
+
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidPage(f"invalid cursor {cursor}")
+
+    return values
+
+
+def page_args():
+    """
+    Reads limit and cursor of a requested page from the query string
+
+    example: /api/posts?limit=50&cursor=<NEXT_CURSOR>
+
+    :return: tuple (limit, cursor), cursor is None for the first page
+    """
+
+    limit = request.args.get("limit", current_app.config["PAGE_SIZE"])
+
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise InvalidPage(f"invalid limit {limit}")
+
+    if not 0 < limit <= current_app.config["MAX_PAGE_SIZE"]:
+        raise InvalidPage(f"limit must be between 1 and {current_app.config['MAX_PAGE_SIZE']}")
+
+    return limit, request.args.get("cursor") or None
+
+
+def keyset_page(query, id_column, limit, cursor=None):
+    """
+    Returns one page of a query, ordered by an integer primary key. The page starts right after the row
+    the cursor points to, so the database seeks by index instead of skipping rows like OFFSET does
+
+    :param query: query to paginate
+    :param id_column: primary key column, e.g. Post.id
+    :param limit: maximal number of rows on a page
+    :param cursor: cursor of the previous page, or None for the first page
+    :return: tuple (rows, next_cursor), next_cursor is None on the last page
+    """
+
+    if cursor:
+        (last_id,) = decode_cursor(cursor)
+
+        if not isinstance(last_id, int):
+            raise InvalidPage(f"invalid cursor {cursor}")
+
+        query = query.filter(id_column > last_id)
+
+    # one extra row tells if there is a next page without a separate COUNT query
+    rows = query.order_by(id_column).limit(limit + 1).all()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+
+    return rows, encode_cursor(getattr(rows[-1], id_column.key))
+
+
+def page_headers(next_cursor):
+    """
+    :return: response headers describing the next page
+    """
+
+    return {"X-Next-Cursor": next_cursor} if next_cursor else {}
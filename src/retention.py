@@ -0,0 +1,224 @@
+import datetime
+import glob
+import gzip
+import heapq
+import json
+import os
+import time
+from collections import namedtuple
+
+from src.app import app, db
+from src.bulk import parse_timestamp
+from src.models import ActivityLog
+
+
+ARCHIVE_COLUMNS = ("id", "user_id", "post_id", "action", "created_at")
+
+
+class ArchivedActivity(namedtuple("ArchivedActivity", ARCHIVE_COLUMNS)):
+    """
+    Activity read from an archive file, has the same attributes and json as ActivityLog
+    """
+
+    __slots__ = ()
+
+    def json(self):
+        return {
+            "user_id": self.user_id,
+            "post_id": self.post_id,
+            "action": self.action,
+            "date": str(self.created_at.date()),
+            "time": self.created_at.strftime("%H:%M:%S")
+        }
+
+
+def retention_cutoff(retention_days):
+    """
+    :return: start of the oldest day, which is kept in activity_log table
+    """
+
+    return datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=retention_days), datetime.time.min)
+
+
+def day_directory(directory, date):
+    return os.path.join(directory, str(date))
+
+
+def write_archive(directory, rows):
+    """
+    Writes archived rows to one gzip compressed jsonl file per day: DIRECTORY/YYYY-MM-DD/activity-FIRST_ID-LAST_ID.jsonl.gz.
+    A file is written under a temporary name, forced to disk and renamed, so a file with the final name is complete
+
+    :param rows: rows of activity_log ordered by id
+    """
+
+    days = {}
+
+    for row in rows:
+        days.setdefault(row["created_at"].date(), []).append(row)
+
+    for date, day_rows in days.items():
+        os.makedirs(day_directory(directory, date), exist_ok=True)
+
+        path = os.path.join(
+            day_directory(directory, date), f"activity-{day_rows[0]['id']}-{day_rows[-1]['id']}.jsonl.gz"
+        )
+        temporary = f"{path}.part"
+
+        with open(temporary, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6) as file:
+            file.write("".join(
+                json.dumps({column: row[column] if column != "created_at" else str(row[column])
+                            for column in ARCHIVE_COLUMNS}) + "\n"
+                for row in day_rows
+            ).encode("utf-8"))
+
+        with open(temporary, "rb") as raw:
+            os.fsync(raw.fileno())
+
+        os.replace(temporary, path)
+
+
+def delete_rows(ids, batch_size, pause):
+    """
+    Deletes rows by primary key, batch_size rows per transaction, so every transaction locks few rows
+    and only for a short time
+
+    :param pause: seconds to sleep between transactions, gives way to other writers and replication
+    """
+
+    table = ActivityLog.__table__
+
+    for start in range(0, len(ids), batch_size):
+        if start and pause:
+            time.sleep(pause)
+
+        with db.engine.begin() as connection:
+            connection.execute(table.delete().where(table.c.id.in_(ids[start:start + batch_size])))
+
+
+def archive_activities(retention_days, directory, chunk_size, delete_batch_size, pause=0.0):
+    """
+    Moves activities older than retention_days days (counted in whole days) from activity_log table to archive files.
+    The table is read in primary key order, chunk_size rows at a time; old rows of a chunk are written
+    to the archive and then deleted. Ids grow with time, so the scan ends at the first chunk without old rows.
+
+    An interrupted run can leave rows both in the archive and in the table, the next run archives them
+    to another file and deletes them; readers of the archive skip repeated ids
+
+    :return: number of archived rows
+    """
+
+    table = ActivityLog.__table__
+    cutoff = retention_cutoff(retention_days)
+    archived = 0
+    last_id = None
+
+    while True:
+        query = table.select().order_by(table.c.id).limit(chunk_size)
+
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+
+        rows = db.engine.execute(query).fetchall()
+        old = [row for row in rows if row["created_at"] < cutoff]
+
+        if not old:
+            break
+
+        write_archive(directory, old)
+        delete_rows([row["id"] for row in old], delete_batch_size, pause)
+
+        archived += len(old)
+        last_id = rows[-1]["id"]
+
+    return archived
+
+
+def archive_days(directory, start=None, end=None):
+    """
+    :param start: datetime, files of earlier days are skipped, None - from the first archived day
+    :param end: datetime, files of this and later days are skipped (end is exclusive), None - till the last day
+    :return: iterator over lists of paths of archive files, one list per day in the range, oldest days first
+    """
+
+    for day_path in sorted(glob.glob(os.path.join(directory, "????-??-??"))):
+        try:
+            day = datetime.datetime.strptime(os.path.basename(day_path), "%Y-%m-%d")
+        except ValueError:
+            continue
+
+        if (start and day < datetime.datetime.combine(start.date(), datetime.time.min)) or (end and day >= end):
+            continue
+
+        yield sorted(glob.glob(os.path.join(day_path, "activity-*.jsonl.gz")))
+
+
+def read_archive(directory, user_id, start=None, end=None, actions=None, after=None):
+    """
+    Reads archived activities of a user lazily, one day at a time: the files of a day are read when activities
+    of the previous day have been consumed, so a caller, that needs a few activities, doesn't read the whole archive.
+    Only files of days in [start, end) are opened, but every file of such day is read whole,
+    archives are not indexed by user
+
+    :param actions: list of actions to keep, None - all actions
+    :param after: tuple (created_at, id), only activities after it are returned and files of earlier days
+    are not opened, e.g. the last activity of the previous page
+    :return: iterator over ArchivedActivity ordered by (created_at, id)
+    """
+
+    actions = set(actions) if actions is not None else None
+    first = after[0] if after and (start is None or after[0] > start) else start
+
+    for paths in archive_days(directory, first, end):
+        activities = {}
+
+        for path in paths:
+            with gzip.open(path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    record = json.loads(line)
+
+                    if record["user_id"] != user_id or (actions is not None and record["action"] not in actions):
+                        continue
+
+                    activity = ArchivedActivity(**{**record, "created_at": parse_timestamp(record["created_at"])})
+
+                    if (start and activity.created_at < start) or (end and activity.created_at >= end):
+                        continue
+
+                    if after and (activity.created_at, activity.id) <= after:
+                        continue
+
+                    # an interrupted archival can write an activity to two files of its day
+                    activities[activity.id] = activity
+
+        yield from sorted(activities.values(), key=lambda activity: (activity.created_at, activity.id))
+
+
+def archived_activities(user_id, start=None, end=None, actions=None, after=None):
+    """
+    :return: iterator over archived activities of a user (see read_archive) if ACTIVITY_ARCHIVE_QUERY is set,
+    otherwise an empty one
+    """
+
+    if not app.config["ACTIVITY_ARCHIVE_QUERY"]:
+        return iter(())
+
+    return read_archive(app.config["ACTIVITY_ARCHIVE_DIR"], user_id, start, end, actions, after)
+
+
+def merge_archived(archived, activities):
+    """
+    Lazily merges archived activities with activities from the table, both ordered by (created_at, id),
+    activities present in both are returned once
+
+    :return: iterator over activities ordered by (created_at, id)
+    """
+
+    last_id = None
+
+    for activity in heapq.merge(archived, activities, key=lambda activity: (activity.created_at, activity.id)):
+        # the same activity has the same position in both, so its copies come one after another
+        if activity.id != last_id:
+            yield activity
+
+        last_id = activity.id
@@ -0,0 +1,109 @@
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import orm
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.dml import UpdateBase
+
+
+REPLICA = "replica"
+
+# cookie of clients, which read from the primary database after a write
+PRIMARY_COOKIE = "read_primary"
+
+
+class ReplicaState:
+    """
+    Remembers that the replica has failed, so reads go to the primary database
+    for REPLICA_RETRY_SECONDS before the replica is tried again
+    """
+
+    def __init__(self):
+        self.down_until = 0
+
+    def available(self, app):
+        return REPLICA in (app.config.get("SQLALCHEMY_BINDS") or {}) and self.down_until <= time.monotonic()
+
+    def mark_down(self, app):
+        self.down_until = time.monotonic() + app.config["REPLICA_RETRY_SECONDS"]
+
+
+replica_state = ReplicaState()
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session, which sends queries of read_only resources to the replica database. Flushes and
+    insert/update/delete statements always go to the primary, and after the first write
+    all following queries of the same request go there too, so a request reads its own writes
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if not has_app_context() or not g.get("read_only"):
+            return super().get_bind(mapper, clause)
+
+        if self._flushing or isinstance(clause, UpdateBase):
+            g.wrote = True
+
+        if g.get("wrote") or not replica_state.available(self.app):
+            return super().get_bind(mapper, clause)
+
+        g.used_replica = True
+
+        return self.app.extensions["sqlalchemy"].db.get_engine(self.app, bind=REPLICA)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def read_only(func):
+    """
+    Decorator for methods of resources, which only read data: their queries go to the replica database,
+    if one is configured as "replica" in SQLALCHEMY_BINDS, unless the client has written something
+    during the last REPLICA_STICKY_SECONDS (see stick_to_primary). If the replica fails, the method
+    is called again with all queries going to the primary database
+    """
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        app = current_app._get_current_object()
+
+        if not replica_state.available(app) or request.cookies.get(PRIMARY_COOKIE):
+            return func(*args, **kwargs)
+
+        g.read_only = True
+
+        try:
+            return func(*args, **kwargs)
+        except DBAPIError as e:
+            if not g.get("used_replica"):
+                raise
+
+            app.logger.warning(f"replica database failed, reading from primary: {e}")
+            replica_state.mark_down(app)
+            app.extensions["sqlalchemy"].db.session.rollback()
+        finally:
+            g.read_only = False
+
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def stick_to_primary(response):
+    """
+    after_request handler, which makes a client, that has successfully written something (non-GET request),
+    read from the primary database for REPLICA_STICKY_SECONDS, when the replica may not have its writes yet
+    """
+
+    seconds = current_app.config["REPLICA_STICKY_SECONDS"]
+
+    if (seconds and request.method not in ("GET", "HEAD", "OPTIONS") and response.status_code < 400
+            and REPLICA in (current_app.config.get("SQLALCHEMY_BINDS") or {})):
+        response.set_cookie(PRIMARY_COOKIE, "1", max_age=seconds, httponly=True)
+
+    return response
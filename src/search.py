@@ -0,0 +1,219 @@
+import datetime
+import math
+import re
+import threading
+import time
+
+from sqlalchemy import DDL, Float, and_, event, or_
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+from src.app import app, db
+from src.models import Post
+from src.pagination import InvalidPage, decode_cursor, encode_cursor
+
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+# FULLTEXT index is MySQL-only, other databases are searched with InvertedIndex
+event.listen(
+    Post.__table__,
+    "after_create",
+    DDL("ALTER TABLE post ADD FULLTEXT KEY post_text_fulltext (text)").execute_if(dialect="mysql")
+)
+
+
+def tokenize(text):
+    """
+    :return: list of lowercase words of a text
+    """
+
+    return WORD.findall(text.lower())
+
+
+class match_score(FunctionElement):
+    """
+    Relevance of a column to a query by MySQL FULLTEXT index: MATCH (column) AGAINST (query IN NATURAL LANGUAGE MODE)
+    """
+
+    type = Float()
+    name = "match_score"
+
+
+@compiles(match_score, "mysql")
+def compile_match_score(element, compiler, **kw):
+    column, query = list(element.clauses)
+
+    return f"MATCH ({compiler.process(column, **kw)}) AGAINST ({compiler.process(query, **kw)} IN NATURAL LANGUAGE MODE)"
+
+
+class InvertedIndex:
+    """
+    In-process full-text index of posts for databases without FULLTEXT support: term -> {post_id: term frequency},
+    results are ranked by BM25. It is built from the post table on the first search and then kept up to date
+    incrementally: posts created by this process are added right away, posts created by other processes
+    are read at most every SEARCH_INDEX_REFRESH_SECONDS by range scans of the primary key (posts with ids above
+    the highest indexed one, whatever their created_at, e.g. imported ones) and of the created_at index
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._postings = {}
+            self._lengths = {}
+            self._total_length = 0
+            self._built = False
+            self._refreshed_at = 0
+            self._refreshed_from = None
+            self._max_id = 0
+
+    def add(self, post_id, text):
+        """
+        Adds a post to the index, if the index is already built and doesn't contain the post yet
+        """
+
+        with self._lock:
+            if self._built:
+                self._add(post_id, text)
+
+    def _add(self, post_id, text):
+        if post_id in self._lengths:
+            return
+
+        terms = tokenize(text)
+
+        for term in terms:
+            postings = self._postings.setdefault(term, {})
+            postings[post_id] = postings.get(post_id, 0) + 1
+
+        self._lengths[post_id] = len(terms)
+        self._total_length += len(terms)
+
+    def refresh(self):
+        """
+        Builds the index on the first call, later adds posts with ids above the highest indexed id
+        and posts created since the previous refresh minus SEARCH_INDEX_LAG_SECONDS (posts of transactions,
+        that committed late, can have lower ids than posts, that are already indexed)
+        """
+
+        with self._lock:
+            if self._built and time.monotonic() - self._refreshed_at < app.config["SEARCH_INDEX_REFRESH_SECONDS"]:
+                return
+
+            started = datetime.datetime.now()
+            query = db.session.query(Post.id, Post.text)
+
+            if self._built:
+                query = query.filter(or_(Post.id > self._max_id, Post.created_at >= self._refreshed_from))
+
+            for post_id, text in query.yield_per(app.config["STREAM_BATCH_SIZE"]):
+                self._add(post_id, text)
+                self._max_id = max(self._max_id, post_id)
+
+            self._built = True
+            self._refreshed_at = time.monotonic()
+            self._refreshed_from = started - datetime.timedelta(seconds=app.config["SEARCH_INDEX_LAG_SECONDS"])
+
+    def search(self, text):
+        """
+        :return: list of tuples (score, post_id) of posts, containing any word of the text, most relevant first
+        """
+
+        self.refresh()
+
+        with self._lock:
+            documents = len(self._lengths)
+
+            if not documents:
+                return []
+
+            average_length = self._total_length / documents
+            scores = {}
+
+            for term in set(tokenize(text)):
+                postings = self._postings.get(term)
+
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+
+                for post_id, frequency in postings.items():
+                    length_norm = self.k1 * (1 - self.b + self.b * self._lengths[post_id] / average_length)
+                    score = idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+                    scores[post_id] = scores.get(post_id, 0) + score
+
+        return sorted(((score, post_id) for post_id, score in scores.items()), key=lambda item: (-item[0], item[1]))
+
+
+search_index = InvertedIndex()
+
+
+def use_fulltext():
+    """
+    :return: True if posts are searched by MySQL FULLTEXT index, False - by the in-process InvertedIndex.
+    Chosen by SEARCH_BACKEND: "fulltext", "index", or "auto" - FULLTEXT if the database is MySQL
+    """
+
+    backend = app.config["SEARCH_BACKEND"]
+
+    if backend == "auto":
+        return db.engine.dialect.name == "mysql"
+
+    return backend == "fulltext"
+
+
+def search_cursor(cursor):
+    """
+    :return: tuple (score, post_id) of the last post of the previous page
+    """
+
+    score, post_id = decode_cursor(cursor, size=2)
+
+    if not isinstance(score, (int, float)) or not isinstance(post_id, int):
+        raise InvalidPage(f"invalid cursor {cursor}")
+
+    return score, post_id
+
+
+def search_posts(text, limit, cursor=None):
+    """
+    Finds posts, containing words of a text, ordered by relevance (and id among equally relevant posts).
+    Pages are cut by (score, id) of the last post of the previous page
+
+    :return: tuple (results, next_cursor), results is a list of tuples (post, score)
+    """
+
+    after = search_cursor(cursor) if cursor else None
+
+    if use_fulltext():
+        score = match_score(Post.text, text)
+        query = db.session.query(Post, score).filter(score > 0)
+
+        if after:
+            query = query.filter(or_(score < after[0], and_(score == after[0], Post.id > after[1])))
+
+        results = query.order_by(score.desc(), Post.id).limit(limit + 1).all()
+    else:
+        ranking = search_index.search(text)
+
+        if after:
+            ranking = [(score, post_id) for score, post_id in ranking if (-score, post_id) > (-after[0], after[1])]
+
+        ranking = ranking[:limit + 1]
+        posts = {post.id: post for post in Post.query.filter(Post.id.in_([post_id for _, post_id in ranking]))}
+        results = [(posts[post_id], score) for score, post_id in ranking if post_id in posts]
+
+    if len(results) <= limit:
+        return results, None
+
+    results = results[:limit]
+    post, score = results[-1]
+
+    return results, encode_cursor(score, post.id)
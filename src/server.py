@@ -0,0 +1,213 @@
+import errno
+import os
+import random
+import signal
+import socket
+import time
+
+from werkzeug.serving import BaseWSGIServer
+
+from src.app import app, db
+from src.like_buffer import like_buffer
+from src.models import activity_writer
+
+
+class Worker:
+    """
+    Worker process: serves requests from the shared listening socket one at a time,
+    until it is asked to stop or has served max_requests requests
+    """
+
+    def __init__(self, listener, max_requests):
+        self.listener = listener
+        self.max_requests = max_requests
+        self.served = 0
+        self.stopping = False
+
+    def count_requests(self, environ, start_response):
+        self.served += 1
+
+        return app(environ, start_response)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        parent = os.getppid()
+        host, port = self.listener.getsockname()[:2]
+
+        server = BaseWSGIServer(host, port, self.count_requests, fd=self.listener.fileno())
+        server.timeout = 1
+        # all workers wait on the same socket, the ones that lose the race for a connection must not block in accept()
+        server.socket.setblocking(False)
+
+        try:
+            while not self.stopping and os.getppid() == parent:
+                if self.max_requests and self.served >= self.max_requests:
+                    break
+
+                server.handle_request()
+        finally:
+            # write out everything, that is still buffered in memory, before the process exits
+            like_buffer.stop()
+            activity_writer.stop()
+
+
+class PreforkServer:
+    """
+    Production server: a master process opens the listening socket and keeps SERVER_WORKERS forked
+    worker processes serving it. Every worker has its own database connection pool.
+
+    Signals of the master process:
+    SIGTERM, SIGINT - graceful shutdown: workers finish current requests, flush pending work and exit
+    SIGHUP - graceful reload: a new set of workers is started, old workers are gracefully stopped
+    """
+
+    def __init__(self, bind, workers, max_requests=0, max_requests_jitter=0, graceful_timeout=30):
+        """
+        :param bind: "host:port" to listen on
+        :param workers: number of worker processes
+        :param max_requests: a worker is replaced after serving this number of requests, 0 - never
+        :param max_requests_jitter: random number up to this is added to max_requests of every worker,
+        so workers are not replaced all at once
+        :param graceful_timeout: seconds given to workers to stop before they are killed
+        """
+
+        self.bind = bind
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+
+        self.listener = None
+        self.generation = 0
+        self.children = {}
+        self.running = True
+        self.reload_requested = False
+        self.stop_deadline = None
+
+    def run(self):
+        host, port = self.bind.rsplit(":", 1)
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind((host, int(port)))
+        self.listener.listen(2048)
+
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+        signal.signal(signal.SIGHUP, self.handle_reload)
+
+        if like_buffer.enabled:
+            recovered = like_buffer.recover()
+
+            if recovered:
+                app.logger.info(f"replayed {recovered} buffered likes from journals")
+
+        # workers must not share connections opened by the master process
+        db.engine.dispose()
+
+        # the real address, if port 0 (any free port) was asked for
+        host, port = self.listener.getsockname()[:2]
+        app.logger.info(f"listening on {host}:{port} with {self.workers} workers, master pid {os.getpid()}")
+
+        try:
+            while self.running or self.children:
+                self.reap()
+
+                if self.reload_requested:
+                    self.reload()
+
+                if self.running:
+                    self.spawn_missing()
+                elif time.monotonic() > self.stop_deadline:
+                    self.signal_children(signal.SIGKILL)
+
+                time.sleep(0.1)
+        finally:
+            self.listener.close()
+
+    def handle_stop(self, signum, frame):
+        if not self.running:
+            return
+
+        app.logger.info("stopping workers")
+
+        self.running = False
+        self.stop_deadline = time.monotonic() + self.graceful_timeout
+        self.signal_children(signal.SIGTERM)
+
+    def handle_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def reload(self):
+        self.reload_requested = False
+        app.logger.info("reloading workers")
+
+        old_children = list(self.children)
+
+        self.generation += 1
+        self.spawn_missing()
+
+        for pid in old_children:
+            self.kill(pid, signal.SIGTERM)
+
+    def spawn_missing(self):
+        current = sum(1 for generation in self.children.values() if generation == self.generation)
+
+        for _ in range(self.workers - current):
+            self.spawn()
+
+    def spawn(self):
+        max_requests = self.max_requests
+
+        if max_requests and self.max_requests_jitter:
+            max_requests += random.randint(0, self.max_requests_jitter)
+
+        pid = os.fork()
+
+        if pid:
+            self.children[pid] = self.generation
+            return
+
+        code = 0
+
+        try:
+            Worker(self.listener, max_requests).run()
+        except BaseException:
+            app.logger.exception("worker failed")
+            code = 1
+        finally:
+            os._exit(code)
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+
+            if not pid:
+                return
+
+            self.children.pop(pid, None)
+
+            if status and like_buffer.enabled:
+                # a worker, that crashed or was killed, may have left buffered likes in its journal
+                like_buffer.recover(pid)
+                db.engine.dispose()
+
+    def signal_children(self, signum):
+        for pid in list(self.children):
+            self.kill(pid, signum)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno == errno.ESRCH:
+                self.children.pop(pid, None)
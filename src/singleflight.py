@@ -0,0 +1,123 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, request
+
+from src.cache import request_key
+from src.metrics import metrics
+
+
+class Call:
+    """
+    Computation of a result, which other threads wait for
+    """
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Runs a function at most once at a time per key: threads, that ask for the same key while the function
+    is running, wait for it and get the same result (or exception). The result can be reused
+    for `reuse_seconds` after the call has finished
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._results = {}
+
+    def do(self, key, func, reuse_seconds=0):
+        """
+        :return: tuple (result, shared): shared is None if the result was computed by this call,
+        "coalesced" if this call waited for a running call with the same key, "reused" if the result
+        of a finished call was returned
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            reused = self._results.get(key)
+
+            if reused is not None and reused[0] > now:
+                return reused[1], "reused"
+
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = Call()
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result, "coalesced"
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+                if reuse_seconds and call.error is None:
+                    now = time.monotonic()
+
+                    self._results = {
+                        result_key: entry for result_key, entry in self._results.items() if entry[0] > now
+                    }
+                    self._results[key] = (now + reuse_seconds, call.result)
+
+            call.done.set()
+
+        return call.result, None
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+
+
+single_flight = SingleFlight()
+
+
+def coalesced(func):
+    """
+    Decorator for GET methods of resources: identical concurrent requests (same endpoint, query string and body)
+    of one process share a single call of the method and all get its response. With SINGLE_FLIGHT_REUSE_SECONDS
+    the response is also returned to identical requests, that come during this time after the call.
+    Streamed responses (?stream=...) are not shared. The method must return data (e.g. a tuple (json, status)),
+    not a Response object, which can't be sent to several clients.
+
+    Shared responses are counted in singleflight_coalesced_total (waited for a running call)
+    and singleflight_reused_total (got a finished call's response) metrics
+    """
+
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        config = current_app.config
+
+        if not config["SINGLE_FLIGHT_ENABLED"] or request.args.get("stream"):
+            return func(self, *args, **kwargs)
+
+        result, shared = single_flight.do(
+            request_key((), ()),
+            lambda: func(self, *args, **kwargs),
+            reuse_seconds=config["SINGLE_FLIGHT_REUSE_SECONDS"]
+        )
+
+        if shared is not None:
+            metrics.increment(f"singleflight_{shared}_total", endpoint=request.endpoint)
+
+        return result
+
+    return wrapper
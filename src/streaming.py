@@ -0,0 +1,93 @@
+import json
+
+from flask import Response, current_app, request, stream_with_context
+
+
+STREAM_FORMATS = {
+    "1": "json",
+    "true": "json",
+    "json": "json",
+    "ndjson": "ndjson"
+}
+
+MIMETYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson"
+}
+
+
+class InvalidStream(ValueError):
+    """
+    Raised when a client requests an unknown stream format
+    """
+
+
+def stream_format():
+    """
+    Reads the requested stream format from the query string:
+    ?stream=1 streams a json array, ?stream=ndjson streams one json per line
+
+    :return: "json", "ndjson" or None if the response should not be streamed
+    """
+
+    value = request.args.get("stream")
+
+    if not value or value in ("0", "false"):
+        return None
+
+    if value not in STREAM_FORMATS:
+        raise InvalidStream(f"invalid stream format {value}, use 1 or ndjson")
+
+    return STREAM_FORMATS[value]
+
+
+def stream_query(query, serialize, fmt):
+    """
+    Creates a chunked response with all rows of a query. Rows are fetched from the database
+    STREAM_BATCH_SIZE at a time and every batch is encoded and sent before the next one is fetched,
+    so memory usage doesn't depend on number of rows
+
+    :param query: ordered query, rows of which are sent
+    :param serialize: function, that turns a row into a json-serializable object
+    :param fmt: "json" or "ndjson"
+    """
+
+    return stream_rows(query.yield_per(current_app.config["STREAM_BATCH_SIZE"]), serialize, fmt)
+
+
+def stream_rows(rows, serialize, fmt):
+    """
+    Same as stream_query for any iterable of rows, e.g. rows of a query merged with rows read from files
+    """
+
+    batch_size = current_app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        batch = []
+        first = True
+
+        if fmt == "json":
+            yield "["
+
+        for row in rows:
+            batch.append(json.dumps(serialize(row)))
+
+            if len(batch) == batch_size:
+                yield encode_batch(batch, fmt, first)
+                batch = []
+                first = False
+
+        if batch:
+            yield encode_batch(batch, fmt, first)
+
+        if fmt == "json":
+            yield "]"
+
+    return Response(stream_with_context(generate()), mimetype=MIMETYPES[fmt])
+
+
+def encode_batch(batch, fmt, first):
+    if fmt == "ndjson":
+        return "\n".join(batch) + "\n"
+
+    return ("" if first else ",") + ",".join(batch)
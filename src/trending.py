@@ -0,0 +1,233 @@
+import datetime
+import heapq
+import threading
+import time
+
+from src.app import app, db
+from src.models import Like
+
+
+class TrendingPosts:
+    """
+    Posts with the most likes during the last TRENDING_WINDOW_SECONDS, where a like loses half of its weight
+    every TRENDING_HALF_LIFE_SECONDS. Likes are counted per post in TRENDING_BUCKET_SECONDS long time buckets,
+    so likes, that leave the window, are subtracted by dropping their bucket. Scores are kept in a heap, a like/unlike
+    pushes the new score of its post in O(log n), outdated entries are dropped when the best posts are read,
+    so reading them doesn't depend on the number of likes.
+
+    Counters are kept in memory of every worker process. They are built from the like table on first use and
+    rebuilt by a background thread every TRENDING_REBUILD_SECONDS, so likes, counted by other processes,
+    are taken into account too; requests are served from the current counters meanwhile
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+            self._scores = {}
+            # (-score, post_id) of every scored post, with outdated entries of changed scores
+            self._heap = []
+            self._first_bucket = None
+            self._last_bucket = None
+            self._rebuilt_at = None
+            self._rebuilding = False
+            # likes recorded while the like table is scanned, None if no scan is running
+            self._recorded = None
+
+    @staticmethod
+    def _bucket(moment):
+        return int(moment.timestamp() // app.config["TRENDING_BUCKET_SECONDS"])
+
+    @staticmethod
+    def _window():
+        return max(1, app.config["TRENDING_WINDOW_SECONDS"] // app.config["TRENDING_BUCKET_SECONDS"])
+
+    def _weight(self, bucket):
+        """
+        Weight of likes of a bucket. Weights grow with time instead of scores decaying, so older scores
+        never need to be updated; they are rescaled to the last bucket of the window when it moves,
+        so weights are at most 1 and can't overflow however many half-lives the window is
+        """
+
+        seconds = (bucket - self._last_bucket) * app.config["TRENDING_BUCKET_SECONDS"]
+
+        return 2 ** (seconds / app.config["TRENDING_HALF_LIFE_SECONDS"])
+
+    def record(self, post_id, delta, moment):
+        """
+        Counts a like (delta=1) or a removed like (delta=-1) of a post
+
+        :param moment: time of the like (for a removed like - time the like was given)
+        """
+
+        with self._lock:
+            if self._recorded is not None:
+                self._recorded.append((post_id, delta, moment))
+
+            if self._rebuilt_at is not None:
+                self._count(post_id, delta, moment)
+
+    def _count(self, post_id, delta, moment):
+        now = self._bucket(datetime.datetime.now())
+        self._advance(now)
+
+        bucket = min(self._bucket(moment), now)
+
+        if bucket < self._first_bucket:
+            return
+
+        counts = self._buckets.setdefault(bucket, {})
+        counts[post_id] = counts.get(post_id, 0) + delta
+
+        self._add_score(post_id, delta * self._weight(bucket))
+
+    def _add_score(self, post_id, amount):
+        score = self._scores.get(post_id, 0) + amount
+
+        if score > 1e-9:
+            self._scores[post_id] = score
+            heapq.heappush(self._heap, (-score, post_id))
+        else:
+            self._scores.pop(post_id, None)
+
+        # the entry of the previous score stays in the heap, the heap is compacted when most entries are outdated
+        if len(self._heap) > 2 * len(self._scores) + app.config["TRENDING_SIZE"]:
+            self._heapify()
+
+    def _heapify(self):
+        self._heap = [(-score, post_id) for post_id, score in self._scores.items()]
+        heapq.heapify(self._heap)
+
+    def _best(self, limit):
+        """
+        :return: list of at most limit tuples (post_id, score) with the highest scores. Outdated entries
+        above them are dropped from the heap
+        """
+
+        best = []
+        found = set()
+
+        while self._heap and len(best) < limit:
+            negative_score, post_id = heapq.heappop(self._heap)
+
+            if post_id not in found and self._scores.get(post_id) == -negative_score:
+                best.append((post_id, -negative_score))
+                found.add(post_id)
+
+        for post_id, score in best:
+            heapq.heappush(self._heap, (-score, post_id))
+
+        return best
+
+    def _advance(self, now):
+        """
+        Moves the window, so it ends with the bucket `now`: buckets, that left the window, are dropped,
+        scores are recomputed relative to the new first bucket
+        """
+
+        first_bucket = now - self._window() + 1
+
+        if first_bucket <= self._first_bucket:
+            return
+
+        self._first_bucket = first_bucket
+        self._last_bucket = now
+        self._buckets = {bucket: counts for bucket, counts in self._buckets.items() if bucket >= first_bucket}
+        self._scores = {}
+
+        for bucket, counts in self._buckets.items():
+            weight = self._weight(bucket)
+
+            for post_id, count in counts.items():
+                self._scores[post_id] = self._scores.get(post_id, 0) + count * weight
+
+        self._scores = {post_id: score for post_id, score in self._scores.items() if score > 1e-9}
+        self._heapify()
+
+    def rebuild(self):
+        """
+        Recomputes counters from likes of the window in the like table, read as a range of created_at index.
+        Likes recorded during the scan are counted again on top of its result (a like, committed right
+        when the scan starts, can be counted twice until the next rebuild)
+        """
+
+        with self._lock:
+            self._recorded = []
+
+        now = datetime.datetime.now()
+        first_bucket = self._bucket(now) - self._window() + 1
+        since = datetime.datetime.fromtimestamp(first_bucket * app.config["TRENDING_BUCKET_SECONDS"])
+
+        buckets = {}
+
+        likes = db.session.query(Like.post_id, Like.created_at).filter(Like.created_at >= since)
+
+        try:
+            for post_id, created_at in likes.yield_per(app.config["STREAM_BATCH_SIZE"]):
+                counts = buckets.setdefault(self._bucket(created_at), {})
+                counts[post_id] = counts.get(post_id, 0) + 1
+        except Exception:
+            with self._lock:
+                self._recorded = None
+
+            raise
+
+        with self._lock:
+            recorded, self._recorded = self._recorded or [], None
+
+            self._buckets = buckets
+            self._first_bucket = first_bucket - 1
+            self._advance(first_bucket + self._window() - 1)
+            self._rebuilt_at = time.monotonic()
+
+            for post_id, delta, moment in recorded:
+                self._count(post_id, delta, moment)
+
+    def _start_rebuild(self):
+        with self._lock:
+            if self._rebuilding:
+                return
+
+            self._rebuilding = True
+
+        threading.Thread(target=self._rebuild_in_background, name="trending-rebuild", daemon=True).start()
+
+    def _rebuild_in_background(self):
+        try:
+            with app.app_context():
+                self.rebuild()
+                db.session.remove()
+        except Exception:
+            app.logger.exception("failed to rebuild trending posts")
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def top(self, limit):
+        """
+        :return: list of at most limit tuples (post_id, score) of trending posts, best first.
+        Score is the number of likes, where a like given TRENDING_HALF_LIFE_SECONDS ago counts as a half
+        """
+
+        rebuild_seconds = app.config["TRENDING_REBUILD_SECONDS"]
+
+        if self._rebuilt_at is None:
+            # the first build is waited for, concurrent requests don't scan the table again
+            with self._build_lock:
+                if self._rebuilt_at is None:
+                    self.rebuild()
+        elif rebuild_seconds and time.monotonic() - self._rebuilt_at >= rebuild_seconds:
+            self._start_rebuild()
+
+        with self._lock:
+            # scores are relative to the current bucket, where a like weighs 1
+            self._advance(self._bucket(datetime.datetime.now()))
+
+            return self._best(limit)
+
+
+trending_posts = TrendingPosts()
@@ -0,0 +1,124 @@
+import unittest
+import json
+
+from sqlalchemy import event
+from sqlalchemy.orm import scoped_session
+
+from src.api import app, db
+from src.authentication import token_cache
+from src.cache import response_cache
+from src.models import User, Post, clear_db
+from src.search import search_index
+from src.singleflight import single_flight
+from src.trending import trending_posts
+
+
+# tables of in-memory SQLite database (APP_CONFIG=test) are created from the models,
+# tables, that already exist in other databases, are left as they are
+db.create_all()
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """
+    Base of tests, that use the database. Every test runs inside an outer transaction, which is rolled back
+    when the test ends, so tests don't need to delete their rows and don't see rows of other tests.
+    db.session is bound to the transaction's connection.
+
+    Tests of code, that writes through its own connections (bulk import, archival, background writers),
+    set rollback = False: their rows are committed and removed by clear_db after the test, so such tests
+    can't share a database with tests running in parallel
+    """
+
+    rollback = True
+
+    def setUp(self):
+        super().setUp()
+
+        if self.rollback:
+            self._begin()
+        else:
+            self.addCleanup(clear_db)
+
+        self.addCleanup(self._reset_caches)
+
+    def _begin(self):
+        connection = db.engine.connect()
+
+        if connection.dialect.name == "sqlite":
+            # pysqlite starts transactions lazily and breaks SAVEPOINTs, so BEGIN is emitted explicitly
+            sqlite_connection = connection.connection.connection
+            isolation_level = sqlite_connection.isolation_level
+            sqlite_connection.isolation_level = None
+
+            event.listen(connection, "begin", lambda connection: connection.execute("BEGIN"))
+
+            def restore_isolation_level():
+                sqlite_connection.isolation_level = isolation_level
+
+            self.addCleanup(restore_isolation_level)
+
+        transaction = connection.begin()
+
+        # activity log writer commits through its own connections, the records are written by the session instead
+        activity_log_async = app.config["ACTIVITY_LOG_ASYNC"]
+        app.config["ACTIVITY_LOG_ASYNC"] = False
+
+        # every transaction of a session, bound to the connection, is a SAVEPOINT inside the outer transaction,
+        # so commits and rollbacks of the tested code end the savepoint and the outer transaction stays open
+        connection.begin = connection.begin_nested
+
+        original_session = db.session
+        db.session = scoped_session(
+            db.create_session({"bind": connection, "binds": {}}), scopefunc=original_session.registry.scopefunc
+        )
+
+        def rollback():
+            app.config["ACTIVITY_LOG_ASYNC"] = activity_log_async
+
+            db.session.remove()
+            db.session = original_session
+
+            transaction.rollback()
+            connection.close()
+
+        self.addCleanup(rollback)
+
+    def create_users_and_posts(self, users, posts):
+        """
+        Creates users user0, user1, ... with password "password" and posts of user0, and logs the users in.
+        Sets self.user_ids, self.post_ids, self.post_uuids and self.tokens (X-Api-Key of every user)
+
+        :param users: number of users
+        :param posts: number of posts
+        """
+
+        users = [User(name="name", surname="surname", password="password", username=f"user{i}") for i in range(users)]
+
+        db.session.add_all(users)
+        db.session.commit()
+
+        posts = [Post(author_id=users[0].id, text=f"post {i}") for i in range(posts)]
+
+        db.session.add_all(posts)
+        db.session.commit()
+
+        self.user_ids = [user.id for user in users]
+        self.post_ids = [post.id for post in posts]
+        self.post_uuids = [post.uuid for post in posts]
+
+        client = app.test_client()
+        self.tokens = [
+            client.get("/api/login", content_type="application/json",
+                       data=json.dumps({"username": f"user{i}", "password": "password"})).json["token"]
+            for i in range(len(users))
+        ]
+
+    @staticmethod
+    def _reset_caches():
+        # in-process state, built from rows of the test
+        response_cache.reset()
+        token_cache.clear()
+        search_index.reset()
+        trending_posts.reset()
+        single_flight.reset()
+
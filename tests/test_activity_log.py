@@ -0,0 +1,110 @@
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
+from src.api import app, db
+from src.models import User, ActivityLog, activity_writer, log_activity
+from tests.base import DatabaseTestCase
+
+
+class ActivityLogTestCase(DatabaseTestCase):
+    rollback = False
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+
+        user = User(name="Name", surname="Surname", password="123", username="logged_user")
+
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def user_actions(self):
+        return [action.action for action in ActivityLog.query.filter(ActivityLog.user_id == self.user_id)]
+
+    def test_synchronous(self):
+        app.config["ACTIVITY_LOG_ASYNC"] = False
+
+        log_activity("first action", user_id=self.user_id)
+
+        self.assertEqual(self.user_actions(), ["first action"])
+
+    def test_asynchronous_batches(self):
+        app.config["ACTIVITY_LOG_ASYNC"] = True
+        app.config["ACTIVITY_LOG_BATCH_SIZE"] = 3
+        app.config["ACTIVITY_LOG_FLUSH_INTERVAL"] = 60
+
+        for i in range(7):
+            log_activity(f"action {i}", user_id=self.user_id)
+
+        activity_writer.flush()
+        db.session.rollback()
+
+        self.assertEqual(self.user_actions(), [f"action {i}" for i in range(7)])
+
+    def test_full_queue_writes_inline(self):
+        app.config["ACTIVITY_LOG_ASYNC"] = True
+        app.config["ACTIVITY_LOG_PUT_TIMEOUT"] = 0
+
+        activity_writer.stop()
+        app.config["ACTIVITY_LOG_QUEUE_SIZE"] = 1
+
+        for i in range(20):
+            log_activity(f"action {i}", user_id=self.user_id)
+
+        activity_writer.stop()
+        db.session.rollback()
+
+        self.assertEqual(sorted(self.user_actions()), sorted(f"action {i}" for i in range(20)))
+
+    def insert_failures(self, count):
+        failures = []
+
+        def fail_insert(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO activity_log") and len(failures) < count:
+                failures.append(statement)
+                raise OperationalError(statement, parameters, Exception("database is restarting"))
+
+        event.listen(db.engine, "before_cursor_execute", fail_insert)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", fail_insert)
+
+        return failures
+
+    def test_failed_batch_is_retried(self):
+        app.config["ACTIVITY_LOG_ASYNC"] = True
+        app.config["ACTIVITY_LOG_RETRY_DELAY"] = 0
+        app.config["ACTIVITY_LOG_INSERT_ATTEMPTS"] = 3
+
+        failures = self.insert_failures(2)
+
+        for i in range(3):
+            log_activity(f"action {i}", user_id=self.user_id)
+
+        activity_writer.flush()
+        db.session.rollback()
+
+        self.assertEqual(len(failures), 2)
+        self.assertEqual(self.user_actions(), [f"action {i}" for i in range(3)])
+
+    def test_retries_are_bounded(self):
+        app.config["ACTIVITY_LOG_ASYNC"] = True
+        app.config["ACTIVITY_LOG_RETRY_DELAY"] = 0
+        app.config["ACTIVITY_LOG_INSERT_ATTEMPTS"] = 2
+
+        failures = self.insert_failures(2)
+
+        with self.assertLogs(app.logger, "ERROR"):
+            log_activity("lost action", user_id=self.user_id)
+            activity_writer.flush()
+
+        log_activity("next action", user_id=self.user_id)
+        activity_writer.flush()
+        db.session.rollback()
+
+        self.assertEqual(len(failures), 2)
+        self.assertEqual(self.user_actions(), ["next action"])
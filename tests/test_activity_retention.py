@@ -0,0 +1,127 @@
+import unittest
+import datetime
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from src.api import app, db
+from src.models import User, ActivityLog
+from src.retention import archive_activities, read_archive
+from tests.base import DatabaseTestCase
+
+
+class ActivityRetentionTestCase(DatabaseTestCase):
+    rollback = False
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+        self.archive_dir = tempfile.mkdtemp()
+
+        app.config["ACTIVITY_ARCHIVE_DIR"] = self.archive_dir
+
+        user = User(name="name", surname="surname", password="password", username="active_user")
+
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+        self.today = datetime.date.today()
+        self.old_day = self.today - datetime.timedelta(days=40)
+
+        for date in (self.old_day, self.old_day + datetime.timedelta(days=1), self.today):
+            for hour, action in enumerate(["liked post", "liked post", "new post added"]):
+                db.session.add(ActivityLog(
+                    user_id=user.id, action=action, created_at=datetime.datetime.combine(date, datetime.time(hour))
+                ))
+
+        db.session.add(ActivityLog(action="database restored",
+                                   created_at=datetime.datetime.combine(self.old_day, datetime.time(5))))
+        db.session.commit()
+
+    def tearDown(self):
+        app.config.update(self.config)
+        shutil.rmtree(self.archive_dir)
+
+    def statistics(self, query_string="", **args):
+        return self.app.get(
+            f"/api/analytics/user{query_string}",
+            content_type="application/json",
+            data=json.dumps({"username": "active_user", **args})
+        )
+
+    def archive(self):
+        return archive_activities(30, self.archive_dir, chunk_size=4, delete_batch_size=2)
+
+    def test_archive(self):
+        all_actions = self.statistics().json
+
+        self.assertEqual(self.archive(), 7)
+
+        self.assertEqual({activity.created_at.date() for activity in ActivityLog.query}, {self.today})
+        self.assertEqual(sorted(os.listdir(self.archive_dir)),
+                         [str(self.old_day), str(self.old_day + datetime.timedelta(days=1))])
+        self.assertEqual([activity.json() for activity in read_archive(self.archive_dir, self.user_id)],
+                         all_actions[:6])
+
+        self.assertEqual(self.archive(), 0)
+
+    def test_read_archived(self):
+        all_actions = self.statistics().json
+        aggregated = self.statistics(aggregate=True).json
+
+        self.archive()
+
+        self.assertEqual(self.statistics().json, all_actions[6:])
+
+        app.config["ACTIVITY_ARCHIVE_QUERY"] = True
+
+        self.assertEqual(self.statistics().json, all_actions)
+        self.assertEqual(self.statistics("?stream=1").json, all_actions)
+        self.assertEqual(self.statistics(aggregate=True).json, aggregated)
+
+        actions = []
+        cursor = ""
+
+        while True:
+            r = self.statistics(f"?limit=4&cursor={cursor}")
+            actions += r.json
+            cursor = r.headers.get("X-Next-Cursor")
+
+            if not cursor:
+                break
+
+        self.assertEqual(actions, all_actions)
+
+        r = self.statistics(start_date=str(self.old_day), end_date=str(self.old_day), actions=["new post added"])
+
+        self.assertEqual([(action["date"], action["action"]) for action in r.json],
+                         [(str(self.old_day), "new post added")])
+
+    def test_pages_read_only_needed_archive_days(self):
+        self.archive()
+        app.config["ACTIVITY_ARCHIVE_QUERY"] = True
+
+        def opened_days(query_string):
+            with mock.patch.object(gzip, "open", wraps=gzip.open) as opened:
+                r = self.statistics(query_string)
+
+            return r, {os.path.basename(os.path.dirname(call[0][0])) for call in opened.call_args_list}
+
+        r, days = opened_days("?limit=2")
+
+        self.assertEqual(days, {str(self.old_day)})
+
+        r, _ = opened_days(f"?limit=2&cursor={r.headers['X-Next-Cursor']}")
+        r, days = opened_days(f"?limit=2&cursor={r.headers['X-Next-Cursor']}")
+
+        self.assertEqual([action["date"] for action in r.json], [str(self.old_day + datetime.timedelta(days=1))] * 2)
+        self.assertEqual(days, {str(self.old_day + datetime.timedelta(days=1))})
+
+
+if __name__ == "__main__":
+    unittest.main()
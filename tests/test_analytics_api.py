@@ -0,0 +1,87 @@
+import datetime
+import json
+
+from src.api import app, db
+from src.models import User, ActivityLog
+from tests.base import DatabaseTestCase
+
+
+class UserStatisticsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+
+        user = User(name="name", surname="surname", password="password", username="active_user")
+
+        db.session.add(user)
+        db.session.commit()
+
+        self.first_day = datetime.date(2020, 5, 8)
+        self.second_day = datetime.date(2020, 5, 9)
+
+        for date in (self.first_day, self.second_day):
+            for hour, action in enumerate(["liked post", "liked post", "new post added"]):
+                db.session.add(ActivityLog(
+                    user_id=user.id, action=action, created_at=datetime.datetime.combine(date, datetime.time(hour))
+                ))
+
+        db.session.commit()
+
+    def statistics(self, query_string="", **args):
+        return self.app.get(
+            f"/api/analytics/user{query_string}",
+            content_type="application/json",
+            data=json.dumps({"username": "active_user", **args})
+        )
+
+    def test_all_activities(self):
+        r = self.statistics()
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(len(r.json), 6)
+        self.assertEqual([(action["date"], action["time"]) for action in r.json],
+                         sorted((action["date"], action["time"]) for action in r.json))
+
+    def test_filters(self):
+        r = self.statistics(start_date=str(self.second_day), actions=["liked post"])
+
+        self.assertEqual([(action["date"], action["action"]) for action in r.json],
+                         [(str(self.second_day), "liked post")] * 2)
+
+        r = self.statistics(end_date=str(self.first_day))
+
+        self.assertEqual({action["date"] for action in r.json}, {str(self.first_day)})
+
+        self.assertEqual(self.statistics(start_date="08.05.2020").status_code, 400)
+        self.assertEqual(self.statistics(actions="liked post").status_code, 400)
+
+    def test_pagination(self):
+        all_actions = self.statistics().json
+
+        actions = []
+        cursor = ""
+
+        while True:
+            r = self.statistics(f"?limit=4&cursor={cursor}")
+
+            self.assertEqual(r.status_code, 200)
+            actions += r.json
+
+            cursor = r.headers.get("X-Next-Cursor")
+
+            if not cursor:
+                break
+
+        self.assertEqual(actions, all_actions)
+
+    def test_aggregate(self):
+        r = self.statistics(aggregate=True)
+
+        self.assertEqual(r.json, {
+            str(self.first_day): {"liked post": 2, "new post added": 1},
+            str(self.second_day): {"liked post": 2, "new post added": 1}
+        })
+
+        r = self.statistics(aggregate=True, start_date=str(self.second_day), actions=["new post added"])
+
+        self.assertEqual(r.json, {str(self.second_day): {"new post added": 1}})
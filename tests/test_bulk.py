@@ -0,0 +1,152 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from src.api import db
+from src.bulk import BulkError, export_table, import_table
+from src.models import User, Post, Like, PostLikeDaily, ActivityLog, clear_db
+from tests.base import DatabaseTestCase
+
+
+class BulkTestCase(DatabaseTestCase):
+    rollback = False
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+
+        users = [User(name=f"name{i}", surname=f"surname{i}", password=f"password{i}", username=f"user{i}")
+                 for i in range(5)]
+
+        db.session.add_all(users)
+        db.session.commit()
+
+        posts = [Post(author_id=users[i % 5].id, text=f"post {i},\n\"quoted\"") for i in range(7)]
+
+        db.session.add_all(posts)
+        db.session.commit()
+
+        db.session.add_all([Like(user_id=user.id, post_id=posts[0].id) for user in users])
+        db.session.commit()
+
+        self.rows = {
+            "users": [user.json() for user in User.query.order_by(User.id)],
+            "posts": [post.json() for post in Post.query.order_by(Post.id)],
+            "likes": [like.json() for like in Like.query.order_by(Like.id)]
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_export_and_import(self):
+        for extension in ("jsonl", "csv.gz"):
+            for table in ("users", "posts", "likes"):
+                self.assertEqual(export_table(table, self.path(f"{table}.{extension}"), batch_size=2),
+                                 len(self.rows[table]))
+
+            clear_db()
+
+            for table in ("users", "posts", "likes"):
+                self.assertEqual(import_table(table, self.path(f"{table}.{extension}"), batch_size=3),
+                                 len(self.rows[table]))
+
+            self.assertEqual([user.json() for user in User.query.order_by(User.id)], self.rows["users"])
+            self.assertEqual([post.json() for post in Post.query.order_by(Post.id)], self.rows["posts"])
+            self.assertEqual([like.json() for like in Like.query.order_by(Like.id)], self.rows["likes"])
+            self.assertEqual(PostLikeDaily.query.one().count, 5)
+
+    def test_resume_from_checkpoint(self):
+        export_table("users", self.path("users.jsonl"), batch_size=100)
+        clear_db()
+
+        with open(self.path("users.jsonl"), "a") as file:
+            file.write("not json\n")
+
+        checkpoint = self.path("users.checkpoint")
+
+        with self.assertRaises(BulkError):
+            import_table("users", self.path("users.jsonl"), batch_size=2, checkpoint=checkpoint)
+
+        self.assertEqual(User.query.count(), 4)
+
+        with open(self.path("users.jsonl")) as file:
+            lines = file.readlines()[:-1]
+
+        with open(self.path("users.jsonl"), "w") as file:
+            file.writelines(lines)
+
+        self.assertEqual(import_table("users", self.path("users.jsonl"), batch_size=2, checkpoint=checkpoint), 1)
+        self.assertEqual([user.json() for user in User.query.order_by(User.id)], self.rows["users"])
+
+    def test_insert_error(self):
+        export_table("likes", self.path("likes.jsonl"), batch_size=100)
+
+        for like in Like.query.order_by(Like.id).limit(3):
+            db.session.delete(like)
+
+        db.session.commit()
+
+        # the first batch is inserted again, the second one repeats ids of existing likes
+        with self.assertRaisesRegex(BulkError, r"records 4-5 of .*likes.jsonl"):
+            import_table("likes", self.path("likes.jsonl"), batch_size=3, checkpoint=self.path("likes.checkpoint"))
+
+        self.assertEqual(Like.query.count(), 5)
+
+        with open(self.path("likes.checkpoint")) as file:
+            self.assertEqual(json.load(file)["imported"], 3)
+
+    def test_api_json(self):
+        with open(self.path("posts.jsonl"), "w") as file:
+            for post in self.rows["posts"]:
+                file.write(json.dumps({**post, "id": None, "uuid": None}) + "\n")
+
+        self.assertEqual(import_table("posts", self.path("posts.jsonl"), batch_size=10), len(self.rows["posts"]))
+
+        imported = [post.json() for post in Post.query.order_by(Post.id)][len(self.rows["posts"]):]
+
+        self.assertEqual([(post["text"], post["date"], post["time"]) for post in imported],
+                         [(post["text"], post["date"], post["time"]) for post in self.rows["posts"]])
+        self.assertEqual(len({post["uuid"] for post in imported}), len(imported))
+
+    def test_records_with_different_fields(self):
+        author_id = self.rows["users"][0]["id"]
+
+        with open(self.path("posts.jsonl"), "w") as file:
+            file.write(json.dumps({"author_id": author_id, "text": "old", "created_at": "2020-01-02 03:04:05"}) + "\n")
+            file.write(json.dumps({"author_id": author_id, "text": "new"}) + "\n")
+            file.write(json.dumps({"text": "anonymous", "uuid": "imported"}) + "\n")
+
+        self.assertEqual(import_table("posts", self.path("posts.jsonl"), batch_size=10), 3)
+
+        old, new, anonymous = Post.query.order_by(Post.id)[len(self.rows["posts"]):]
+
+        self.assertEqual(str(old.created_at), "2020-01-02 03:04:05")
+        self.assertEqual(new.author_id, author_id)
+        self.assertGreater(new.created_at, old.created_at)
+        self.assertEqual((anonymous.author_id, anonymous.uuid), (None, "imported"))
+
+    def test_empty_csv_fields(self):
+        user_id = self.rows["users"][0]["id"]
+
+        with open(self.path("activities.csv"), "w") as file:
+            file.write(f"user_id,post_id,action,created_at\n{user_id},,,\n")
+
+        self.assertEqual(import_table("activities", self.path("activities.csv"), batch_size=10), 1)
+
+        activity = ActivityLog.query.one()
+
+        self.assertEqual((activity.user_id, activity.post_id, activity.action), (user_id, None, None))
+        self.assertIsNotNone(activity.created_at)
+
+    def test_unknown_format(self):
+        with self.assertRaises(BulkError):
+            export_table("users", self.path("users.xml"), batch_size=10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+import gzip
+import json
+import zlib
+
+from src.api import app, db
+from src.cache import response_cache
+from src.models import User
+from tests.base import DatabaseTestCase
+
+
+class CompressionTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+
+        app.config["COMPRESSION_MIN_SIZE"] = 100
+        app.config["RESPONSE_CACHE"] = "local"
+        response_cache.reset()
+
+        db.session.add_all([
+            User(name="name", surname="surname", password="password", username=f"user{i}") for i in range(20)
+        ])
+        db.session.commit()
+
+        self.users = self.app.get("/api/users").json
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def get(self, url, accept_encoding, **headers):
+        return self.app.get(url, headers={"Accept-Encoding": accept_encoding, **headers})
+
+    def test_gzip(self):
+        r = self.get("/api/users", "gzip, deflate")
+
+        self.assertEqual(r.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", r.headers["Vary"])
+        self.assertEqual(int(r.headers["Content-Length"]), len(r.data))
+        self.assertEqual(json.loads(gzip.decompress(r.data)), self.users)
+
+    def test_deflate(self):
+        r = self.get("/api/users", "gzip;q=0.5, deflate")
+
+        self.assertEqual(r.headers["Content-Encoding"], "deflate")
+        self.assertEqual(json.loads(zlib.decompress(r.data)), self.users)
+
+    def test_not_accepted_or_small(self):
+        r = self.get("/api/users", "gzip;q=0, br")
+
+        self.assertNotIn("Content-Encoding", r.headers)
+        self.assertEqual(r.json, self.users)
+
+        r = self.get("/api/users?limit=1", "gzip")
+
+        self.assertNotIn("Content-Encoding", r.headers)
+        self.assertIn("Accept-Encoding", r.headers["Vary"])
+
+        app.config["COMPRESSION_ENABLED"] = False
+
+        self.assertNotIn("Content-Encoding", self.get("/api/users", "gzip").headers)
+
+    def test_stream(self):
+        r = self.get("/api/users?stream=ndjson", "gzip")
+
+        self.assertEqual(r.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", r.headers)
+        self.assertEqual([json.loads(line) for line in gzip.decompress(r.data).splitlines()], self.users)
+
+    def test_etag(self):
+        plain = self.get("/api/users", "identity").headers["ETag"]
+        compressed = self.get("/api/users", "gzip").headers["ETag"]
+
+        self.assertEqual(compressed, plain[:-1] + '-gzip"')
+
+        r = self.get("/api/users", "gzip", **{"If-None-Match": compressed})
+
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.headers["ETag"], compressed)
+
+        self.assertEqual(self.get("/api/users", "identity", **{"If-None-Match": plain}).status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
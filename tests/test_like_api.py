@@ -0,0 +1,171 @@
+import datetime
+import json
+
+from src.api import app, db
+from src.models import Post, Like, PostLikeDaily
+from src.likes import rebuild_like_rollup, toggle_like
+from tests.base import DatabaseTestCase
+
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+
+class LikesApiTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+
+        self.create_users_and_posts(users=2, posts=1)
+        self.post_id, self.post_uuid = self.post_ids[0], self.post_uuids[0]
+
+    def like(self, token, post_uuid=None):
+        return self.app.post(
+            "/api/like",
+            content_type="application/json",
+            data=json.dumps({"uuid": post_uuid or self.post_uuid}),
+            headers={"X-Api-Key": token}
+        )
+
+    def like_statistics(self):
+        return self.app.get(
+            "/api/analytics/likes",
+            content_type="application/json",
+            data=json.dumps({"uuid": self.post_uuid})
+        )
+
+    def test_like_and_unlike(self):
+        today = str(datetime.date.today())
+
+        r = self.like(self.tokens[0])
+
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json["post_id"], self.post_id)
+        self.assertEqual(r.json["like_count"], 1)
+
+        r = self.like(self.tokens[1])
+
+        self.assertEqual(r.json["like_count"], 2)
+        self.assertEqual(self.like_statistics().json, {today: 2})
+
+        r = self.like(self.tokens[0])
+
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.json, {"message": "post was successfully unliked", "like_count": 1})
+        self.assertEqual(self.like_statistics().json, {today: 1})
+
+        self.like(self.tokens[1])
+
+        self.assertEqual(self.like_statistics().json, {})
+
+    def test_like_is_unique(self):
+        db.session.add(Like(user_id=self.user_ids[0], post_id=self.post_id))
+        db.session.commit()
+
+        with app.app_context():
+            post_id, like, like_count = toggle_like(self.user_ids[0], self.post_uuid)
+
+            self.assertIsNone(like)
+
+            post_id, like, like_count = toggle_like(self.user_ids[0], self.post_uuid)
+
+            self.assertEqual(like["post_id"], self.post_id)
+
+        self.assertEqual(Like.query.filter(Like.post_id == self.post_id).count(), 1)
+
+        with self.assertRaises(IntegrityError):
+            db.session.add(Like(user_id=self.user_ids[0], post_id=self.post_id))
+            db.session.commit()
+
+        db.session.rollback()
+
+    def test_other_integrity_errors_are_raised(self):
+        def fail_insert(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("INSERT INTO") and "like" in statement.split()[2]:
+                raise IntegrityError(statement, parameters, Exception("FOREIGN KEY constraint failed"))
+
+        event.listen(db.engine, "before_cursor_execute", fail_insert)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", fail_insert)
+
+        with app.app_context(), self.assertRaises(IntegrityError):
+            toggle_like(self.user_ids[0], self.post_uuid)
+
+    def test_toggle_statements(self):
+        self.like(self.tokens[0])
+
+        statements = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split()[0])
+
+        event.listen(db.engine, "before_cursor_execute", count)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", count)
+
+        with app.app_context():
+            self.assertEqual(toggle_like(self.user_ids[1], self.post_uuid)[2], 2)
+            self.assertEqual(toggle_like(self.user_ids[0], self.post_uuid)[2], 1)
+
+        # the post, the like and the number of likes are read by one query; savepoints of the tests are not counted
+        self.assertEqual([statement for statement in statements if statement not in ("SAVEPOINT", "RELEASE")],
+                         ["SELECT", "INSERT", "UPDATE", "SELECT", "DELETE", "UPDATE"])
+
+    def test_like_batch(self):
+        other_post = Post(author_id=self.user_ids[1], text="Like me too")
+
+        db.session.add(other_post)
+        db.session.commit()
+
+        other_uuid = other_post.uuid
+
+        self.like(self.tokens[1])
+
+        r = self.app.post(
+            "/api/like/batch",
+            content_type="application/json",
+            data=json.dumps([{"uuid": self.post_uuid}, {"uuid": other_uuid}, {"uuid": other_uuid}, {"uuid": "nope"}]),
+            headers={"X-Api-Key": self.tokens[0]}
+        )
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([item["status"] for item in r.json], [201, 201, 201, 400])
+        self.assertEqual([item.get("liked") for item in r.json], [True, True, False, None])
+        self.assertEqual(r.json[0]["like_count"], 2)
+        self.assertEqual(r.json[1]["like_count"], 0)
+
+        self.assertEqual(Like.query.filter(Like.user_id == self.user_ids[0]).count(), 1)
+
+        r = self.app.post(
+            "/api/like/batch",
+            content_type="application/json",
+            data=json.dumps([{"uuid": self.post_uuid}]),
+            headers={"X-Api-Key": self.tokens[1]}
+        )
+
+        self.assertEqual(r.json, [{"uuid": self.post_uuid, "status": 201, "post_id": self.post_id,
+                                   "liked": False, "like_count": 1}])
+
+    def test_like_not_existing_post(self):
+        r = self.like(self.tokens[0], post_uuid="not existing uuid")
+
+        self.assertEqual(r.status_code, 400)
+
+    def test_rebuild_rollup(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+
+        for user_id in self.user_ids:
+            db.session.add(Like(user_id=user_id, post_id=self.post_id,
+                                created_at=datetime.datetime.combine(yesterday, datetime.time(12))))
+
+        db.session.commit()
+
+        self.assertEqual(self.like_statistics().json, {})
+
+        self.assertEqual(rebuild_like_rollup(), 1)
+        self.assertEqual(PostLikeDaily.query.get((self.post_id, yesterday)).count, 2)
+
+        r = self.app.get(
+            "/api/analytics/likes",
+            content_type="application/json",
+            data=json.dumps({"uuid": self.post_uuid, "start_date": str(yesterday)})
+        )
+
+        self.assertEqual(r.json, {str(yesterday): 2})
@@ -0,0 +1,205 @@
+import unittest
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+
+from sqlalchemy.exc import OperationalError
+
+from src.api import app, db
+from src.cache import response_cache
+from src.like_buffer import LikeBuffer, like_buffer
+from src.models import Like, PostLikeDaily
+from tests.base import DatabaseTestCase
+
+
+class LikeBufferTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+        self.journal_dir = tempfile.mkdtemp()
+
+        app.config.update({
+            "LIKE_BUFFER_ENABLED": True,
+            "LIKE_BUFFER_FLUSH_INTERVAL": 60,
+            "LIKE_BUFFER_DURABILITY": "fsync",
+            "LIKE_BUFFER_JOURNAL_DIR": self.journal_dir,
+            "RESPONSE_CACHE": None
+        })
+
+        self.create_users_and_posts(users=2, posts=1)
+        self.post_id, self.post_uuid = self.post_ids[0], self.post_uuids[0]
+
+    def tearDown(self):
+        like_buffer.stop()
+        shutil.rmtree(self.journal_dir)
+        app.config.clear()
+        app.config.update(self.config)
+
+    def like(self, user):
+        return self.app.post("/api/like", content_type="application/json", data=json.dumps({"uuid": self.post_uuid}),
+                             headers={"X-Api-Key": self.tokens[user]})
+
+    def test_toggles_are_written_on_flush(self):
+        self.assertEqual(self.like(0).json["like_count"], 1)
+        self.assertEqual(self.like(1).json["like_count"], 2)
+        self.assertEqual(self.like(1).json["like_count"], 1)
+
+        self.assertEqual(Like.query.count(), 0)
+
+        r = self.app.get("/api/posts", headers={"X-Api-Key": self.tokens[0]})
+
+        self.assertEqual((r.json[0]["like_count"], r.json[0]["liked_by_me"]), (1, True))
+
+        like_buffer.flush()
+
+        self.assertEqual([(like.user_id, like.post_id) for like in Like.query], [(self.user_ids[0], self.post_id)])
+        self.assertEqual(PostLikeDaily.query.one().count, 1)
+        self.assertEqual(self.like(0).json["like_count"], 0)
+
+        like_buffer.flush()
+
+        self.assertEqual(Like.query.count(), 0)
+        self.assertEqual(PostLikeDaily.query.one().count, 0)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_streamed_posts_include_pending_likes(self):
+        self.like(0)
+
+        r = self.app.get("/api/posts?stream=ndjson", headers={"X-Api-Key": self.tokens[0]})
+        post = json.loads(r.get_data(as_text=True).splitlines()[0])
+
+        self.assertEqual((post["like_count"], post["liked_by_me"]), (1, True))
+
+    def test_like_statistics_include_pending_likes(self):
+        self.like(0)
+        like_buffer.flush()
+        self.like(1)
+
+        def statistics():
+            return self.app.get("/api/analytics/likes", content_type="application/json",
+                                data=json.dumps({"uuid": self.post_uuid})).json
+
+        today = str(datetime.date.today())
+
+        self.assertEqual(statistics(), {today: 2})
+
+        self.like(0)
+        self.like(1)
+
+        self.assertEqual(statistics(), {})
+
+    def test_trending_includes_pending_likes(self):
+        self.like(0)
+        like_buffer.flush()
+        self.like(1)
+
+        self.assertEqual([post["like_count"] for post in self.app.get("/api/posts/trending").json], [2])
+
+    def test_flush_bumps_cached_likes(self):
+        app.config["RESPONSE_CACHE"] = "local"
+        response_cache.reset()
+
+        self.like(0)
+        versions = response_cache.backend.versions(("likes",))
+
+        like_buffer.flush()
+
+        self.assertNotEqual(response_cache.backend.versions(("likes",)), versions)
+
+    def test_readers_dont_wait_for_journal_writes(self):
+        counts = []
+
+        def slow_fsync(fd):
+            reader = threading.Thread(target=lambda: counts.append(like_buffer.adjust_counts({self.post_id: 0})))
+            reader.start()
+            reader.join(1)
+
+            self.assertFalse(reader.is_alive(), "reader waited for the journal")
+
+        with mock.patch.object(os, "fsync", side_effect=slow_fsync):
+            self.assertEqual(self.like(0).status_code, 201)
+
+        self.assertEqual(counts, [{self.post_id: 1}])
+
+    def test_toggles_during_failed_flush_are_kept(self):
+        self.like(0)
+
+        def unlike_and_fail(states):
+            self.assertEqual(self.like(0).json["like_count"], 0)
+            raise OperationalError("INSERT", {}, Exception("database is gone"))
+
+        with mock.patch.object(like_buffer, "_write", side_effect=unlike_and_fail), \
+                self.assertLogs(app.logger, level="ERROR"):
+            like_buffer.flush()
+
+        self.assertEqual(self.like(0).json["like_count"], 1)
+
+        like_buffer.flush()
+
+        self.assertEqual([like.user_id for like in Like.query], [self.user_ids[0]])
+        self.assertEqual(PostLikeDaily.query.one().count, 1)
+
+    def test_journal_is_replayed(self):
+        crashed = LikeBuffer()
+
+        with app.test_request_context():
+            crashed.toggle(self.user_ids[0], self.post_uuid)
+            crashed.toggle(self.user_ids[1], self.post_uuid)
+            crashed.toggle(self.user_ids[1], self.post_uuid)
+
+        self.assertEqual(Like.query.count(), 0)
+
+        self.assertEqual(LikeBuffer().recover(os.getpid()), 2)
+
+        self.assertEqual([(like.user_id, like.post_id) for like in Like.query], [(self.user_ids[0], self.post_id)])
+        self.assertEqual(PostLikeDaily.query.one().count, 1)
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+    def test_cancelled_toggles_are_not_replayed(self):
+        self.like(0)
+        self.like(0)
+
+        like_buffer.stop()
+
+        self.assertEqual(os.listdir(self.journal_dir), [])
+
+        self.like(0)
+        like_buffer.flush()
+
+        self.assertEqual(LikeBuffer().recover(), 0)
+        self.assertEqual(Like.query.count(), 1)
+
+    def write_journal(self, pid, *toggles):
+        with open(os.path.join(self.journal_dir, f"likes-{pid}.journal"), "w") as file:
+            for user, liked, moment in toggles:
+                file.write(json.dumps([self.user_ids[user], self.post_id, liked, str(moment)]) + "\n")
+
+    def test_latest_toggle_of_all_journals_wins(self):
+        now = datetime.datetime.now()
+
+        self.write_journal(1, (0, True, now), (1, True, now - datetime.timedelta(seconds=5)))
+        self.write_journal(2, (0, False, now - datetime.timedelta(seconds=10)), (1, False, now))
+
+        self.assertEqual(LikeBuffer().recover(), 2)
+        self.assertEqual([like.user_id for like in Like.query], [self.user_ids[0]])
+
+    def test_newer_like_in_database_is_kept(self):
+        now = datetime.datetime.now()
+
+        db.session.add(Like(user_id=self.user_ids[0], post_id=self.post_id, created_at=now))
+        db.session.commit()
+
+        self.write_journal(1, (0, False, now - datetime.timedelta(seconds=5)))
+
+        LikeBuffer().recover()
+
+        self.assertEqual(Like.query.count(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+from src.api import app
+from src.metrics import metrics
+from tests.base import DatabaseTestCase
+
+
+class MetricsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+
+        metrics.reset()
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def test_request_metrics(self):
+        app.config["RESPONSE_CACHE"] = None
+
+        self.app.get("/api/users")
+        self.app.get("/api/users")
+
+        r = self.app.get("/metrics")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.mimetype.startswith("text/plain"))
+
+        text = r.data.decode("utf-8")
+
+        self.assertIn('http_request_duration_seconds_count{endpoint="users",method="GET"} 2', text)
+        self.assertIn('http_requests_total{endpoint="users",method="GET",status="200"} 2', text)
+        self.assertIn('db_queries_total{endpoint="users",method="GET"}', text)
+
+    def test_slow_requests(self):
+        app.config["METRICS_SLOW_REQUEST_SECONDS"] = 0
+        app.config["RESPONSE_CACHE"] = None
+
+        with self.assertLogs(app.logger, level="WARNING"):
+            self.app.get("/api/posts")
+
+        app.config["METRICS_SLOW_REQUEST_SECONDS"] = self.config["METRICS_SLOW_REQUEST_SECONDS"]
+
+        slow = [request for request in self.app.get("/metrics/slow").json if request["endpoint"] == "posts"]
+
+        self.assertEqual(len(slow), 1)
+        self.assertTrue(any("FROM post" in statement for statement in slow[0]["statements"]))
@@ -1,14 +1,18 @@
-import unittest
 import jwt
 import json
+import datetime
 
+from sqlalchemy import event
 
 from src.api import app, db
-from src.models import User, Post, Like, clear_db
+from src.cache import response_cache
+from src.models import User, Post, Like
+from tests.base import DatabaseTestCase
 
 
-class PostsApiTestCase(unittest.TestCase):
+class PostsApiTestCase(DatabaseTestCase):
     def setUp(self):
+        super().setUp()
         self.app = app.test_client()
 
         user1 = User(name="name", surname="surname", password="password", username="user1")
@@ -29,17 +33,94 @@ class PostsApiTestCase(unittest.TestCase):
 
         db.session.commit()
 
-        self.posts_json = [post1.json(), post2.json(), post3.json(), post4.json()]
+        self.posts_json = [post.json(like_count=0) for post in (post1, post2, post3, post4)]
         self.users_json = [user1.json(), user2.json()]
 
-    def tearDown(self):
-        clear_db()
-
     def test_get(self):
         r = self.app.get("/api/posts")
 
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.json, self.posts_json)
+        self.assertNotIn("X-Next-Cursor", r.headers)
+
+    def test_get_paginated(self):
+        r = self.app.get("/api/posts?limit=3")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json, self.posts_json[:3])
+
+        cursor = r.headers["X-Next-Cursor"]
+
+        r = self.app.get(f"/api/posts?limit=3&cursor={cursor}")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json, self.posts_json[3:])
+        self.assertNotIn("X-Next-Cursor", r.headers)
+
+    def test_get_invalid_page(self):
+        self.assertEqual(self.app.get("/api/posts?limit=0").status_code, 400)
+        self.assertEqual(self.app.get("/api/posts?limit=many").status_code, 400)
+        self.assertEqual(self.app.get("/api/posts?cursor=notacursor").status_code, 400)
+
+    def test_get_fields(self):
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+
+        event.listen(db.engine, "before_cursor_execute", listener)
+
+        try:
+            r = self.app.get("/api/posts?fields=uuid,like_count&limit=3")
+        finally:
+            event.remove(db.engine, "before_cursor_execute", listener)
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json, [{"uuid": post["uuid"], "like_count": 0} for post in self.posts_json[:3]])
+        self.assertFalse(any("post.text" in statement for statement in statements))
+
+        r = self.app.get(f"/api/posts?fields=id,date&limit=3&cursor={r.headers['X-Next-Cursor']}")
+
+        self.assertEqual(r.json, [{"id": post["id"], "date": post["date"]} for post in self.posts_json[3:]])
+
+        r = self.app.get("/api/posts?fields=text&stream=ndjson")
+
+        self.assertEqual([json.loads(line) for line in r.data.decode("utf-8").splitlines()],
+                         [{"text": post["text"]} for post in self.posts_json])
+
+        self.assertEqual(self.app.get("/api/posts?fields=id,password").status_code, 400)
+
+    def test_get_time_without_microseconds(self):
+        uuid = self.posts_json[0]["uuid"]
+        post = Post.query.filter_by(uuid=uuid).first()
+        post.created_at = datetime.datetime(2020, 5, 8, 10, 20, 30, 123456)
+        db.session.commit()
+        response_cache.bump("posts")
+
+        times = {row["uuid"]: row["time"] for row in self.app.get("/api/posts").json}
+        self.assertEqual(times[uuid], "10:20:30")
+
+        times = {row["uuid"]: row["time"] for row in self.app.get("/api/posts?fields=uuid,time").json}
+        self.assertEqual(times[uuid], "10:20:30")
+
+    def test_get_stream(self):
+        r = self.app.get("/api/posts?stream=1")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertTrue(r.is_streamed)
+        self.assertEqual(r.json, self.posts_json)
+
+        r = self.app.get("/api/posts?stream=ndjson")
+
+        self.assertEqual(r.mimetype, "application/x-ndjson")
+        self.assertEqual([json.loads(line) for line in r.data.decode("utf-8").splitlines()], self.posts_json)
+
+        app.config["STREAM_BATCH_SIZE"], batch_size = 3, app.config["STREAM_BATCH_SIZE"]
+
+        try:
+            self.assertEqual(self.app.get("/api/posts?stream=1").json, self.posts_json)
+        finally:
+            app.config["STREAM_BATCH_SIZE"] = batch_size
+
+        self.assertEqual(self.app.get("/api/posts?stream=xml").status_code, 400)
 
     def test_post(self):
         for user in self.users_json:
@@ -120,3 +201,76 @@ class PostsApiTestCase(unittest.TestCase):
 
         self.assertEqual(r.status_code, 401)
 
+    def login(self, user):
+        login_data = {"username": user["username"], "password": user["password"]}
+
+        return self.app.get("/api/login", content_type="application/json", data=json.dumps(login_data)).json["token"]
+
+    def test_get_like_counts(self):
+        token = self.login(self.users_json[0])
+        liked_uuid = self.posts_json[1]["uuid"]
+
+        for user in self.users_json:
+            self.app.post("/api/like", content_type="application/json", data=json.dumps({"uuid": liked_uuid}),
+                          headers={"X-Api-Key": self.login(user)})
+
+        self.app.post("/api/like", content_type="application/json", data=json.dumps({"uuid": self.posts_json[2]["uuid"]}),
+                      headers={"X-Api-Key": self.login(self.users_json[1])})
+
+        for path in ("/api/posts", "/api/posts?limit=2", "/api/posts?stream=1"):
+            r = self.app.get(path)
+
+            self.assertEqual([post["like_count"] for post in r.json], [0, 2, 1, 0][:len(r.json)])
+            self.assertNotIn("liked_by_me", r.json[0])
+
+            r = self.app.get(path, headers={"X-Api-Key": token})
+
+            self.assertEqual([post["liked_by_me"] for post in r.json], [False, True, False, False][:len(r.json)])
+
+        self.assertEqual(self.app.get("/api/posts", headers={"X-Api-Key": "wrong"}).status_code, 401)
+
+    def test_post_batch(self):
+        token = self.login(self.users_json[0])
+
+        texts = [f"batch post {i}" for i in range(5)]
+
+        r = self.app.post(
+            "/api/posts/batch",
+            content_type="application/json",
+            data=json.dumps([{"text": text} for text in texts]),
+            headers={"X-Api-Key": token}
+        )
+
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual([post["text"] for post in r.json], texts)
+        self.assertEqual({post["author_id"] for post in r.json}, {self.users_json[0]["id"]})
+
+        self.assertEqual(self.app.get("/api/posts").json[-5:], [{**post, "like_count": 0} for post in r.json])
+
+    def test_post_batch_invalid(self):
+        token = self.login(self.users_json[0])
+
+        r = self.app.post(
+            "/api/posts/batch",
+            content_type="application/json",
+            data=json.dumps([{"text": "valid"}, {"text": ""}, {}]),
+            headers={"X-Api-Key": token}
+        )
+
+        self.assertEqual(r.status_code, 400)
+        self.assertEqual([item["index"] for item in r.json["items"]], [1, 2])
+        self.assertEqual(len(self.app.get("/api/posts").json), len(self.posts_json))
+
+        app.config["MAX_BATCH_SIZE"], max_batch_size = 2, app.config["MAX_BATCH_SIZE"]
+
+        try:
+            r = self.app.post(
+                "/api/posts/batch",
+                content_type="application/json",
+                data=json.dumps([{"text": "valid"}] * 3),
+                headers={"X-Api-Key": token}
+            )
+        finally:
+            app.config["MAX_BATCH_SIZE"] = max_batch_size
+
+        self.assertEqual(r.status_code, 400)
@@ -0,0 +1,94 @@
+import os
+import tempfile
+
+from src.api import app, db
+from src.cache import response_cache
+from src.models import User
+from src.routing import PRIMARY_COOKIE, replica_state
+from tests.base import DatabaseTestCase
+
+
+class ReadReplicaTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+
+        app.config["RESPONSE_CACHE"] = None
+        response_cache.reset()
+
+        db.session.add(User(name="name", surname="surname", password="password", username="primary_user"))
+        db.session.commit()
+
+        handle, self.replica_path = tempfile.mkstemp(suffix=".db")
+        os.close(handle)
+
+        self.use_replica(f"sqlite:///{self.replica_path}")
+
+        replica = db.get_engine(app, bind="replica")
+        db.Model.metadata.create_all(bind=replica)
+        replica.execute(User.__table__.insert(), {
+            "name": "name", "surname": "surname", "password": "password", "username": "replica_user"
+        })
+
+    def tearDown(self):
+        db.get_engine(app, bind="replica").dispose()
+        os.remove(self.replica_path)
+
+        app.config.update(self.config)
+        replica_state.down_until = 0
+        response_cache.reset()
+
+    def use_replica(self, uri):
+        app.config["SQLALCHEMY_BINDS"] = {"replica": uri}
+
+    def usernames(self):
+        return [user["username"] for user in self.app.get("/api/users").json]
+
+    def test_reads_from_replica(self):
+        self.assertEqual(self.usernames(), ["replica_user"])
+
+    def test_writes_go_to_primary(self):
+        r = self.app.post("/api/users", content_type="application/json", data="""{
+            "name": "name", "surname": "surname", "password": "password", "username": "new_user"
+        }""")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(User.query.filter(User.username == "new_user").count(), 1)
+        self.assertIn(PRIMARY_COOKIE, r.headers["Set-Cookie"])
+
+        # the writer reads its write from primary, other clients still read from replica
+        self.assertEqual(sorted(self.usernames()), ["new_user", "primary_user"])
+        self.assertEqual([user["username"] for user in app.test_client().get("/api/users").json], ["replica_user"])
+
+    def test_replica_reads_are_cached_briefly(self):
+        app.config["RESPONSE_CACHE"] = "local"
+        app.config["REPLICA_STICKY_SECONDS"] = 0
+        response_cache.reset()
+
+        self.assertEqual(self.usernames(), ["replica_user"])
+
+        replica = db.get_engine(app, bind="replica")
+        replica.execute(User.__table__.insert(), {
+            "name": "name", "surname": "surname", "password": "password", "username": "replicated_user"
+        })
+
+        self.assertEqual(self.usernames(), ["replica_user", "replicated_user"])
+
+    def test_writer_bypasses_cache(self):
+        app.config["RESPONSE_CACHE"] = "local"
+        response_cache.reset()
+
+        self.assertEqual(self.usernames(), ["replica_user"])
+
+        self.app.set_cookie("localhost", PRIMARY_COOKIE, "1")
+        self.assertEqual(self.usernames(), ["primary_user"])
+
+    def test_falls_back_to_primary(self):
+        self.use_replica("sqlite:////not/existing/directory/replica.db")
+
+        with self.assertLogs(app.logger, level="WARNING"):
+            self.assertEqual(self.usernames(), ["primary_user"])
+
+        # replica is not tried again until REPLICA_RETRY_SECONDS pass
+        self.assertEqual(self.usernames(), ["primary_user"])
@@ -0,0 +1,93 @@
+import json
+
+from src.api import app, db
+from src.cache import response_cache
+from src.models import User, Post
+from tests.base import DatabaseTestCase
+
+
+class ResponseCacheTestCase(DatabaseTestCase):
+    backend = "local"
+
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+
+        app.config["RESPONSE_CACHE"] = self.backend
+        response_cache.reset()
+
+        user = User(name="name", surname="surname", password="password", username="cache_user")
+
+        db.session.add(user)
+        db.session.commit()
+
+        db.session.add(Post(author_id=user.id, text="cached post"))
+        db.session.commit()
+
+        login_data = {"username": "cache_user", "password": "password"}
+
+        self.token = self.app.get(
+            "/api/login",
+            content_type="application/json",
+            data=json.dumps(login_data)
+        ).json["token"]
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def test_cached_until_write(self):
+        r = self.app.get("/api/posts")
+
+        self.assertEqual(len(r.json), 1)
+
+        # changes made bypassing the api are not seen until the namespace version is bumped
+        db.session.add(Post(author_id=r.json[0]["author_id"], text="not seen yet"))
+        db.session.commit()
+
+        self.assertEqual(len(self.app.get("/api/posts").json), 1)
+
+        self.app.post(
+            "/api/posts",
+            content_type="application/json",
+            data=json.dumps({"text": "new post"}),
+            headers={"X-Api-Key": self.token}
+        )
+
+        self.assertEqual(len(self.app.get("/api/posts").json), 3)
+
+    def test_arguments_are_part_of_key(self):
+        self.app.post(
+            "/api/posts",
+            content_type="application/json",
+            data=json.dumps({"text": "new post"}),
+            headers={"X-Api-Key": self.token}
+        )
+
+        self.assertEqual(len(self.app.get("/api/posts?limit=1").json), 1)
+        self.assertEqual(len(self.app.get("/api/posts?limit=2").json), 2)
+
+    def test_not_modified(self):
+        r = self.app.get("/api/posts")
+        etag = r.headers["ETag"]
+
+        r = self.app.get("/api/posts", headers={"If-None-Match": etag})
+
+        self.assertEqual(r.status_code, 304)
+        self.assertEqual(r.data, b"")
+
+        self.app.post(
+            "/api/posts",
+            content_type="application/json",
+            data=json.dumps({"text": "new post"}),
+            headers={"X-Api-Key": self.token}
+        )
+
+        r = self.app.get("/api/posts", headers={"If-None-Match": etag})
+
+        self.assertEqual(r.status_code, 200)
+        self.assertNotEqual(r.headers["ETag"], etag)
+
+
+class SharedResponseCacheTestCase(ResponseCacheTestCase):
+    backend = "shared"
@@ -0,0 +1,105 @@
+import unittest
+import datetime
+import json
+
+from src.api import app, db
+from src.cache import response_cache
+from src.models import User, Post
+from src.search import search_index
+from tests.base import DatabaseTestCase
+
+
+class PostSearchTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        search_index.reset()
+
+        user = User(name="name", surname="surname", password="password", username="author")
+
+        db.session.add(user)
+        db.session.commit()
+
+        texts = [
+            "Good morning, world",
+            "good good good news",
+            "Nothing to see here",
+            "Morning coffee is good",
+            "Йой, най буде добре"
+        ]
+
+        db.session.add_all([Post(author_id=user.id, text=text) for text in texts])
+        db.session.commit()
+
+        self.token = self.app.get("/api/login", content_type="application/json",
+                                  data=json.dumps({"username": "author", "password": "password"})).json["token"]
+
+    def search(self, query_string):
+        return self.app.get(f"/api/posts/search?{query_string}")
+
+    def test_ranked(self):
+        r = self.search("q=good")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([post["text"] for post in r.json],
+                         ["good good good news", "Good morning, world", "Morning coffee is good"])
+        self.assertEqual([post["score"] for post in r.json], sorted((post["score"] for post in r.json), reverse=True))
+        self.assertIn("X-Query-Time-Ms", r.headers)
+
+        self.assertEqual([post["text"] for post in self.search("q=%D0%B9%D0%BE%D0%B9").json], ["Йой, най буде добре"])
+        self.assertEqual(self.search("q=absent").json, [])
+
+    def test_query_time_is_not_cached(self):
+        self.assertIn("X-Query-Time-Ms", self.search("q=good").headers)
+        # the second response is taken from the cache, no search was run for it
+        self.assertNotIn("X-Query-Time-Ms", self.search("q=good").headers)
+
+    def test_paginated(self):
+        all_posts = self.search("q=good morning").json
+        pages = []
+        cursor = ""
+
+        while True:
+            r = self.search(f"q=good morning&limit=1&cursor={cursor}")
+            pages += r.json
+
+            if "X-Next-Cursor" not in r.headers:
+                break
+
+            cursor = r.headers["X-Next-Cursor"]
+
+        self.assertEqual(pages, all_posts)
+        self.assertEqual(len(all_posts), 3)
+
+    def test_new_posts_found(self):
+        self.assertEqual(self.search("q=tea").json, [])
+
+        r = self.app.post("/api/posts", content_type="application/json", data=json.dumps({"text": "green tea"}),
+                          headers={"X-Api-Key": self.token})
+
+        self.assertEqual([post["id"] for post in self.search("q=tea").json], [r.json["id"]])
+
+    def test_backdated_posts_found(self):
+        self.assertEqual(self.search("q=tea").json, [])
+
+        # e.g. an imported post, that keeps its original time and is not added to the index by this process
+        post = Post(author_id=User.query.first().id, text="old tea", created_at=datetime.datetime(2019, 1, 1))
+
+        db.session.add(post)
+        db.session.commit()
+        post_id = post.id
+        response_cache.bump("posts")
+
+        refresh_seconds = app.config["SEARCH_INDEX_REFRESH_SECONDS"]
+        app.config["SEARCH_INDEX_REFRESH_SECONDS"] = 0
+        self.addCleanup(app.config.update, {"SEARCH_INDEX_REFRESH_SECONDS": refresh_seconds})
+
+        self.assertEqual([found["id"] for found in self.search("q=tea").json], [post_id])
+
+    def test_invalid(self):
+        self.assertEqual(self.search("q=").status_code, 400)
+        self.assertEqual(self.search("q=good&cursor=abc").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
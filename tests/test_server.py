@@ -0,0 +1,127 @@
+import unittest
+import json
+import os
+import re
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import urllib.request
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+from src.api import app, db
+from src.authentication import issue_token
+from src.models import User, Post, Like, ActivityLog
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# runs the production server with the test configuration and the tests' secret key,
+# likes and activities are buffered until shutdown
+SERVER = """
+import sys
+from src.app import app
+
+app.config.update({
+    "SECRET_KEY": sys.argv[2],
+    "LIKE_BUFFER_ENABLED": True,
+    "LIKE_BUFFER_FLUSH_INTERVAL": 3600,
+    "LIKE_BUFFER_JOURNAL_DIR": sys.argv[1],
+    "ACTIVITY_LOG_ASYNC": True,
+    "ACTIVITY_LOG_FLUSH_INTERVAL": 3600,
+    "RESPONSE_CACHE": None
+})
+
+from src.__main__ import main
+
+main(["serve", "--bind", "127.0.0.1:0", "--workers", "2"])
+"""
+
+
+@unittest.skipUnless(hasattr(os, "fork"), "prefork server needs os.fork")
+class PreforkServerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        # worker processes share a database file, not the in-memory database of the tests
+        uri = f"sqlite:///{os.path.join(self.directory, 'server.db')}"
+        self.engine = create_engine(uri)
+        self.addCleanup(self.engine.dispose)
+
+        db.Model.metadata.create_all(bind=self.engine)
+
+        session = Session(bind=self.engine)
+        user = User(name="name", surname="surname", password="password", username="liker")
+        session.add(user)
+        session.commit()
+
+        post = Post(author_id=user.id, text="post")
+        session.add(post)
+        session.commit()
+
+        self.post_uuid = post.uuid
+        self.token = issue_token(user)
+        session.close()
+
+        self.server = subprocess.Popen(
+            [sys.executable, "-c", SERVER, os.path.join(self.directory, "journal"), app.config["SECRET_KEY"]],
+            cwd=ROOT, env={**os.environ, "APP_CONFIG": "test", "TEST_DATABASE_URI": uri},
+            stderr=subprocess.PIPE, universal_newlines=True
+        )
+        self.addCleanup(self.kill_server)
+
+        self.port = self.wait_listening()
+
+    def kill_server(self):
+        if self.server.poll() is None:
+            self.server.kill()
+            self.server.communicate()
+
+    def wait_listening(self):
+        for line in self.server.stderr:
+            match = re.search(r"listening on 127\.0\.0\.1:(\d+)", line)
+
+            if match:
+                return int(match.group(1))
+
+        self.fail("server exited before listening")
+
+    def like(self):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{self.port}/api/like", data=json.dumps({"uuid": self.post_uuid}).encode(),
+            headers={"Content-Type": "application/json", "X-Api-Key": self.token}
+        )
+
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read())
+
+    def like_count(self):
+        return self.engine.execute(select([func.count()]).select_from(Like.__table__)).scalar()
+
+    def test_graceful_shutdown_flushes_buffers(self):
+        status, like = self.like()
+
+        self.assertEqual(status, 201)
+        self.assertEqual(like["like_count"], 1)
+
+        # nothing is written before the flush interval or shutdown
+        self.assertEqual(self.like_count(), 0)
+
+        self.server.send_signal(signal.SIGTERM)
+        _, errors = self.server.communicate(timeout=30)
+
+        self.assertEqual(self.server.returncode, 0, errors)
+        self.assertNotIn("worker failed", errors)
+
+        self.assertEqual(self.like_count(), 1)
+        self.assertEqual(
+            [row["action"] for row in self.engine.execute(ActivityLog.__table__.select())], ["liked post"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import unittest
+import datetime
+import json
+import threading
+import time
+
+from src.api import app, db
+from src.metrics import metrics
+from src.models import User, Post, Like, PostLikeDaily
+from src.singleflight import SingleFlight
+from tests.base import DatabaseTestCase
+
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_concurrent_calls_share_result(self):
+        single_flight = SingleFlight()
+        release = threading.Event()
+        calls = []
+        outcomes = []
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return {"count": len(calls)}
+
+        def request():
+            outcomes.append(single_flight.do("key", compute))
+
+        threads = [threading.Thread(target=request) for _ in range(5)]
+
+        for thread in threads:
+            thread.start()
+
+        time.sleep(0.2)
+        release.set()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([result for result, _ in outcomes], [{"count": 1}] * 5)
+        self.assertEqual(sorted(shared or "" for _, shared in outcomes), [""] + ["coalesced"] * 4)
+
+        # without reuse window the next call computes again
+        self.assertEqual(single_flight.do("key", compute), ({"count": 2}, None))
+
+    def test_errors_are_not_reused(self):
+        single_flight = SingleFlight()
+
+        def fail():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            single_flight.do("key", fail, reuse_seconds=60)
+
+        self.assertEqual(single_flight.do("key", lambda: 1, reuse_seconds=60), (1, None))
+        self.assertEqual(single_flight.do("key", lambda: 2, reuse_seconds=60), (1, "reused"))
+        self.assertEqual(single_flight.do("other key", lambda: 3, reuse_seconds=60), (3, None))
+
+
+class CoalescedStatisticsTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+
+        app.config["RESPONSE_CACHE"] = None
+        app.config["SINGLE_FLIGHT_REUSE_SECONDS"] = 60
+        metrics.reset()
+
+        user = User(name="name", surname="surname", password="password", username="author")
+
+        db.session.add(user)
+        db.session.commit()
+
+        post = Post(author_id=user.id, text="popular post")
+
+        db.session.add(post)
+        db.session.commit()
+
+        self.user_id, self.post_id, self.post_uuid = user.id, post.id, post.uuid
+
+    def tearDown(self):
+        app.config.update(self.config)
+
+    def like_statistics(self):
+        return self.app.get("/api/analytics/likes", content_type="application/json",
+                            data=json.dumps({"uuid": self.post_uuid}))
+
+    def test_result_reused(self):
+        self.assertEqual(self.like_statistics().json, {})
+
+        db.session.add(Like(user_id=self.user_id, post_id=self.post_id))
+        db.session.add(PostLikeDaily(post_id=self.post_id, date=datetime.date.today(), count=1))
+        db.session.commit()
+
+        self.assertEqual(self.like_statistics().json, {})
+        self.assertIn('singleflight_reused_total{endpoint="likestatistics"} 1', metrics.render())
+
+        app.config["SINGLE_FLIGHT_ENABLED"] = False
+
+        self.assertEqual(self.like_statistics().json, {str(datetime.date.today()): 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import datetime
+import json
+
+from sqlalchemy import event
+
+from src.api import app, db
+from src.models import Like
+from src.trending import TrendingPosts, trending_posts
+from tests.base import DatabaseTestCase
+
+
+class TrendingApiTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+        self.config = dict(app.config)
+        app.config["RESPONSE_CACHE"] = None
+        trending_posts.reset()
+
+        self.create_users_and_posts(users=3, posts=3)
+
+    def tearDown(self):
+        app.config.clear()
+        app.config.update(self.config)
+
+    def like(self, user, post):
+        self.app.post("/api/like", content_type="application/json", data=json.dumps({"uuid": self.post_uuids[post]}),
+                      headers={"X-Api-Key": self.tokens[user]})
+
+    def trending(self, query_string=""):
+        return self.app.get(f"/api/posts/trending{query_string}")
+
+    def test_likes_are_counted(self):
+        self.assertEqual(self.trending().json, [])
+
+        for user in range(3):
+            self.like(user, 2)
+
+        self.like(0, 0)
+
+        r = self.trending()
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual([(post["id"], post["like_count"]) for post in r.json], [(self.post_ids[2], 3), (self.post_ids[0], 1)])
+        self.assertAlmostEqual(r.json[0]["trending_score"], 3, places=2)
+
+        self.like(1, 0)
+        self.like(2, 0)
+        self.like(0, 2)
+        self.like(1, 2)
+
+        self.assertEqual([post["id"] for post in self.trending().json], [self.post_ids[0], self.post_ids[2]])
+        self.assertEqual([post["id"] for post in self.trending("?limit=1").json], [self.post_ids[0]])
+
+        self.app.post("/api/like/batch", content_type="application/json", headers={"X-Api-Key": self.tokens[0]},
+                      data=json.dumps([{"uuid": self.post_uuids[0]}, {"uuid": self.post_uuids[1]}]))
+
+        self.assertEqual([(post["id"], post["like_count"]) for post in self.trending().json],
+                         [(self.post_ids[0], 2), (self.post_ids[1], 1), (self.post_ids[2], 1)])
+
+    def test_rebuild_with_decay(self):
+        now = datetime.datetime.now()
+        half_life = datetime.timedelta(seconds=app.config["TRENDING_HALF_LIFE_SECONDS"])
+        window = datetime.timedelta(seconds=app.config["TRENDING_WINDOW_SECONDS"])
+
+        likes = [(0, 0, now), (1, 0, now), (0, 1, now - half_life), (1, 1, now - half_life),
+                 (2, 1, now - half_life), (0, 2, now - window - half_life)]
+
+        db.session.add_all([Like(user_id=self.user_ids[user], post_id=self.post_ids[post], created_at=created_at)
+                            for user, post, created_at in likes])
+        db.session.commit()
+
+        r = self.trending()
+
+        self.assertEqual([post["id"] for post in r.json], [self.post_ids[0], self.post_ids[1]])
+        self.assertAlmostEqual(r.json[0]["trending_score"], 2, delta=0.1)
+        self.assertAlmostEqual(r.json[1]["trending_score"], 1.5, delta=0.1)
+
+    def test_likes_recorded_during_rebuild_are_kept(self):
+        trending = TrendingPosts()
+        now = datetime.datetime.now()
+
+        db.session.add(Like(user_id=self.user_ids[0], post_id=self.post_ids[0], created_at=now))
+        db.session.commit()
+
+        recorded = []
+
+        def like_during_scan(conn, cursor, statement, parameters, context, executemany):
+            if not recorded and statement.startswith("SELECT") and "FROM \"like\"" in statement.replace("`", "\""):
+                recorded.append(self.post_ids[1])
+                trending.record(self.post_ids[1], 1, now)
+
+        event.listen(db.engine, "before_cursor_execute", like_during_scan)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", like_during_scan)
+
+        self.assertEqual([post_id for post_id, _ in trending.top(10)], [self.post_ids[0], self.post_ids[1]])
+
+    def test_short_half_life(self):
+        app.config.update({"TRENDING_HALF_LIFE_SECONDS": 60, "TRENDING_WINDOW_SECONDS": 24 * 3600})
+        now = datetime.datetime.now()
+
+        db.session.add_all([Like(user_id=self.user_ids[0], post_id=self.post_ids[0], created_at=now),
+                            Like(user_id=self.user_ids[0], post_id=self.post_ids[1], created_at=now - datetime.timedelta(hours=20))])
+        db.session.commit()
+
+        r = self.trending()
+
+        self.assertEqual([post["id"] for post in r.json], [self.post_ids[0]])
+        self.assertAlmostEqual(r.json[0]["trending_score"], 1, delta=0.1)
+
+    def test_changed_scores(self):
+        trending = TrendingPosts()
+        now = datetime.datetime.now()
+
+        self.assertEqual(trending.top(10), [])
+
+        for post_id in range(1, 101):
+            for _ in range(post_id % 10):
+                trending.record(post_id, 1, now)
+
+        for _ in range(5):
+            # the best post loses its likes and gets them back
+            for _ in range(9):
+                trending.record(99, -1, now)
+
+            self.assertNotIn(99, [post_id for post_id, _ in trending.top(20)])
+
+            for _ in range(9):
+                trending.record(99, 1, now)
+
+        self.assertEqual([post_id for post_id, _ in trending.top(3)], [9, 19, 29])
+        self.assertLessEqual(len(trending._heap), 2 * 90 + app.config["TRENDING_SIZE"])
+
+    def test_invalid_limit(self):
+        self.assertEqual(self.trending("?limit=0").status_code, 400)
+        self.assertEqual(self.trending(f"?limit={app.config['TRENDING_SIZE'] + 1}").status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
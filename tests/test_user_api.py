@@ -1,13 +1,18 @@
-import unittest
 import jwt
 import json
 
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+
 from src.api import app, db
-from src.models import User, Like, ActivityLog, Post, clear_db
+from src.authentication import InvalidToken, token_user
+from src.models import User, Like, ActivityLog, Post
+from tests.base import DatabaseTestCase
 
 
-class UsersApiTestCase(unittest.TestCase):
+class UsersApiTestCase(DatabaseTestCase):
     def setUp(self):
+        super().setUp()
         self.app = app.test_client()
 
         user1 = User(name="Name", surname="Surname", password="123", username="user")
@@ -24,15 +29,36 @@ class UsersApiTestCase(unittest.TestCase):
 
         self.users_json = [user1.json(), user2.json(), user3.json(), user4.json()]
 
-    def tearDown(self):
-        clear_db()
-
     def test_get(self):
         r = self.app.get("/api/users")
 
         self.assertEqual(r.status_code, 200)
         self.assertEqual(r.json, self.users_json)
 
+    def test_get_fields(self):
+        r = self.app.get("/api/users?fields=username,id")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.json, [{"username": user["username"], "id": user["id"]} for user in self.users_json])
+        self.assertEqual(self.app.get("/api/users?fields=username,like_count").status_code, 400)
+
+    def test_get_paginated(self):
+        users = []
+        cursor = ""
+
+        while True:
+            r = self.app.get(f"/api/users?limit=1&cursor={cursor}")
+
+            self.assertEqual(r.status_code, 200)
+            users += r.json
+
+            cursor = r.headers.get("X-Next-Cursor")
+
+            if not cursor:
+                break
+
+        self.assertEqual(users, self.users_json)
+
     def test_post(self):
         name = "Tom"
         surname = "Tompson"
@@ -128,8 +154,9 @@ class UsersApiTestCase(unittest.TestCase):
         )
 
 
-class LoginTestCase(unittest.TestCase):
+class LoginTestCase(DatabaseTestCase):
     def setUp(self):
+        super().setUp()
         self.app = app.test_client()
 
         user1 = User(name="Name", surname="Surname", password="123", username="user")
@@ -142,9 +169,6 @@ class LoginTestCase(unittest.TestCase):
 
         self.users_data = [(user1.username, user1.password), (user2.username, user2.password)]
 
-    def tearDown(self):
-        clear_db()
-
     def test_login(self):
         # login for first user
 
@@ -188,3 +212,74 @@ class LoginTestCase(unittest.TestCase):
         r = self.app.get("/api/login")
 
         self.assertEqual(r.status_code, 401)
+
+    def test_token_contains_user_id(self):
+        username, password = self.users_data[0]
+
+        data = {"username": username, "password": password}
+
+        token = self.app.get("/api/login", content_type="application/json", data=json.dumps(data)).json["token"]
+
+        user = User.query.filter(User.username == username).first()
+
+        self.assertEqual(jwt.decode(token, app.config["SECRET_KEY"]).get("user_id"), user.id)
+
+
+class TokenCacheTestCase(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app = app.test_client()
+
+        user = User(name="Name", surname="Surname", password="123", username="cached_user")
+
+        db.session.add(user)
+        db.session.commit()
+
+        self.user_id = user.id
+
+        data = {"username": "cached_user", "password": "123"}
+
+        self.token = self.app.get("/api/login", content_type="application/json", data=json.dumps(data)).json["token"]
+
+        self.user_queries = []
+        event.listen(db.engine, "before_cursor_execute", self.count_user_queries)
+
+    def tearDown(self):
+        event.remove(db.engine, "before_cursor_execute", self.count_user_queries)
+
+    def count_user_queries(self, conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("SELECT") and "FROM user" in statement:
+            self.user_queries.append(statement)
+
+    def authenticated_request(self):
+        return self.app.post("/api/posts", headers={"X-Api-Key": self.token})
+
+    def test_database_error_is_not_invalid_token(self):
+        def fail(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith("SELECT") and "FROM user" in statement:
+                raise OperationalError(statement, parameters, Exception("database is unavailable"))
+
+        event.listen(db.engine, "before_cursor_execute", fail)
+        self.addCleanup(event.remove, db.engine, "before_cursor_execute", fail)
+
+        with self.assertRaises(OperationalError):
+            token_user(self.token)
+
+        with self.assertRaises(InvalidToken):
+            token_user(self.token + "x")
+
+    def test_cached_token_skips_user_lookup(self):
+        self.assertEqual(self.authenticated_request().json, {"error": "no post text provided"})
+        self.assertEqual(len(self.user_queries), 1)
+
+        self.assertEqual(self.authenticated_request().json, {"error": "no post text provided"})
+        self.assertEqual(len(self.user_queries), 1)
+
+    def test_changed_user_is_invalidated(self):
+        self.authenticated_request()
+
+        user = User.query.get(self.user_id)
+        user.username = "renamed_user"
+        db.session.commit()
+
+        self.assertEqual(self.authenticated_request().json, {"token required": "invalid user"})